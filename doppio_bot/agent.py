@@ -0,0 +1,151 @@
+"""
+Agente de langchain del chat. Este módulo carga langchain, OpenAI, langdetect y
+googletrans, así que api.py lo importa solo cuando llega el primer turno.
+"""
+from langchain.agents import AgentType, initialize_agent, tool
+from langchain.callbacks import get_openai_callback
+from langchain.llms import OpenAI
+from langchain.prompts import PromptTemplate
+from langchain.schema import SystemMessage
+from langdetect import DetectorFactory, detect
+from googletrans import Translator
+
+from doppio_bot.chat_context import start_turn
+from doppio_bot.chat_history import check_session_access, record_turn, rehydrate_history
+from doppio_bot.chat_memory import PipelinedConversationBufferMemory, PooledRedisChatMessageHistory
+from doppio_bot.chat_sessions import get_history_key_prefix, get_session_settings, touch_session
+from doppio_bot.db_routing import route_tool
+from doppio_bot.local_llm import LocalLLM
+from doppio_bot.local_model import get_local_model_path
+from doppio_bot.prefetch import cancel_prefetch, start_prefetch
+from doppio_bot.rate_limit import chat_turn_quota
+from doppio_bot.tools import TOOLS
+from doppio_bot.turn_control import TurnInterrupted, get_turn_timeout, guard_tool, start_turn_budget
+
+
+# Asegurar resultados consistentes en la detección de idioma
+DetectorFactory.seed = 0
+
+# Prompt personalizado con instrucción de idioma reforzada
+prompt_template = PromptTemplate(
+    input_variables=["chat_history", "input"],
+    template="""
+    Eres un asistente virtual que responde **exclusivamente en español**. 
+    No importa el idioma en el que te hablen, siempre debes responder en español.
+    Tu tarea es ayudar al usuario de manera clara y precisa, utilizando únicamente el idioma español.
+
+    Historial de la conversación:
+    {chat_history}
+
+    Human: {input}
+    AI:""",  # El modelo debe responder aquí en español
+    template_format="f-string",
+)
+
+_agent_tools = None
+
+
+def get_agent_tools():
+    """
+    Herramientas de langchain construidas una vez por proceso a partir del registro.
+    """
+    global _agent_tools
+    if _agent_tools is None:
+        # Cada herramienta revisa la cancelación y el plazo del turno y tiene su límite de SQL;
+        # las de solo lectura corren en la réplica (el límite de SQL se aplica a esa conexión)
+        _agent_tools = [tool(route_tool(guard_tool(func))) for func in TOOLS]
+    return _agent_tools
+
+
+def run_chat_turn(session_id: str, prompt_message: str, company: str, openai_model: str) -> str:
+    # Configuración del modelo LLM; ninguna llamada puede durar más que el turno.
+    # Con un modelo local configurado se usa ese, reutilizando el prompt ya evaluado de la sesión.
+    if get_local_model_path():
+        llm = LocalLLM(session_id=session_id)
+    else:
+        llm = OpenAI(model_name=openai_model, temperature=0, request_timeout=get_turn_timeout())
+
+    # Retomar la conversación guardada si su historial en Redis ya expiró
+    check_session_access(session_id)
+    rehydrate_history(session_id)
+
+    # Historial de conversación en Redis (cliente compartido del proceso), con prefijo del sitio y TTL
+    message_history = PooledRedisChatMessageHistory(
+        session_id=session_id,
+        key_prefix=get_history_key_prefix(),
+        ttl=get_session_settings().ttl,
+    )
+    touch_session(session_id)
+
+    # Memoria para la conversación; guarda pregunta y respuesta en un solo pipeline
+    memory = PipelinedConversationBufferMemory(memory_key="chat_history", chat_memory=message_history)
+
+    # Definir herramientas
+    tools = get_agent_tools()
+
+    # Mensaje de sistema para forzar el idioma
+    system_message = SystemMessage(content="Eres un asistente virtual que responde exclusivamente en español. No importa el idioma en el que te hablen, siempre debes responder en español.")
+
+    # Inicializar el agente conversacional
+    agent_chain = initialize_agent(
+        tools=tools,
+        llm=llm,
+        agent=AgentType.CONVERSATIONAL_REACT_DESCRIPTION,
+        verbose=True,
+        memory=memory,
+        handle_parsing_errors = True,
+        max_execution_time=get_turn_timeout(),
+        early_stopping_method="force",
+        system_message=system_message  # Agregar el mensaje de sistema
+    )
+
+    # Registrar el turno para que las herramientas puedan deduplicar reintentos,
+    # con su plazo total y sin cancelaciones pendientes de un turno anterior
+    start_turn_budget(start_turn(session_id, company))
+
+    # Anticipar en segundo plano las consultas que el mensaje probablemente necesitará
+    start_prefetch(prompt_message, tools)
+
+    # Ejecutar el agente con el mensaje del usuario, dentro de la cuota del usuario
+    # y de su empresa. El agente carga el historial desde la memoria (un solo LRANGE).
+    with chat_turn_quota(company=company) as record_tokens, get_openai_callback() as usage:
+        try:
+            response = agent_chain.run({"input": prompt_message})
+        except TurnInterrupted as e:
+            # Cancelado por el usuario o fuera de plazo: se responde sin esperar al agente
+            response = str(e)
+        finally:
+            record_tokens(usage.total_tokens)
+            cancel_prefetch()
+
+    # Validar que la respuesta esté en español
+    response = ensure_spanish(response)
+
+    # Guardar el turno para poder retomar la conversación más adelante
+    record_turn(session_id, prompt_message, response)
+    return response
+
+
+def ensure_spanish(response: str) -> str:
+    print(f"Respuesta original: {response}")  # Depuración
+    
+    # Si la respuesta no es un string, convertirla a string
+    if not isinstance(response, str):
+        response = str(response)
+    
+    try:
+        # Detectar el idioma de la respuesta
+        lang = detect(response)
+        print(f"Idioma detectado: {lang}")  # Depuración
+        
+        if lang != "es":
+            # Si no está en español, traducirla al español
+            translator = Translator()
+            translated = translator.translate(response, dest="es")
+            return translated.text
+        return response
+    except Exception as e:
+        print(f"Error en la detección de idioma: {e}")  # Depuración
+        # En caso de error en la detección, devolver un mensaje en español
+        return "Lo siento, hubo un error al procesar tu solicitud."
+
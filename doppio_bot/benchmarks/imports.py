@@ -0,0 +1,71 @@
+"""
+Mide el costo de importar los módulos del bot en un intérprete nuevo, con
+`python -X importtime`, para seguir el arranque de los workers de bench.
+
+    bench --site <sitio> execute doppio_bot.benchmarks.imports.run
+
+También funciona sin sitio desde el entorno de bench:
+
+    ../env/bin/python -m doppio_bot.benchmarks.imports
+"""
+import json
+import re
+import subprocess
+import sys
+
+
+# Lo que se importa al resolver un método de doppio_bot.api y lo que se carga en el primer turno
+MODULES = ("doppio_bot.api", "doppio_bot.tools", "doppio_bot.agent")
+TOP = 10
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+def measure(module: str, baseline=("frappe",)) -> dict:
+    """
+    Tiempo de importar `module` después de los módulos de `baseline`, que un
+    worker de Frappe ya tiene cargados.
+    """
+    code = "".join(f"import {name}; " for name in baseline) + f"import {module}"
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode:
+        return {"module": module, "error": result.stderr.strip().splitlines()[-1:]}
+
+    # Solo cuenta lo que se importó después de la línea base
+    lines = result.stderr.splitlines()
+    start = max(
+        (i for i, line in enumerate(lines) if IMPORTTIME_LINE.match(line) and IMPORTTIME_LINE.match(line).group(4) in baseline),
+        default=-1,
+    ) + 1
+
+    imported = []
+    for line in lines[start:]:
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            imported.append((name, int(self_us), int(cumulative_us), len(indent)))
+
+    top_level = [row for row in imported if row[3] == min((r[3] for r in imported), default=0)]
+    return {
+        "module": module,
+        "total_ms": round(sum(row[2] for row in top_level) / 1000, 1),
+        "modules_loaded": len(imported),
+        "slowest": [
+            {"module": name, "cumulative_ms": round(cumulative / 1000, 1)}
+            for name, _self, cumulative, _indent in sorted(imported, key=lambda row: -row[2])[:TOP]
+        ],
+    }
+
+
+def run():
+    result = [measure(module) for module in MODULES]
+    print(json.dumps(result, indent=2))
+    return result
+
+
+if __name__ == "__main__":
+    run()
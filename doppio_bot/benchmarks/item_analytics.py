@@ -0,0 +1,108 @@
+"""
+Compara las consultas por producto de get_item_stats contra la lectura de
+DoppioBot Item Analytics sobre un volumen sintético de líneas de factura.
+
+    bench --site <sitio> execute doppio_bot.benchmarks.item_analytics.run --kwargs "{'lines': 1000000}"
+
+Los datos sintéticos se insertan con la tabla de secuencias de MariaDB dentro de
+una transacción que se revierte al final, así que el sitio queda igual.
+"""
+import random
+import statistics
+import time
+
+import frappe
+
+from doppio_bot.companies import get_default_company
+from doppio_bot.item_analytics import (
+    compute_item_analytics,
+    get_item_analytics,
+    get_price_list_rates,
+    get_sales_summary,
+    get_top_customers,
+    save_item_analytics,
+)
+
+
+PREFIX = "BENCH"
+
+
+def run(lines=1_000_000, items=5000, customers=2000, lines_per_invoice=5, samples=50, company=None):
+    company = company or get_default_company()
+    try:
+        start = time.perf_counter()
+        seed(company, lines, items, customers, lines_per_invoice)
+        seed_seconds = time.perf_counter() - start
+
+        sample = [f"{PREFIX}-ITEM-{n}" for n in random.sample(range(1, items + 1), min(samples, items))]
+
+        live = [timed(lambda: live_item_stats(company, item_code)) for item_code in sample]
+
+        start = time.perf_counter()
+        save_item_analytics(compute_item_analytics(company), commit=False)
+        precompute_seconds = time.perf_counter() - start
+
+        read = [timed(lambda: get_item_analytics(company, item_code)) for item_code in sample]
+
+        result = {
+            "lines": lines,
+            "items": items,
+            "seed_seconds": round(seed_seconds, 2),
+            "precompute_seconds": round(precompute_seconds, 2),
+            "live_ms": summarize(live),
+            "precomputed_ms": summarize(read),
+            "speedup": round(statistics.mean(live) / max(statistics.mean(read), 1e-6), 1),
+        }
+        print(frappe.as_json(result))
+        return result
+    finally:
+        frappe.db.rollback()
+
+
+def live_item_stats(company, item_code):
+    # Las mismas tres consultas por producto que get_item_stats hacía en cada pregunta
+    get_price_list_rates([item_code])
+    get_sales_summary(company, [item_code])
+    get_top_customers(company, [item_code])
+
+
+def seed(company, lines, items, customers, lines_per_invoice):
+    invoices = max(1, lines // lines_per_invoice)
+
+    frappe.db.sql(f"""
+        INSERT INTO `tabSales Invoice` (name, company, customer, posting_date, docstatus, creation, modified)
+        SELECT
+            CONCAT('{PREFIX}-SINV-', seq),
+            %(company)s,
+            CONCAT('{PREFIX}-CUST-', 1 + (seq %% {int(customers)})),
+            DATE_SUB(CURDATE(), INTERVAL (seq %% 1095) DAY),
+            1, NOW(), NOW()
+        FROM seq_1_to_{int(invoices)}
+    """, {"company": company})
+
+    frappe.db.sql(f"""
+        INSERT INTO `tabSales Invoice Item`
+            (name, parent, parenttype, parentfield, idx, item_code, qty, docstatus, creation, modified)
+        SELECT
+            CONCAT('{PREFIX}-SII-', seq),
+            CONCAT('{PREFIX}-SINV-', 1 + ((seq - 1) DIV {int(lines_per_invoice)})),
+            'Sales Invoice', 'items', 1 + ((seq - 1) % {int(lines_per_invoice)}),
+            CONCAT('{PREFIX}-ITEM-', 1 + FLOOR(RAND(seq) * {int(items)})),
+            1 + (seq % 10), 1, NOW(), NOW()
+        FROM seq_1_to_{int(invoices * lines_per_invoice)}
+    """)
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return (time.perf_counter() - start) * 1000
+
+
+def summarize(timings):
+    timings = sorted(timings)
+    return {
+        "avg": round(statistics.mean(timings), 3),
+        "p50": round(timings[len(timings) // 2], 3),
+        "p95": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 3),
+    }
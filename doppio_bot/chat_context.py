@@ -0,0 +1,21 @@
+import frappe
+
+
+def start_turn(session_id: str, company=None) -> dict:
+    """
+    Registra el turno actual del chat en frappe.local para que las herramientas
+    del agente sepan a qué sesión, a qué turno y a qué empresa pertenecen.
+    """
+    frappe.local.doppiobot_turn = {
+        "session_id": session_id,
+        "turn_id": frappe.generate_hash(length=12),
+        "company": company,
+    }
+    return frappe.local.doppiobot_turn
+
+
+def get_current_turn() -> dict:
+    """
+    Turno en curso, o None si la herramienta se ejecuta fuera de un turno del chat.
+    """
+    return getattr(frappe.local, "doppiobot_turn", None)
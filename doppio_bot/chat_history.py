@@ -0,0 +1,133 @@
+import json
+
+import frappe
+from frappe.utils import cint, now_datetime
+
+from doppio_bot.chat_sessions import get_chat_redis, get_history_key, get_session_settings
+
+
+SESSION_DOCTYPE = "DoppioBot Chat Session"
+MESSAGE_DOCTYPE = "DoppioBot Chat Message"
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+TITLE_LENGTH = 80
+
+
+def get_session_owner(session_id: str):
+    return frappe.db.get_value(SESSION_DOCTYPE, session_id, "user")
+
+
+def check_session_access(session_id: str):
+    owner = get_session_owner(session_id)
+    if owner and owner != frappe.session.user:
+        frappe.throw("No tienes acceso a esta conversación.", frappe.PermissionError)
+    return owner
+
+
+def record_turn(session_id: str, prompt_message: str, response: str):
+    """
+    Guarda la pregunta y la respuesta del turno en la base de datos, para poder
+    retomar la conversación después de que expire el historial en Redis.
+    """
+    if not check_session_access(session_id):
+        frappe.get_doc({
+            "doctype": SESSION_DOCTYPE,
+            "session_id": session_id,
+            "user": frappe.session.user,
+            "title": prompt_message.strip()[:TITLE_LENGTH],
+        }).insert(ignore_permissions=True)
+
+    for role, content in (("human", prompt_message), ("ai", response)):
+        frappe.get_doc({
+            "doctype": MESSAGE_DOCTYPE,
+            "session": session_id,
+            "role": role,
+            "content": content,
+        }).insert(ignore_permissions=True)
+
+    frappe.db.sql(f"""
+        UPDATE `tab{SESSION_DOCTYPE}`
+        SET message_count = message_count + 2, last_activity = %(now)s, modified = %(now)s
+        WHERE name = %(session_id)s
+    """, {"session_id": session_id, "now": now_datetime()})
+    frappe.db.commit()
+
+
+def rehydrate_history(session_id: str):
+    """
+    Si el historial de Redis expiró pero la sesión existe en la base de datos,
+    vuelve a cargar los mensajes más recientes para que el agente tenga contexto.
+    """
+    chat_redis = get_chat_redis()
+    key = get_history_key(session_id)
+    if chat_redis.exists(key) or not get_session_owner(session_id):
+        return
+
+    settings = get_session_settings()
+    messages = frappe.get_all(
+        MESSAGE_DOCTYPE,
+        filters={"session": session_id},
+        fields=["role", "content"],
+        order_by="name desc",
+        limit=settings.keep_messages,
+    )
+    if not messages:
+        return
+
+    # Mismo formato que RedisChatMessageHistory: el mensaje más nuevo al inicio de la lista
+    pipe = chat_redis.pipeline()
+    pipe.rpush(key, *[
+        json.dumps({"type": message.role, "data": {"content": message.content, "additional_kwargs": {}}})
+        for message in messages
+    ])
+    pipe.expire(key, settings.ttl)
+    pipe.execute()
+
+
+@frappe.whitelist()
+def get_sessions(limit=20):
+    """
+    Conversaciones del usuario, de la más reciente a la más antigua.
+    """
+    return frappe.get_all(
+        SESSION_DOCTYPE,
+        filters={"user": frappe.session.user},
+        fields=["session_id", "title", "last_activity", "message_count"],
+        order_by="last_activity desc",
+        limit=min(cint(limit) or 20, MAX_PAGE_SIZE),
+        ignore_permissions=True,
+    )
+
+
+@frappe.whitelist()
+def get_messages(session_id: str, before=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    Una página de mensajes de la conversación, los más nuevos primero en la consulta
+    pero devueltos en orden cronológico. `cursor` se envía como `before` para pedir
+    la página anterior.
+    """
+    if not check_session_access(session_id):
+        return {"messages": [], "cursor": None, "has_more": False}
+
+    limit = min(cint(limit) or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+    filters = {"session": session_id}
+    if before:
+        filters["name"] = ("<", cint(before))
+
+    # Se pide un mensaje extra solo para saber si hay más páginas
+    messages = frappe.get_all(
+        MESSAGE_DOCTYPE,
+        filters=filters,
+        fields=["name as id", "role", "content"],
+        order_by="name desc",
+        limit=limit + 1,
+        ignore_permissions=True,
+    )
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+
+    return {
+        "messages": list(reversed(messages)),
+        "cursor": messages[-1].id if has_more else None,
+        "has_more": has_more,
+    }
@@ -0,0 +1,39 @@
+import json
+
+from langchain.memory import ConversationBufferMemory, RedisChatMessageHistory
+from langchain.schema import AIMessage, HumanMessage, _message_to_dict
+
+from doppio_bot.chat_sessions import get_chat_redis
+
+
+class PooledRedisChatMessageHistory(RedisChatMessageHistory):
+    """
+    RedisChatMessageHistory que usa el cliente compartido del proceso en lugar
+    de abrir una conexión nueva en cada turno.
+    """
+
+    def __init__(self, session_id: str, key_prefix: str, ttl=None):
+        self.redis_client = get_chat_redis()
+        self.session_id = session_id
+        self.key_prefix = key_prefix
+        self.ttl = ttl
+
+    def add_turn(self, human_message: str, ai_message: str):
+        """
+        Guarda la pregunta y la respuesta del turno en un solo viaje a Redis.
+        """
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.lpush(
+            self.key,
+            json.dumps(_message_to_dict(HumanMessage(content=human_message))),
+            json.dumps(_message_to_dict(AIMessage(content=ai_message))),
+        )
+        if self.ttl:
+            pipe.expire(self.key, self.ttl)
+        pipe.execute()
+
+
+class PipelinedConversationBufferMemory(ConversationBufferMemory):
+    def save_context(self, inputs, outputs):
+        input_str, output_str = self._get_input_output(inputs, outputs)
+        self.chat_memory.add_turn(input_str, output_str)
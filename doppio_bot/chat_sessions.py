@@ -0,0 +1,253 @@
+import json
+import time
+
+import frappe
+import redis
+from frappe.utils import cint, now
+
+
+# Registro de sesiones: un sorted set global y uno por usuario, con la última actividad como score
+SESSIONS_KEY = "doppiobot:chat_sessions"
+USER_SESSIONS_KEY = "doppiobot:chat_sessions:{user}"
+SESSION_OWNER_KEY = "doppiobot:chat_session_owner"
+
+# Prefijo de las listas de RedisChatMessageHistory. Antes no llevaba el prefijo del sitio.
+HISTORY_PREFIX = "message_store:"
+LAST_SWEEP_KEY = "doppiobot:chat_sessions:last_sweep"
+
+SCAN_COUNT = 500
+SUMMARY_MAX_QUESTIONS = 20
+SUMMARY_QUESTION_LENGTH = 120
+
+DEFAULT_MAX_CONNECTIONS = 50
+
+# Un pool por URL y por proceso; redis-py lo reinicia solo si el worker hace fork
+_clients = {}
+
+
+def get_chat_redis_url() -> str:
+    # `doppiobot_chat_redis` permite mover la memoria del chat fuera de redis_cache
+    return (
+        frappe.conf.get("doppiobot_chat_redis")
+        or frappe.conf.get("redis_cache")
+        or "redis://localhost:6379/0"
+    )
+
+
+def get_chat_redis() -> redis.Redis:
+    url = get_chat_redis_url()
+    client = _clients.get(url)
+    if client is None:
+        pool = redis.ConnectionPool.from_url(
+            url,
+            max_connections=frappe.conf.get("doppiobot_chat_redis_max_connections") or DEFAULT_MAX_CONNECTIONS,
+        )
+        client = _clients[url] = redis.Redis(connection_pool=pool)
+    return client
+
+
+def get_session_settings():
+    settings = frappe.get_cached_doc("DoppioBot Settings")
+    return frappe._dict(
+        ttl=cint(settings.session_ttl_hours or 168) * 60 * 60,
+        compact_idle=cint(settings.compact_idle_hours or 12) * 60 * 60,
+        keep_messages=cint(settings.compact_keep_messages or 10),
+    )
+
+
+def get_history_key_prefix() -> str:
+    # Con el prefijo del sitio, el barrido de un sitio no toca las sesiones de otro en el mismo bench.
+    # make_key devuelve bytes; langchain y el barrido concatenan el prefijo con str.
+    return frappe.safe_decode(frappe.cache().make_key(HISTORY_PREFIX))
+
+
+def get_history_key(session_id: str) -> str:
+    return get_history_key_prefix() + session_id
+
+
+def touch_session(session_id: str, user=None):
+    """
+    Registra la actividad de la sesión y renueva el TTL de su historial.
+    """
+    user = user or frappe.session.user
+    cache = frappe.cache()
+    last_activity = time.time()
+
+    pipe = cache.pipeline()
+    pipe.zadd(cache.make_key(SESSIONS_KEY), {session_id: last_activity})
+    pipe.zadd(cache.make_key(USER_SESSIONS_KEY.format(user=user)), {session_id: last_activity})
+    pipe.hsetnx(cache.make_key(SESSION_OWNER_KEY), session_id, user)
+    pipe.execute()
+
+    get_chat_redis().expire(get_history_key(session_id), get_session_settings().ttl)
+
+
+def get_user_sessions(user=None, limit=20):
+    """
+    Sesiones del usuario, de la más reciente a la más antigua: [(session_id, last_activity)]
+    """
+    cache = frappe.cache()
+    key = cache.make_key(USER_SESSIONS_KEY.format(user=user or frappe.session.user))
+    return [
+        (frappe.safe_decode(session_id), score)
+        for session_id, score in cache.zrevrange(key, 0, limit - 1, withscores=True)
+    ]
+
+
+def forget_sessions(session_ids):
+    """
+    Borra el historial y el registro de las sesiones indicadas.
+    Devuelve los bytes liberados según MEMORY USAGE.
+    """
+    if not session_ids:
+        return 0
+
+    cache = frappe.cache()
+    chat_redis = get_chat_redis()
+    owner_key = cache.make_key(SESSION_OWNER_KEY)
+    owners = cache.hmget(owner_key, session_ids)
+
+    bytes_reclaimed = delete_keys([get_history_key(session_id) for session_id in session_ids], chat_redis)
+
+    pipe = cache.pipeline()
+    for session_id, owner in zip(session_ids, owners):
+        if owner:
+            pipe.zrem(cache.make_key(USER_SESSIONS_KEY.format(user=frappe.safe_decode(owner))), session_id)
+    pipe.zrem(cache.make_key(SESSIONS_KEY), *session_ids)
+    pipe.hdel(owner_key, *session_ids)
+    pipe.execute()
+
+    return bytes_reclaimed
+
+
+def compact_session(session_id: str, keep_messages: int) -> int:
+    """
+    Reemplaza los mensajes antiguos de una sesión inactiva por un resumen con las
+    preguntas anteriores del usuario, conservando los `keep_messages` más recientes.
+    Devuelve los bytes liberados.
+    """
+    chat_redis = get_chat_redis()
+    key = get_history_key(session_id)
+
+    pipe = chat_redis.pipeline()
+    pipe.memory_usage(key)
+    pipe.lrange(key, 0, -1)
+    pipe.ttl(key)
+    size_before, raw_messages, ttl = pipe.execute()
+
+    # RedisChatMessageHistory hace LPUSH: el mensaje más nuevo está al inicio
+    if len(raw_messages) <= keep_messages + 1:
+        return 0
+
+    recent, older = raw_messages[:keep_messages], raw_messages[keep_messages:]
+    questions = []
+    for raw in reversed(older):
+        message = json.loads(raw)
+        if message.get("type") == "human":
+            questions.append(message["data"]["content"][:SUMMARY_QUESTION_LENGTH])
+        elif message.get("type") == "system":
+            # Un resumen previo se conserva al inicio del nuevo
+            questions.insert(0, message["data"]["content"][:SUMMARY_QUESTION_LENGTH * 4])
+
+    summary = "Resumen de la conversación anterior. El usuario preguntó:\n" + "\n".join(
+        f"- {question}" for question in questions[-SUMMARY_MAX_QUESTIONS:]
+    )
+    summary_message = json.dumps({"type": "system", "data": {"content": summary, "additional_kwargs": {}}})
+
+    pipe = chat_redis.pipeline(transaction=True)
+    pipe.delete(key)
+    pipe.rpush(key, *recent, summary_message)
+    if ttl and ttl > 0:
+        pipe.expire(key, ttl)
+    pipe.memory_usage(key)
+    size_after = pipe.execute()[-1]
+
+    return max(0, (size_before or 0) - (size_after or 0))
+
+
+def sweep_chat_sessions():
+    """
+    Tarea programada: elimina sesiones abandonadas, resume las inactivas y borra
+    historiales huérfanos (sin registro o del formato anterior sin prefijo de sitio).
+    """
+    settings = get_session_settings()
+    cache = frappe.cache()
+    sessions_key = cache.make_key(SESSIONS_KEY)
+    started = time.time()
+    report = frappe._dict(expired=0, compacted=0, orphaned=0, bytes_reclaimed=0)
+
+    # 1. Sesiones abandonadas
+    while True:
+        expired = [
+            frappe.safe_decode(session_id)
+            for session_id in cache.zrangebyscore(sessions_key, 0, started - settings.ttl, start=0, num=SCAN_COUNT)
+        ]
+        if not expired:
+            break
+        report.bytes_reclaimed += forget_sessions(expired)
+        report.expired += len(expired)
+
+    # 2. Sesiones inactivas que todavía no se han resumido
+    idle = cache.zrangebyscore(sessions_key, started - settings.ttl, started - settings.compact_idle)
+    for session_id in idle:
+        reclaimed = compact_session(frappe.safe_decode(session_id), settings.keep_messages)
+        if reclaimed:
+            report.compacted += 1
+            report.bytes_reclaimed += reclaimed
+
+    # 3. Historiales sin registro en este sitio
+    chat_redis = get_chat_redis()
+    prefix = get_history_key_prefix()
+    for batch in scan_in_batches(prefix + "*", chat_redis):
+        pipe = cache.pipeline()
+        for key in batch:
+            pipe.zscore(sessions_key, key[len(prefix):])
+        orphans = [key for key, score in zip(batch, pipe.execute()) if score is None]
+        report.bytes_reclaimed += delete_keys(orphans, chat_redis)
+        report.orphaned += len(orphans)
+
+    # 4. Historiales del formato anterior (sin prefijo de sitio, siempre en redis_cache) sin uso reciente
+    for batch in scan_in_batches(HISTORY_PREFIX + "*", cache):
+        pipe = cache.pipeline()
+        for key in batch:
+            pipe.object("idletime", key)
+        orphans = [key for key, idle_time in zip(batch, pipe.execute()) if (idle_time or 0) > settings.ttl]
+        report.bytes_reclaimed += delete_keys(orphans, cache)
+        report.orphaned += len(orphans)
+
+    report.finished_at = now()
+    cache.set_value(LAST_SWEEP_KEY, report)
+    frappe.logger("doppio_bot").info(f"Chat session sweep: {report}")
+    return report
+
+
+def scan_in_batches(pattern, client):
+    batch = []
+    for key in client.scan_iter(match=pattern, count=SCAN_COUNT):
+        batch.append(frappe.safe_decode(key))
+        if len(batch) >= SCAN_COUNT:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def delete_keys(keys, client):
+    """
+    Borra las llaves y devuelve los bytes que ocupaban según MEMORY USAGE.
+    """
+    if not keys:
+        return 0
+
+    pipe = client.pipeline()
+    for key in keys:
+        pipe.memory_usage(key)
+    pipe.delete(*keys)
+    *sizes, _deleted = pipe.execute()
+    return sum(size or 0 for size in sizes)
+
+
+@frappe.whitelist()
+def get_last_sweep_report():
+    frappe.only_for("System Manager")
+    return frappe.cache().get_value(LAST_SWEEP_KEY)
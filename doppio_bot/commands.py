@@ -0,0 +1,132 @@
+import click
+import frappe
+from frappe.commands import get_site, pass_context
+
+
+@click.command("doppiobot-explain-queries")
+@click.option("--company", help="Empresa con la que se ejecutan las herramientas")
+@click.option("--item", help="Código de producto de ejemplo")
+@click.option("--customer", help="Cliente de ejemplo")
+@click.option("--min-rows", type=int, default=1000, help="Filas estimadas a partir de las que se marca un recorrido completo")
+@click.option("--verbose", is_flag=True, help="Mostrar también el plan de las consultas sin problemas")
+@pass_context
+def explain_queries(context, company=None, item=None, customer=None, min_rows=1000, verbose=False):
+	"""EXPLAIN de las consultas que emiten las herramientas del bot, marcando recorridos completos."""
+	from doppio_bot.query_advisor import explain_tool_queries
+
+	frappe.init(site=get_site(context))
+	frappe.connect()
+	try:
+		report = explain_tool_queries(company=company, item=item, customer=customer, min_rows=min_rows)
+	finally:
+		frappe.destroy()
+
+	flagged = 0
+	for entry in report:
+		if not entry["full_scans"] and not verbose:
+			continue
+		flagged += bool(entry["full_scans"])
+		click.secho(f"[{entry['tool']}] {entry['query'][:300]}", fg="red" if entry["full_scans"] else None)
+		for scan in entry["full_scans"]:
+			click.echo(f"    full scan: {scan['table']} type={scan['type']} rows={scan['rows']} possible_keys={scan['possible_keys']}")
+		if verbose:
+			for step in entry["plan"]:
+				click.echo(f"    {step.table}: type={step.type} key={step.key} rows={step.rows}")
+
+	click.echo(f"{len(report)} consultas analizadas, {flagged} con recorridos completos.")
+	if flagged:
+		raise SystemExit(1)
+
+
+@click.command("doppiobot-warm-up")
+@click.option("--local-model", is_flag=True, help="Cargar también el modelo local configurado")
+@pass_context
+def warm_up(context, local_model=False):
+	"""Precarga el agente, los detectores y las cachés del bot e informa cuánto tarda cada paso."""
+	from doppio_bot.warmup import warm_up as run_warm_up
+
+	for site in context.sites:
+		frappe.init(site=site)
+		frappe.connect()
+		try:
+			report = run_warm_up(local_model=local_model)
+		finally:
+			frappe.destroy()
+
+		click.echo(f"{site}: {report['total_ms']} ms")
+		for step, duration in report["steps"].items():
+			error = report["errors"].get(step)
+			click.secho(f"    {step}: {duration} ms" + (f" (error: {error})" if error else ""), fg="red" if error else None)
+
+
+@click.command("doppiobot-build-help-index")
+@click.option("--rebuild", is_flag=True, help="Descartar el índice y calcular todos los embeddings de nuevo")
+@pass_context
+def build_help_index(context, rebuild=False):
+	"""Sincroniza el índice vectorial local de artículos de ayuda y descripciones de DocTypes."""
+	from doppio_bot.help_index import sync_help_index
+
+	for site in context.sites:
+		frappe.init(site=site)
+		frappe.connect()
+		try:
+			result = sync_help_index(rebuild=rebuild)
+		finally:
+			frappe.destroy()
+
+		click.echo(
+			f"{site}: {result['documents']} documentos, {result['rows']} fragmentos "
+			f"({result['changed']} actualizados, {result['removed']} eliminados)"
+		)
+
+
+
+@click.command("doppiobot-replica-stats")
+@click.option("--day", help="Fecha (YYYY-MM-DD); hoy si no se indica")
+@pass_context
+def replica_stats(context, day=None):
+	"""Ejecuciones de las herramientas del bot en la réplica y en la base principal."""
+	from doppio_bot.db_routing import ROUTES, get_routing_stats
+
+	for site in context.sites:
+		frappe.init(site=site)
+		frappe.connect()
+		try:
+			stats = get_routing_stats(day)
+		finally:
+			frappe.destroy()
+
+		totals = {route: sum(counts[route] for counts in stats.values()) for route in ROUTES}
+		click.echo(f"{site}: " + ", ".join(f"{route} {totals[route]}" for route in ROUTES))
+		for tool_name, counts in sorted(stats.items()):
+			click.echo(f"    {tool_name}: " + ", ".join(f"{route} {counts[route]}" for route in ROUTES))
+
+
+
+@click.command("doppiobot-prompt-cache-stats")
+@click.option("--day", help="Fecha (YYYY-MM-DD); hoy si no se indica")
+@pass_context
+def prompt_cache_stats(context, day=None):
+	"""Tasas de acierto del caché de prefijos de prompt del modelo local."""
+	from doppio_bot.local_model import get_prompt_cache_stats
+
+	for site in context.sites:
+		frappe.init(site=site)
+		frappe.connect()
+		try:
+			stats = get_prompt_cache_stats(day)
+		finally:
+			frappe.destroy()
+
+		click.echo(f"{site}: {stats.get('calls', 0)} llamadas al modelo local")
+		for label, field in (
+			("prefijo estático", "static_hit_rate"),
+			("historial de la sesión", "session_hit_rate"),
+			("tokens reutilizados", "token_reuse_rate"),
+		):
+			rate = stats[field]
+			click.echo(f"    {label}: " + ("sin datos" if rate is None else f"{rate:.1%}"))
+		click.echo(f"    {stats.get('reused_tokens', 0)} de {stats.get('prompt_tokens', 0)} tokens de prompt sin evaluar de nuevo")
+
+
+commands = [explain_queries, warm_up, build_help_index, replica_stats, prompt_cache_stats]
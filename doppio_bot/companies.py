@@ -0,0 +1,68 @@
+import frappe
+
+from doppio_bot.chat_context import get_current_turn
+from doppio_bot.data_access import get_permission_scope
+
+
+CONFIG_DOCTYPE = "Company Configuration"
+TAXES_TEMPLATE_KEY = "doppiobot:taxes_template:{doctype}:{company}"
+TAXES_TEMPLATE_TTL = 60 * 60
+
+
+def get_default_company(user=None):
+    return (
+        frappe.defaults.get_user_default("Company", user=user)
+        or frappe.db.get_single_value("Global Defaults", "default_company")
+    )
+
+
+def resolve_company(company=None, user=None) -> str:
+    """
+    Empresa del turno: la indicada por el cliente o la predeterminada del usuario.
+    Lanza PermissionError si el usuario tiene restringida esa empresa.
+    """
+    company = company or get_default_company(user)
+    if not company:
+        frappe.throw("No hay una empresa predeterminada para el usuario.")
+    if not frappe.db.exists("Company", company):
+        frappe.throw(f"La empresa {company} no existe.", frappe.DoesNotExistError)
+    if not get_permission_scope(user).allows("Company", company):
+        frappe.throw(f"No tienes permiso para consultar la empresa {company}.", frappe.PermissionError)
+    return company
+
+
+def get_current_company() -> str:
+    """
+    Empresa del turno en curso. Fuera de un turno (consola, jobs) se usa la
+    predeterminada del usuario.
+    """
+    turn = get_current_turn()
+    if turn and turn.get("company"):
+        return turn["company"]
+    return resolve_company()
+
+
+def get_company_config(company=None):
+    """
+    Company Configuration de la empresa, desde la caché de documentos.
+    El doctype se nombra por empresa, así que es una lectura por llave.
+    """
+    return frappe.get_cached_doc(CONFIG_DOCTYPE, company or get_current_company())
+
+
+def get_default_taxes_template(doctype: str, company=None) -> str:
+    """
+    Plantilla de impuestos predeterminada de la empresa (Sales o Purchase Taxes and Charges Template),
+    en caché por empresa.
+    """
+    company = company or get_current_company()
+    key = TAXES_TEMPLATE_KEY.format(doctype=doctype, company=company)
+    template = frappe.cache().get_value(key)
+    if template is None:
+        template = frappe.db.get_value(doctype, {"is_default": 1, "company": company}, "name") or ""
+        frappe.cache().set_value(key, template, expires_in_sec=TAXES_TEMPLATE_TTL)
+    return template
+
+
+def clear_taxes_template_cache(doc, method=None):
+    frappe.cache().delete_value(TAXES_TEMPLATE_KEY.format(doctype=doc.doctype, company=doc.company))
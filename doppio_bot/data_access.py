@@ -0,0 +1,148 @@
+import hashlib
+
+import frappe
+from frappe.permissions import get_user_permissions
+
+
+# Restricciones de permisos de usuario que se aplican a las consultas del bot
+RESTRICTED_DOCTYPES = ("Company", "Warehouse", "Territory")
+
+# Documentos que leen las herramientas de análisis; un permiso de usuario con
+# "Applicable For" distinto de estos no restringe al bot
+SOURCE_DOCTYPES = ("Sales Invoice", "Bin", "Item Price", "Customer")
+
+SCOPE_KEY = "doppiobot:permission_scope:{user}"
+SCOPE_KEY_PREFIX = "doppiobot:permission_scope:"
+SCOPE_TTL = 6 * 60 * 60
+
+
+class PermissionScope:
+    """
+    Condiciones de permisos de un usuario compiladas a fragmentos SQL.
+    Se compilan una vez y se guardan en caché, así que aplicarlas a una
+    consulta agregada no cuesta nada por consulta ni por fila.
+    """
+
+    def __init__(self, user: str, values: dict, fragments: dict, readable: dict):
+        self.user = user
+        # {"Company": ["A", "B"], ...} y {"Company": "IN ('A', 'B')", ...}; sin llave = sin restricción
+        self.values = values
+        self.fragments = fragments
+        self.readable = readable
+
+    @property
+    def restricted(self) -> bool:
+        return bool(self.fragments)
+
+    @property
+    def key(self) -> str:
+        """
+        Identifica el conjunto de restricciones, para separar las cachés de resultados.
+        """
+        if not self.fragments:
+            return "all"
+        raw = "|".join(f"{doctype}:{self.fragments[doctype]}" for doctype in sorted(self.fragments))
+        return hashlib.sha1(raw.encode()).hexdigest()[:16]
+
+    def sql(self, company=None, warehouse=None, territory=None) -> str:
+        """
+        Fragmento " AND ..." para las columnas indicadas, p. ej.
+        scope.sql(company="si.company", territory="si.territory").
+        """
+        columns = {"Company": company, "Warehouse": warehouse, "Territory": territory}
+        return "".join(
+            f" AND {column} {self.fragments[doctype]}"
+            for doctype, column in columns.items()
+            if column and doctype in self.fragments
+        )
+
+    def customer_sql(self, column: str) -> str:
+        """
+        Fragmento para filas ligadas opcionalmente a un cliente (p. ej. precios por
+        cliente): se permiten las que no tienen cliente o cuyo territorio está permitido.
+        """
+        if "Territory" not in self.fragments:
+            return ""
+        return (
+            f" AND (IFNULL({column}, '') = '' OR {column} IN "
+            f"(SELECT name FROM `tabCustomer` WHERE territory {self.fragments['Territory']}))"
+        )
+
+    def allows(self, doctype: str, value: str) -> bool:
+        return doctype not in self.values or value in self.values[doctype]
+
+    def check(self, doctype: str, company=None):
+        """
+        Lanza PermissionError si el usuario no puede leer el doctype o la empresa indicada.
+        """
+        if not self.readable.get(doctype):
+            frappe.throw(f"No tienes permiso para consultar {doctype}.", frappe.PermissionError)
+        if company and not self.allows("Company", company):
+            frappe.throw(f"No tienes permiso para consultar la empresa {company}.", frappe.PermissionError)
+
+    def as_dict(self):
+        return {"user": self.user, "values": self.values, "fragments": self.fragments, "readable": self.readable}
+
+
+def compile_permission_scope(user: str) -> PermissionScope:
+    user_permissions = get_user_permissions(user)
+    values, fragments = {}, {}
+    for doctype in RESTRICTED_DOCTYPES:
+        allowed = sorted({
+            permission.get("doc")
+            for permission in user_permissions.get(doctype, [])
+            if not permission.get("applicable_for") or permission.get("applicable_for") in SOURCE_DOCTYPES
+        })
+        if allowed:
+            values[doctype] = allowed
+            fragments[doctype] = "IN ({})".format(", ".join(frappe.db.escape(value) for value in allowed))
+
+    readable = {doctype: bool(frappe.has_permission(doctype, "read", user=user)) for doctype in SOURCE_DOCTYPES}
+    return PermissionScope(user, values, fragments, readable)
+
+
+def get_permission_scope(user=None) -> PermissionScope:
+    """
+    Permisos compilados del usuario: primero de la petición actual, luego de Redis.
+    """
+    user = user or frappe.session.user
+    if not hasattr(frappe.local, "doppiobot_permission_scopes"):
+        frappe.local.doppiobot_permission_scopes = {}
+    scopes = frappe.local.doppiobot_permission_scopes
+    if user in scopes:
+        return scopes[user]
+
+    key = SCOPE_KEY.format(user=user)
+    cached = frappe.cache().get_value(key)
+    if cached:
+        scope = PermissionScope(**cached)
+    else:
+        scope = compile_permission_scope(user)
+        frappe.cache().set_value(key, scope.as_dict(), expires_in_sec=SCOPE_TTL)
+
+    scopes[user] = scope
+    return scope
+
+
+def clear_permission_scope(user):
+    frappe.cache().delete_value(SCOPE_KEY.format(user=user))
+    getattr(frappe.local, "doppiobot_permission_scopes", {}).pop(user, None)
+
+
+def on_user_permission_change(doc, method=None):
+    clear_permission_scope(doc.user)
+
+
+def on_user_change(doc, method=None):
+    # Los roles del usuario deciden qué doctypes puede leer
+    clear_permission_scope(doc.name)
+
+
+def clear_all_permission_scopes():
+    frappe.cache().delete_keys(SCOPE_KEY_PREFIX)
+    frappe.local.doppiobot_permission_scopes = {}
+
+
+def on_role_permission_change(doc, method=None):
+    # Un Role o un Custom DocPerm cambia qué doctypes puede leer cualquier usuario
+    clear_all_permission_scopes()
@@ -0,0 +1,268 @@
+"""
+Ejecución de las herramientas de solo lectura en la réplica de la base de datos.
+
+Con `read_from_replica` y `replica_host` en site_config (los mismos que usa
+frappe.read_only), las herramientas de READ_ONLY_TOOLS corren con
+frappe.local.db apuntando a la réplica; las que crean o modifican documentos
+siguen en la principal. Si la réplica se atrasa más de
+`doppiobot_replica_max_lag` segundos, no responde o no se puede medir su
+atraso, la herramienta corre en la principal.
+
+Medir el atraso requiere que el usuario de la base tenga REPLICATION CLIENT
+(SLAVE MONITOR en MariaDB 10.5+) en la réplica.
+
+La conexión a la réplica se abre una vez por hilo y sitio y se reutiliza entre
+herramientas, turnos y trabajos de prefetch del mismo hilo.
+
+Cada ejecución se cuenta por día, herramienta y destino (ver get_routing_stats).
+"""
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+import frappe
+from frappe.utils import nowdate
+
+
+READ_ONLY_TOOLS = {
+    "get_info_customer",
+    "get_sales_stats",
+    "get_item_stats",
+    "get_inventory_rotation_report",
+}
+
+DEFAULT_MAX_LAG = 30
+# El atraso se mide una vez por intervalo y sitio, no en cada herramienta
+LAG_KEY = "doppiobot:replica_lag"
+LAG_CHECK_INTERVAL = 15
+
+# Una conexión sin usar por más tiempo se reabre, antes de que el servidor la cierre
+REPLICA_IDLE_TIMEOUT = 60 * 5
+
+STATS_KEY = "doppiobot:db_routing:{day}"
+STATS_TTL = 60 * 60 * 24 * 35
+# replica: corrió en la réplica; primary: va a la principal por diseño (escrituras
+# o réplica sin configurar); failover: de solo lectura, pero la réplica no estaba disponible
+ROUTES = ("replica", "primary", "failover")
+
+# {sitio: [conexión, último uso]} por hilo: una conexión no se comparte entre hilos
+_replicas = threading.local()
+
+
+def is_replica_configured() -> bool:
+    return bool(frappe.conf.get("read_from_replica") and frappe.conf.get("replica_host"))
+
+
+def get_max_lag() -> float:
+    return frappe.conf.get("doppiobot_replica_max_lag") or DEFAULT_MAX_LAG
+
+
+def connect_replica_db():
+    """
+    Conexión nueva a la réplica con las mismas credenciales que frappe.connect_replica.
+    """
+    from frappe.database import get_db
+
+    conf = frappe.conf
+    if conf.get("different_credentials_for_replica"):
+        user, password = conf.replica_db_name, conf.replica_db_password
+    else:
+        user, password = conf.get("db_user") or conf.db_name, conf.db_password
+    return get_db(host=conf.replica_host, user=user, password=password, port=conf.get("replica_db_port"))
+
+
+def measure_replica_lag(db):
+    """
+    Segundos de atraso de la réplica, o None si no es réplica, la replicación
+    está detenida o el usuario no puede consultar su estado.
+    """
+    try:
+        if frappe.conf.get("db_type") == "postgres":
+            lag = db.sql("SELECT EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())")[0][0]
+            return None if lag is None else max(float(lag), 0)
+        # Con varias fuentes de replicación manda la más atrasada
+        status = db.sql("SHOW SLAVE STATUS", as_dict=True)
+    except Exception as e:
+        frappe.logger("doppio_bot").warning(f"No se pudo medir el atraso de la réplica: {e}")
+        return None
+
+    lags = [row.get("Seconds_Behind_Master") for row in status]
+    if not lags or None in lags:
+        return None
+    return max(lags)
+
+
+def get_cached_lag():
+    # get_value/set_value ya agregan el prefijo del sitio a la llave
+    return frappe.cache().get_value(LAG_KEY)
+
+
+def get_replica_lag(db):
+    lag = get_cached_lag()
+    if lag is None:
+        lag = measure_replica_lag(db)
+        # -1: no se pudo medir; también se guarda para no reintentar en cada herramienta
+        frappe.cache().set_value(LAG_KEY, -1 if lag is None else lag, expires_in_sec=LAG_CHECK_INTERVAL)
+    return None if lag < 0 else lag
+
+
+def get_replica_connections() -> dict:
+    if not hasattr(_replicas, "connections"):
+        _replicas.connections = {}
+    return _replicas.connections
+
+
+def get_replica_db():
+    connections = get_replica_connections()
+    entry = connections.get(frappe.local.site)
+    if entry and time.monotonic() - entry[1] > REPLICA_IDLE_TIMEOUT:
+        discard_replica()
+        entry = None
+    if entry is None:
+        db = connect_replica_db()
+        db.connect()
+        entry = connections[frappe.local.site] = [db, time.monotonic()]
+    return entry[0]
+
+
+def release_replica(db):
+    """
+    Termina la transacción de lectura (para que la siguiente herramienta no lea
+    una instantánea vieja) y deja la conexión para el siguiente uso del hilo.
+    """
+    try:
+        # Directo en la conexión: Database.rollback ejecutaría los observadores de la principal
+        db._conn.rollback()
+        get_replica_connections()[frappe.local.site][1] = time.monotonic()
+    except Exception:
+        discard_replica()
+
+
+def discard_replica():
+    entry = get_replica_connections().pop(frappe.local.site, None)
+    if entry:
+        try:
+            entry[0].close()
+        except Exception:
+            pass
+
+
+def open_replica():
+    """
+    Conexión a la réplica si está al día, o None para usar la principal.
+    """
+    lag = get_cached_lag()
+    # Atraso conocido y excesivo: ni siquiera se toca la conexión
+    if lag is not None and (lag < 0 or lag > get_max_lag()):
+        return None
+
+    try:
+        db = get_replica_db()
+    except Exception as e:
+        frappe.logger("doppio_bot").warning(f"No se pudo conectar a la réplica: {e}")
+        discard_replica()
+        return None
+
+    lag = get_replica_lag(db)
+    if lag is None:
+        # Puede ser una conexión caída: la próxima medición usa una nueva
+        discard_replica()
+        return None
+    if lag > get_max_lag():
+        return None
+    return db
+
+
+@contextmanager
+def read_only_connection():
+    """
+    Dentro del bloque frappe.db es la réplica (si está disponible). Devuelve el
+    destino: "replica", "primary" o "failover".
+    """
+    if not is_replica_configured():
+        yield "primary"
+        return
+    if getattr(frappe.local, "doppiobot_primary_db", None) is not None:
+        # Ya en la réplica (herramienta anidada o resultado anticipado)
+        yield "replica"
+        return
+
+    replica = open_replica()
+    if replica is None:
+        yield "failover"
+        return
+
+    frappe.local.doppiobot_primary_db = frappe.local.db
+    frappe.local.db = replica
+    try:
+        yield "replica"
+    finally:
+        frappe.local.db = frappe.local.doppiobot_primary_db
+        frappe.local.doppiobot_primary_db = None
+        release_replica(replica)
+
+
+@contextmanager
+def primary_connection():
+    """
+    Vuelve a la base principal dentro de read_only_connection, para las pocas
+    escrituras de una herramienta de lectura (archivo exportado, Error Log).
+    """
+    primary = getattr(frappe.local, "doppiobot_primary_db", None)
+    if primary is None:
+        yield
+        return
+
+    replica = frappe.local.db
+    frappe.local.db = primary
+    try:
+        yield
+    finally:
+        frappe.local.db = replica
+
+
+def route_tool(func):
+    """
+    Envuelve una herramienta del agente: las de READ_ONLY_TOOLS corren en la
+    réplica y todas cuentan en qué base se ejecutaron.
+    """
+    if func.__name__ not in READ_ONLY_TOOLS:
+        @functools.wraps(func)
+        def on_primary(*args, **kwargs):
+            record_route(func.__name__, "primary")
+            return func(*args, **kwargs)
+
+        return on_primary
+
+    @functools.wraps(func)
+    def on_replica(*args, **kwargs):
+        with read_only_connection() as route:
+            record_route(func.__name__, route)
+            return func(*args, **kwargs)
+
+    return on_replica
+
+
+def record_route(tool_name: str, route: str):
+    cache = frappe.cache()
+    key = cache.make_key(STATS_KEY.format(day=nowdate()))
+    pipe = cache.pipeline()
+    pipe.hincrby(key, f"{tool_name}|{route}", 1)
+    pipe.expire(key, STATS_TTL)
+    pipe.execute()
+
+
+def get_routing_stats(day=None):
+    """
+    Ejecuciones de un día por herramienta: {tool: {"replica": n, "primary": n, "failover": n}}
+    """
+    cache = frappe.cache()
+    key = cache.make_key(STATS_KEY.format(day=day or nowdate()))
+
+    stats = {}
+    # hscan_iter lee el hash sin pasar por el pickle de RedisWrapper.hgetall
+    for field, value in cache.hscan_iter(key):
+        tool_name, route = frappe.safe_decode(field).rsplit("|", 1)
+        stats.setdefault(tool_name, dict.fromkeys(ROUTES, 0))[route] = int(value)
+    return stats
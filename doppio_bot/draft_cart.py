@@ -0,0 +1,207 @@
+"""
+Borrador de pedido por sesión del chat, guardado en Redis.
+
+Las herramientas de borrador modifican una línea o el cliente a la vez, así
+el agente no vuelve a escribir todo el JSON de la orden o factura en cada
+cambio. El precio de cada línea se resuelve una vez al agregarla (lista de
+precios del cliente o la de Selling Settings) y queda guardado en la línea.
+Al confirmar se arma el JSON de create_sales_order o create_sales_invoice.
+"""
+import frappe
+from frappe.utils import flt, nowdate
+
+from doppio_bot.chat_context import get_current_turn
+from doppio_bot.entity_index import resolve_entity
+
+
+DRAFT_KEY = "doppiobot:draft:{user}:{session_id}"
+DRAFT_TTL = 60 * 60 * 2
+
+# Campos de encabezado que se pasan tal cual a la orden o factura
+HEADER_FIELDS = (
+    "delivery_date",
+    "due_date",
+    "center_cost",
+    "fel_status",
+    "additional_notes",
+    "id_identificacion",
+    "id_receptor_",
+)
+
+
+class DraftError(frappe.ValidationError):
+    pass
+
+
+def get_draft_key() -> str:
+    session_id = (get_current_turn() or {}).get("session_id")
+    if not session_id:
+        raise DraftError("El borrador solo está disponible dentro de una conversación.")
+    # La llave incluye al usuario para que nadie más pueda leer ni confirmar su borrador
+    return DRAFT_KEY.format(user=frappe.session.user, session_id=session_id)
+
+
+def get_draft() -> dict:
+    return frappe.cache().get_value(get_draft_key()) or new_draft()
+
+
+def new_draft() -> dict:
+    return {"customer": None, "price_list": None, "fields": {}, "items": []}
+
+
+def save_draft(draft: dict):
+    # Cualquier cambio empieza un borrador nuevo después de una confirmación
+    draft.pop("committed", None)
+    frappe.cache().set_value(get_draft_key(), draft, expires_in_sec=DRAFT_TTL)
+
+
+def clear_draft():
+    frappe.cache().delete_value(get_draft_key())
+
+
+def mark_draft_committed(result: str):
+    # Se conserva el resultado para que una segunda confirmación no cree otro documento
+    frappe.cache().set_value(get_draft_key(), {**new_draft(), "committed": result}, expires_in_sec=DRAFT_TTL)
+
+
+def get_selling_price_list(customer=None):
+    price_list = customer and frappe.db.get_value("Customer", customer, "default_price_list")
+    return price_list or frappe.db.get_single_value("Selling Settings", "selling_price_list")
+
+
+def get_item_rate(item_code: str, price_list: str, customer=None):
+    """
+    Precio de venta vigente del producto en la lista; el precio específico del cliente tiene prioridad.
+    """
+    if not price_list:
+        return None
+    rates = frappe.db.sql("""
+        SELECT price_list_rate FROM `tabItem Price`
+        WHERE item_code = %(item_code)s AND price_list = %(price_list)s AND selling = 1
+            AND COALESCE(customer, '') IN ('', %(customer)s)
+            AND COALESCE(valid_from, '2000-01-01') <= %(today)s
+            AND COALESCE(valid_upto, '2999-12-31') >= %(today)s
+        ORDER BY COALESCE(customer, '') DESC, valid_from DESC
+        LIMIT 1
+    """, {"item_code": item_code, "price_list": price_list, "customer": customer or "", "today": nowdate()})
+    return flt(rates[0][0]) if rates else None
+
+
+def resolve_name(doctype: str, value: str) -> str:
+    name, suggestions = resolve_entity(doctype, value)
+    if name:
+        return name
+    message = f"{doctype} '{value}' no encontrado."
+    if suggestions:
+        message += f" ¿Quisiste decir: {', '.join(suggestions)}?"
+    raise DraftError(message)
+
+
+def set_customer(customer: str, fields=None) -> dict:
+    """
+    Fija el cliente y los campos de encabezado. Si cambia la lista de precios,
+    las líneas con precio de lista se vuelven a cotizar.
+    """
+    draft = get_draft()
+    draft["customer"] = resolve_name("Customer", customer)
+    draft["fields"].update({field: value for field, value in (fields or {}).items() if field in HEADER_FIELDS})
+
+    price_list = get_selling_price_list(draft["customer"])
+    if price_list != draft["price_list"]:
+        draft["price_list"] = price_list
+        for line in draft["items"]:
+            if line["rate_source"] == "price_list":
+                line["rate"] = get_item_rate(line["item_code"], price_list, draft["customer"]) or line["rate"]
+
+    save_draft(draft)
+    return draft
+
+
+def add_line(item_code: str, qty: float, rate=None) -> dict:
+    """
+    Agrega una línea, o suma la cantidad a la línea del mismo producto y precio.
+    """
+    qty = flt(qty)
+    if qty <= 0:
+        raise DraftError("La cantidad debe ser mayor que cero.")
+
+    draft = get_draft()
+    item_code = resolve_name("Item", item_code)
+
+    if rate is None:
+        if draft["price_list"] is None:
+            draft["price_list"] = get_selling_price_list(draft["customer"])
+        rate = get_item_rate(item_code, draft["price_list"], draft["customer"])
+        if rate is None:
+            raise DraftError(f"{item_code} no tiene precio en la lista {draft['price_list']}; indica el precio (rate).")
+        rate_source = "price_list"
+    else:
+        rate, rate_source = flt(rate), "user"
+
+    for line in draft["items"]:
+        if line["item_code"] == item_code and line["rate"] == rate:
+            line["qty"] += qty
+            break
+    else:
+        draft["items"].append({"item_code": item_code, "qty": qty, "rate": rate, "rate_source": rate_source})
+
+    save_draft(draft)
+    return draft
+
+
+def remove_line(line: str, qty=None) -> dict:
+    """
+    Quita una línea (número desde 1 o código de producto), o solo `qty` unidades de ella.
+    "all" vacía el borrador.
+    """
+    draft = get_draft()
+    line = str(line).strip()
+    if line.lower() == "all":
+        clear_draft()
+        return new_draft()
+
+    if line.isdigit():
+        index = int(line) - 1
+    else:
+        item_code = resolve_name("Item", line)
+        index = next((i for i, row in enumerate(draft["items"]) if row["item_code"] == item_code), -1)
+    if not 0 <= index < len(draft["items"]):
+        raise DraftError(f"El borrador no tiene la línea '{line}'.")
+
+    row = draft["items"][index]
+    if qty is not None and flt(qty) < row["qty"]:
+        row["qty"] -= flt(qty)
+    else:
+        draft["items"].pop(index)
+
+    save_draft(draft)
+    return draft
+
+
+def get_document_data(draft: dict) -> dict:
+    """
+    JSON de entrada de create_sales_order / create_sales_invoice a partir del borrador.
+    """
+    if not draft["customer"]:
+        raise DraftError("El borrador no tiene cliente.")
+    if not draft["items"]:
+        raise DraftError("El borrador no tiene líneas.")
+    return {
+        **draft["fields"],
+        "customer": draft["customer"],
+        "items": [{"item_code": line["item_code"], "qty": line["qty"], "rate": line["rate"]} for line in draft["items"]],
+    }
+
+
+def format_draft(draft: dict) -> str:
+    if not draft["customer"] and not draft["items"]:
+        return "Borrador vacío."
+
+    lines = [f"Borrador para {draft['customer'] or '(sin cliente)'}:"]
+    total = 0
+    for number, line in enumerate(draft["items"], 1):
+        amount = line["qty"] * line["rate"]
+        total += amount
+        lines.append(f" {number}. {line['item_code']}: {line['qty']:g} x {line['rate']:g} = {amount:g}")
+    lines.append(f"Total sin impuestos: {total:g}")
+    return "\n".join(lines)
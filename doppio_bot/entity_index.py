@@ -0,0 +1,287 @@
+"""
+Índice en memoria de productos, clientes y proveedores para resolver las
+referencias del LLM (nombres, códigos de barras, NIT) a los nombres reales antes
+de insertar documentos. Solo se reemplaza una referencia que coincide
+exactamente (ya normalizada) con una llave; las parecidas se devuelven como
+sugerencias para que el usuario las confirme.
+
+Cada proceso guarda un índice por sitio. Los cambios se publican en Redis desde
+doc_events y cada proceso los aplica en su siguiente consulta.
+"""
+import difflib
+import json
+import re
+import threading
+import time
+import unicodedata
+from array import array
+
+import frappe
+
+
+ENTITY_SOURCES = {
+    # doctype: consulta con (name, etiqueta, llaves adicionales separadas por \x1f)
+    "Item": """
+        SELECT item.name, item.item_name,
+            (SELECT GROUP_CONCAT(barcode.barcode SEPARATOR '\x1f') FROM `tabItem Barcode` barcode
+             WHERE barcode.parent = item.name AND barcode.parenttype = 'Item') AS extra_keys
+        FROM `tabItem` item
+        WHERE item.disabled = 0 AND item.name > %(after)s {condition}
+        ORDER BY item.name
+        LIMIT %(chunk)s
+    """,
+    "Customer": """
+        SELECT name, customer_name, tax_id AS extra_keys
+        FROM `tabCustomer`
+        WHERE disabled = 0 AND name > %(after)s {condition}
+        ORDER BY name
+        LIMIT %(chunk)s
+    """,
+    "Supplier": """
+        SELECT name, supplier_name, tax_id AS extra_keys
+        FROM `tabSupplier`
+        WHERE disabled = 0 AND name > %(after)s {condition}
+        ORDER BY name
+        LIMIT %(chunk)s
+    """,
+}
+
+# Columna del nombre en cada consulta, para cargar solo algunos registros
+NAME_COLUMNS = {"Item": "item.name"}
+
+CHUNK_SIZE = 20000
+CHANGES_KEY = "doppiobot:entity_index:changes"
+VERSION_KEY = "doppiobot:entity_index:version"
+MAX_CHANGES = 10000
+# Cada cuánto revisa un proceso si hay cambios publicados
+CHECK_INTERVAL = 2
+
+MIN_SCORE = 0.75
+# Si el mejor candidato supera al segundo por este margen, es la única sugerencia
+MIN_MARGIN = 0.05
+MAX_CANDIDATES = 200
+
+_lock = threading.RLock()
+# {sitio: {"indexes": {doctype: EntityIndex}, "version": int, "checked_at": float}}
+_sites = {}
+
+
+def normalize(value) -> str:
+    value = unicodedata.normalize("NFKD", str(value or "")).encode("ascii", "ignore").decode()
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", value.lower()).split())
+
+
+class EntityIndex:
+    """
+    Llaves normalizadas -> id, y token -> ids en arreglos de enteros. Los nombres y
+    etiquetas se guardan una sola vez por entidad.
+    """
+
+    def __init__(self, doctype: str):
+        self.doctype = doctype
+        self.names = []
+        self.labels = []
+        self.ids = {}
+        self.keys = {}
+        self.tokens = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, name: str, label: str, extra_keys=()):
+        self.remove(name)
+        entity_id = len(self.names)
+        self.names.append(name)
+        self.labels.append(normalize(label or name))
+        self.ids[name] = entity_id
+
+        for key in (name, label, *extra_keys):
+            key = normalize(key)
+            if not key:
+                continue
+            existing = self.keys.get(key)
+            if existing is None or existing == entity_id or (existing >= 0 and self.names[existing] is None):
+                self.keys[key] = entity_id
+            else:
+                # Una llave compartida por dos entidades no identifica a ninguna
+                self.keys[key] = -1
+        for token in set(f"{normalize(name)} {self.labels[entity_id]}".split()):
+            self.tokens.setdefault(token, array("I")).append(entity_id)
+
+    @property
+    def stale(self) -> int:
+        return len(self.names) - len(self.ids)
+
+    def remove(self, name: str):
+        # El id queda sin nombre y se descarta al resolver; apply_changes reconstruye si hay muchos
+        entity_id = self.ids.pop(name, None)
+        if entity_id is not None:
+            self.names[entity_id] = None
+
+    def resolve(self, reference: str):
+        """
+        (nombre, sugerencias): nombre si la referencia es una llave de una sola
+        entidad, si no, los nombres más parecidos para confirmar.
+        """
+        key = normalize(reference)
+        if not key:
+            return None, []
+
+        entity_id = self.keys.get(key)
+        if entity_id is not None and entity_id >= 0 and self.names[entity_id]:
+            return self.names[entity_id], []
+
+        scored = sorted(
+            ((difflib.SequenceMatcher(None, key, self.labels[candidate]).ratio(), candidate)
+             for candidate in self.candidates(key)),
+            reverse=True,
+        )
+        # Un parecido claro no se sustituye solo: el documento quedaría con otro cliente o producto
+        if scored and scored[0][0] >= MIN_SCORE and (len(scored) == 1 or scored[0][0] - scored[1][0] >= MIN_MARGIN):
+            return None, [self.names[scored[0][1]]]
+        return None, [self.names[candidate] for _score, candidate in scored[:5]]
+
+    def candidates(self, key: str):
+        # Entidades que comparten más tokens con la referencia, empezando por los menos frecuentes
+        postings = sorted(
+            (self.tokens[token] for token in set(key.split()) if token in self.tokens),
+            key=len,
+        )
+        counts = {}
+        for posting in postings:
+            for entity_id in posting[:MAX_CANDIDATES * 10]:
+                counts[entity_id] = counts.get(entity_id, 0) + 1
+        ranked = sorted(counts, key=counts.get, reverse=True)
+        return [entity_id for entity_id in ranked if self.names[entity_id]][:MAX_CANDIDATES]
+
+
+def fetch_entities(doctype: str, names=None):
+    condition = f"AND {NAME_COLUMNS.get(doctype, 'name')} IN %(names)s" if names else ""
+    query = ENTITY_SOURCES[doctype].format(condition=condition)
+    after = ""
+    while True:
+        rows = frappe.db.sql(query, {"after": after, "chunk": CHUNK_SIZE, "names": tuple(names or ())})
+        for name, label, extra_keys in rows:
+            yield name, label, (extra_keys or "").split("\x1f")
+        if len(rows) < CHUNK_SIZE:
+            break
+        after = rows[-1][0]
+
+
+def build_entity_indexes() -> dict:
+    """
+    Construye los índices del sitio actual. La primera consulta del proceso lo
+    construye si todavía no existe.
+    """
+    cache = frappe.cache()
+    version = int(cache.get(cache.make_key(VERSION_KEY)) or 0)
+
+    indexes = {}
+    for doctype in ENTITY_SOURCES:
+        index = indexes[doctype] = EntityIndex(doctype)
+        for name, label, extra_keys in fetch_entities(doctype):
+            index.add(name, label, extra_keys)
+
+    with _lock:
+        _sites[frappe.local.site] = {"indexes": indexes, "version": version, "checked_at": time.monotonic()}
+    return {doctype: len(index) for doctype, index in indexes.items()}
+
+
+def get_entity_index(doctype: str) -> EntityIndex:
+    state = _sites.get(frappe.local.site)
+    if state is None:
+        with _lock:
+            if frappe.local.site not in _sites:
+                build_entity_indexes()
+        state = _sites[frappe.local.site]
+    elif time.monotonic() - state["checked_at"] > CHECK_INTERVAL:
+        apply_changes(state)
+        # apply_changes puede haber reconstruido el índice
+        state = _sites[frappe.local.site]
+    return state["indexes"][doctype]
+
+
+def apply_changes(state):
+    cache = frappe.cache()
+    with _lock:
+        state["checked_at"] = time.monotonic()
+        version = int(cache.get(cache.make_key(VERSION_KEY)) or 0)
+        if version == state["version"]:
+            return
+
+        changes = [
+            json.loads(change)
+            for change in cache.zrangebyscore(cache.make_key(CHANGES_KEY), state["version"] + 1, version)
+        ]
+        # Si la lista ya se recortó y faltan cambios, se reconstruye todo
+        if len(changes) < version - state["version"]:
+            build_entity_indexes()
+            return
+
+        for change in changes:
+            index = state["indexes"][change["doctype"]]
+            # Un registro actualizado que quedó deshabilitado no vuelve a cargarse
+            for name in change["removed"] + change["updated"]:
+                index.remove(name)
+            if change["updated"]:
+                for name, label, extra_keys in fetch_entities(change["doctype"], change["updated"]):
+                    index.add(name, label, extra_keys)
+        state["version"] = version
+
+        # Compactar cuando los ids sin nombre superan una quinta parte del índice
+        if any(index.stale > max(1000, len(index) // 5) for index in state["indexes"].values()):
+            build_entity_indexes()
+
+
+def publish_change(doctype: str, updated=(), removed=()):
+    cache = frappe.cache()
+    version = cache.incr(cache.make_key(VERSION_KEY))
+    change = json.dumps({"version": version, "doctype": doctype, "updated": list(updated), "removed": list(removed)})
+    pipe = cache.pipeline()
+    pipe.zadd(cache.make_key(CHANGES_KEY), {change: version})
+    pipe.zremrangebyrank(cache.make_key(CHANGES_KEY), 0, -MAX_CHANGES - 1)
+    pipe.execute()
+
+
+def on_entity_update(doc, method=None):
+    # Se publica al confirmar la transacción, para que los demás procesos lean el dato nuevo
+    frappe.db.after_commit.add(lambda: publish_change(doc.doctype, updated=[doc.name]))
+
+
+def on_entity_trash(doc, method=None):
+    frappe.db.after_commit.add(lambda: publish_change(doc.doctype, removed=[doc.name]))
+
+
+def on_entity_rename(doc, method=None, old_name=None, new_name=None, merge=False):
+    frappe.db.after_commit.add(lambda: publish_change(doc.doctype, updated=[new_name], removed=[old_name]))
+
+
+def resolve_entity(doctype: str, reference: str):
+    """
+    (nombre, sugerencias) de una referencia a un Item, Customer o Supplier.
+    """
+    return get_entity_index(doctype).resolve(reference)
+
+
+def ground_references(data: dict, party_doctype: str, party_field: str) -> list:
+    """
+    Reemplaza en `data` el tercero y los item_code por sus nombres reales.
+    Devuelve los errores de las referencias sin coincidencia exacta, con las
+    sugerencias que el usuario debe confirmar.
+    """
+    errors = []
+    targets = [(party_doctype, data, party_field)]
+    targets += [("Item", item, "item_code") for item in data.get("items") or []]
+
+    for doctype, row, field in targets:
+        if not row.get(field):
+            continue
+        name, suggestions = resolve_entity(doctype, row[field])
+        if name:
+            row[field] = name
+            continue
+        message = f"{doctype} '{row[field]}' no encontrado."
+        if suggestions:
+            message += f" ¿Quisiste decir: {', '.join(suggestions)}?"
+        errors.append(message)
+    return errors
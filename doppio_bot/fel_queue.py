@@ -0,0 +1,192 @@
+"""
+Cola de certificación FEL de las facturas que crea el bot.
+
+El chat responde en cuanto se guarda el borrador; la certificación (lenta y
+dependiente del SAT) corre en un worker que toma las facturas pendientes por
+lotes, reintenta con espera exponencial y registra el estado en
+DoppioBot FEL Certification y en el historial de la factura. Cada cambio de
+estado se avisa por realtime a la sesión del chat que creó la factura.
+
+`doppiobot_fel_certify_method` en site_config indica el método que certifica
+una factura (recibe su nombre). Sin ese método no se encola nada: la factura
+queda en borrador para que el usuario la revise y la valide, y la cola nunca la
+valida (submit) por su cuenta.
+"""
+import random
+from contextlib import contextmanager
+
+import frappe
+from frappe.utils import add_to_date, now_datetime
+
+
+QUEUE_DOCTYPE = "DoppioBot FEL Certification"
+STATUS_EVENT = "doppiobot_fel_status"
+
+BATCH_SIZE = 20
+MAX_ATTEMPTS = 6
+# Espera antes del reintento n: BASE_DELAY * 2^(n-1), hasta MAX_DELAY (segundos)
+BASE_DELAY = 60
+MAX_DELAY = 60 * 60
+# Una factura en proceso por más tiempo que esto se considera abandonada (worker caído)
+PROCESSING_TIMEOUT = 60 * 15
+
+
+class FELNotConfigured(frappe.ValidationError):
+    pass
+
+
+def get_certify_method():
+    return frappe.conf.get("doppiobot_fel_certify_method")
+
+
+def queue_fel_certification(invoice, session_id=None) -> bool:
+    """
+    Registra el borrador para certificarlo en segundo plano. Se llama después de
+    insertar la factura, en la misma transacción. Devuelve si quedó en cola.
+    """
+    if not invoice.get("custom_fel") or not get_certify_method():
+        return False
+    if frappe.db.exists(QUEUE_DOCTYPE, {"sales_invoice": invoice.name}):
+        return True
+
+    frappe.get_doc({
+        "doctype": QUEUE_DOCTYPE,
+        "sales_invoice": invoice.name,
+        "company": invoice.company,
+        "status": "Queued",
+        "next_attempt_at": now_datetime(),
+        "user": frappe.session.user,
+        "session_id": session_id,
+    }).insert(ignore_permissions=True)
+
+    # Arranca un lote de inmediato; el scheduler recoge lo que quede pendiente
+    frappe.enqueue("doppio_bot.fel_queue.process_fel_queue", queue="long", enqueue_after_commit=True)
+    return True
+
+
+def get_retry_delay(attempts: int) -> int:
+    delay = min(BASE_DELAY * 2 ** (attempts - 1), MAX_DELAY)
+    # Un poco de variación para que las facturas que fallaron juntas no se reintenten juntas
+    return int(delay * random.uniform(0.8, 1.2))
+
+
+def claim_batch() -> list:
+    """
+    Marca como en proceso un lote de certificaciones vencidas y devuelve sus nombres.
+    SKIP LOCKED permite que varios workers tomen lotes distintos.
+    """
+    now = now_datetime()
+    names = frappe.db.sql(f"""
+        SELECT name FROM `tab{QUEUE_DOCTYPE}`
+        WHERE (status = 'Queued' AND next_attempt_at <= %(now)s)
+            OR (status = 'Processing' AND modified < %(stale)s)
+        ORDER BY next_attempt_at
+        LIMIT %(limit)s
+        FOR UPDATE SKIP LOCKED
+    """, {"now": now, "stale": add_to_date(now, seconds=-PROCESSING_TIMEOUT), "limit": BATCH_SIZE}, pluck=True)
+
+    if names:
+        frappe.db.sql(f"""
+            UPDATE `tab{QUEUE_DOCTYPE}` SET status = 'Processing', modified = %(now)s
+            WHERE name IN %(names)s
+        """, {"now": now, "names": tuple(names)})
+    frappe.db.commit()
+    return names
+
+
+def certify_invoice(invoice_name: str):
+    method = get_certify_method()
+    if not method:
+        # Se quitó la configuración después de encolar: la factura se queda en borrador
+        raise FELNotConfigured("No hay método de certificación FEL configurado (doppiobot_fel_certify_method).")
+    frappe.get_attr(method)(invoice_name)
+
+
+def process_fel_queue():
+    """
+    Certifica lotes de facturas pendientes hasta vaciar la cola vencida.
+    """
+    while True:
+        names = claim_batch()
+        if not names:
+            return
+        for name in names:
+            process_certification(name)
+
+
+def process_certification(name: str):
+    entry = frappe.get_doc(QUEUE_DOCTYPE, name)
+    entry.attempts += 1
+    try:
+        # La certificación corre con el usuario que creó la factura
+        with as_user(entry.user):
+            certify_invoice(entry.sales_invoice)
+        entry.update({"status": "Certified", "certified_at": now_datetime(), "last_error": None})
+        comment = f"Certificación FEL completada (intento {entry.attempts})."
+    except Exception as e:
+        frappe.db.rollback()
+        frappe.clear_messages()
+        entry.last_error = str(e)[:1000]
+        # Sin configuración no tiene sentido reintentar
+        if entry.attempts >= MAX_ATTEMPTS or isinstance(e, FELNotConfigured):
+            entry.status = "Failed"
+            comment = f"Certificación FEL fallida tras {entry.attempts} intentos: {entry.last_error}"
+        else:
+            entry.status = "Queued"
+            entry.next_attempt_at = add_to_date(now_datetime(), seconds=get_retry_delay(entry.attempts))
+            comment = None
+
+    entry.save(ignore_permissions=True)
+    if comment:
+        frappe.get_doc("Sales Invoice", entry.sales_invoice).add_comment("Info", comment)
+    frappe.db.commit()
+    notify_status(entry)
+
+
+@contextmanager
+def as_user(user):
+    previous = frappe.session.user
+    if user:
+        frappe.set_user(user)
+    try:
+        yield
+    finally:
+        frappe.set_user(previous)
+
+
+def notify_status(entry):
+    if not entry.user:
+        return
+    frappe.publish_realtime(
+        STATUS_EVENT,
+        {
+            "sales_invoice": entry.sales_invoice,
+            "status": entry.status,
+            "attempts": entry.attempts,
+            "next_attempt_at": str(entry.next_attempt_at) if entry.status == "Queued" else None,
+            "error": entry.last_error,
+            "session_id": entry.session_id,
+        },
+        user=entry.user,
+    )
+
+
+def get_fel_status(invoice_name: str):
+    return frappe.db.get_value(
+        QUEUE_DOCTYPE,
+        {"sales_invoice": invoice_name},
+        ["sales_invoice", "status", "attempts", "next_attempt_at", "certified_at", "last_error"],
+        as_dict=True,
+    )
+
+
+def retry_failed(invoice_name: str):
+    """
+    Vuelve a poner en cola una certificación fallida.
+    """
+    name = frappe.db.get_value(QUEUE_DOCTYPE, {"sales_invoice": invoice_name, "status": "Failed"})
+    if not name:
+        return False
+    frappe.db.set_value(QUEUE_DOCTYPE, name, {"status": "Queued", "attempts": 0, "next_attempt_at": now_datetime()})
+    frappe.enqueue("doppio_bot.fel_queue.process_fel_queue", queue="long", enqueue_after_commit=True)
+    return True
@@ -0,0 +1,404 @@
+"""
+Importación masiva desde un archivo CSV o Excel adjunto en el chat.
+
+El agente solo ve los encabezados y unas filas de ejemplo (preview_import_file)
+y decide una vez cómo se mapean las columnas. La importación corre en un job
+que lee el archivo fila por fila, inserta en transacciones por bloque, publica
+el avance a ChatView y al final adjunta un CSV con las filas rechazadas.
+"""
+import csv
+import os
+import tempfile
+
+import frappe
+from frappe.utils import flt, getdate
+
+from doppio_bot.entity_index import ground_references, resolve_entity
+
+
+IMPORT_KEY = "doppiobot:import:{user}:{import_id}"
+IMPORT_TTL = 60 * 60 * 24
+PROGRESS_EVENT = "doppiobot_import_progress"
+
+# Filas por transacción
+CHUNK_SIZE = 200
+PREVIEW_ROWS = 3
+ALLOWED_EXTENSIONS = (".csv", ".xlsx")
+
+# Campos que el mapeo de columnas puede usar por tipo de importación; los primeros son obligatorios
+TARGETS = {
+    "Item Price": {
+        "required": ("item_code", "price_list_rate"),
+        "optional": ("price_list", "uom", "valid_from", "supplier"),
+    },
+    "Item": {
+        "required": ("item_code", "item_name"),
+        "optional": ("item_group", "stock_uom", "description", "barcode", "standard_rate"),
+    },
+    "Purchase Invoice": {
+        # Filas consecutivas con el mismo proveedor y número de factura forman una factura
+        "required": ("supplier", "bill_no", "item_code", "qty", "rate"),
+        "optional": ("bill_date", "posting_date", "due_date"),
+    },
+}
+
+
+class FileImportError(frappe.ValidationError):
+    pass
+
+
+def get_import_key(import_id: str, user=None) -> str:
+    return IMPORT_KEY.format(user=user or frappe.session.user, import_id=import_id)
+
+
+def get_import_status(import_id: str, user=None):
+    return frappe.cache().get_value(get_import_key(import_id, user))
+
+
+def set_import_status(import_id: str, status: dict, user=None):
+    frappe.cache().set_value(get_import_key(import_id, user), status, expires_in_sec=IMPORT_TTL)
+
+
+def get_import_file(file_url: str):
+    """
+    Documento File del adjunto, validando permiso y extensión.
+    """
+    file_url = (file_url or "").strip().strip("'\"`")
+    name = frappe.db.get_value("File", {"file_url": file_url}, "name")
+    if not name:
+        raise FileImportError(f"No se encontró el archivo {file_url}.")
+
+    file_doc = frappe.get_doc("File", name)
+    if not frappe.has_permission("File", "read", file_doc):
+        raise frappe.PermissionError(f"No tienes permiso para leer {file_url}.")
+    if os.path.splitext(file_doc.file_name or file_url)[1].lower() not in ALLOWED_EXTENSIONS:
+        raise FileImportError("Solo se pueden importar archivos .csv o .xlsx.")
+    return file_doc
+
+
+def iter_rows(file_doc):
+    """
+    Filas del archivo como listas de texto, leídas en streaming: el CSV línea por
+    línea y el Excel con openpyxl en modo de solo lectura (primera hoja).
+    """
+    path = file_doc.get_full_path()
+    if path.lower().endswith(".xlsx"):
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(path, read_only=True, data_only=True)
+        try:
+            for row in workbook.worksheets[0].iter_rows(values_only=True):
+                yield ["" if value is None else str(value).strip() for value in row]
+        finally:
+            workbook.close()
+        return
+
+    with open(path, newline="", encoding="utf-8-sig", errors="replace") as f:
+        sample = f.read(4096)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t|")
+        except csv.Error:
+            dialect = csv.excel
+        for row in csv.reader(f, dialect):
+            yield [value.strip() for value in row]
+
+
+def iter_records(file_doc, column_map: dict):
+    """
+    (número de fila, {campo: valor}) aplicando el mapeo campo -> encabezado.
+    """
+    rows = iter_rows(file_doc)
+    headers = next(rows, [])
+    positions = {field: headers.index(column) for field, column in column_map.items()}
+
+    for row_number, row in enumerate(rows, start=2):
+        if not any(row):
+            continue
+        yield row_number, {
+            field: row[position] if position < len(row) else ""
+            for field, position in positions.items()
+        }
+
+
+def preview_file(file_url: str) -> dict:
+    file_doc = get_import_file(file_url)
+    rows = iter_rows(file_doc)
+    headers = next(rows, [])
+    sample = [row for _i, row in zip(range(PREVIEW_ROWS), rows)]
+    return {
+        "file_url": file_doc.file_url,
+        "headers": headers,
+        "sample_rows": sample,
+        "targets": {target: dict(fields) for target, fields in TARGETS.items()},
+    }
+
+
+def validate_column_map(file_doc, target: str, column_map: dict):
+    if target not in TARGETS:
+        raise FileImportError(f"Tipo de importación no soportado: {target}. Usa uno de {', '.join(TARGETS)}.")
+
+    fields = TARGETS[target]
+    missing = [field for field in fields["required"] if not column_map.get(field)]
+    if missing:
+        raise FileImportError(f"Faltan columnas para: {', '.join(missing)}.")
+
+    unknown = [field for field in column_map if field not in fields["required"] + fields["optional"]]
+    if unknown:
+        raise FileImportError(f"Campos desconocidos para {target}: {', '.join(unknown)}.")
+
+    headers = next(iter_rows(file_doc), [])
+    not_found = [column for column in column_map.values() if column not in headers]
+    if not_found:
+        raise FileImportError(f"Columnas que no existen en el archivo: {', '.join(not_found)}.")
+
+
+def start_import(file_url: str, target: str, column_map: dict, company: str, session_id=None) -> str:
+    """
+    Valida el mapeo y encola la importación. Devuelve el id para seguir el avance.
+    """
+    file_doc = get_import_file(file_url)
+    column_map = {field: column for field, column in (column_map or {}).items() if column}
+    validate_column_map(file_doc, target, column_map)
+    frappe.has_permission(target, "create", throw=True)
+
+    import_id = frappe.generate_hash(length=10)
+    set_import_status(import_id, {
+        "import_id": import_id,
+        "status": "Queued",
+        "target": target,
+        "file_url": file_doc.file_url,
+        "processed": 0,
+        "imported": 0,
+        "failed": 0,
+    })
+    frappe.enqueue(
+        "doppio_bot.file_import.run_import",
+        queue="long",
+        timeout=60 * 60 * 4,
+        enqueue_after_commit=True,
+        import_id=import_id,
+        file_name=file_doc.name,
+        target=target,
+        column_map=column_map,
+        company=company,
+        session_id=session_id,
+    )
+    return import_id
+
+
+def resolve_reference(doctype: str, value: str) -> str:
+    # Solo coincidencias exactas: una fila con un nombre parecido va al CSV de errores con las sugerencias
+    name, suggestions = resolve_entity(doctype, value)
+    if name:
+        return name
+    message = f"{doctype} '{value}' no encontrado."
+    if suggestions:
+        message += f" ¿Quisiste decir: {', '.join(suggestions)}?"
+    raise FileImportError(message)
+
+
+def import_item_price(record: dict, company: str):
+    item_code = resolve_reference("Item", record["item_code"])
+    supplier = record.get("supplier") and resolve_reference("Supplier", record["supplier"])
+
+    price_list = record.get("price_list") or frappe.db.get_single_value("Buying Settings", "buying_price_list")
+    if not price_list:
+        raise FileImportError("Sin lista de precios: indica la columna o configura la de compras predeterminada.")
+
+    filters = {"item_code": item_code, "price_list": price_list}
+    if record.get("uom"):
+        filters["uom"] = record["uom"]
+    name = frappe.db.get_value("Item Price", filters, "name")
+    doc = frappe.get_doc("Item Price", name) if name else frappe.new_doc("Item Price")
+    doc.update({**filters, "price_list_rate": flt(record["price_list_rate"])})
+    if record.get("valid_from"):
+        doc.valid_from = getdate(record["valid_from"])
+    if supplier:
+        doc.supplier = supplier
+    doc.save()
+    return doc.name
+
+
+def import_item(record: dict, company: str):
+    if frappe.db.exists("Item", record["item_code"]):
+        raise FileImportError(f"El Item {record['item_code']} ya existe.")
+
+    doc = frappe.new_doc("Item")
+    doc.update({
+        "item_code": record["item_code"],
+        "item_name": record["item_name"],
+        "description": record.get("description") or record["item_name"],
+        "item_group": record.get("item_group") or "Productos",
+        "stock_uom": record.get("stock_uom") or "Unidad(es)",
+    })
+    if record.get("standard_rate"):
+        doc.standard_rate = flt(record["standard_rate"])
+    if record.get("barcode"):
+        doc.append("barcodes", {"barcode": record["barcode"]})
+    doc.insert()
+    return doc.name
+
+
+def import_purchase_invoice(records: list, company: str):
+    first = records[0]
+    data = {
+        "supplier": first["supplier"],
+        "items": [
+            {"item_code": record["item_code"], "qty": flt(record["qty"]), "rate": flt(record["rate"])}
+            for record in records
+        ],
+    }
+    errors = ground_references(data, "Supplier", "supplier")
+    if errors:
+        raise FileImportError(" ".join(errors))
+    # Con el proveedor ya resuelto, para no duplicar la factura si el archivo trae su NIT o un alias
+    if frappe.db.exists("Purchase Invoice", {"supplier": data["supplier"], "bill_no": first["bill_no"], "docstatus": ("<", 2)}):
+        raise FileImportError(f"La factura {first['bill_no']} de {data['supplier']} ya existe.")
+
+    doc = frappe.new_doc("Purchase Invoice")
+    doc.update({
+        "company": company,
+        "supplier": data["supplier"],
+        "bill_no": first["bill_no"],
+        "items": data["items"],
+    })
+    for field in ("bill_date", "posting_date", "due_date"):
+        if first.get(field):
+            doc.set(field, getdate(first[field]))
+    if first.get("posting_date"):
+        doc.set_posting_time = 1
+    doc.set_missing_values()
+    doc.insert()
+    return doc.name
+
+
+def iter_units(records, target: str):
+    """
+    Unidades que se insertan juntas: una fila, o las filas consecutivas de una
+    misma factura de compra. Solo se guarda en memoria la factura en curso.
+    """
+    if target != "Purchase Invoice":
+        for row_number, record in records:
+            yield [row_number], record
+        return
+
+    current_key, row_numbers, lines = None, [], []
+    for row_number, record in records:
+        key = (record["supplier"], record["bill_no"])
+        if lines and key != current_key:
+            yield row_numbers, lines
+            row_numbers, lines = [], []
+        current_key = key
+        row_numbers.append(row_number)
+        lines.append(record)
+    if lines:
+        yield row_numbers, lines
+
+
+IMPORTERS = {
+    "Item Price": import_item_price,
+    "Item": import_item,
+    "Purchase Invoice": import_purchase_invoice,
+}
+
+
+def publish_progress(status: dict, session_id=None):
+    frappe.publish_realtime(
+        PROGRESS_EVENT,
+        {**status, "session_id": session_id},
+        user=frappe.session.user,
+    )
+
+
+def run_import(import_id, file_name, target, column_map, company, session_id=None):
+    """
+    Job de la importación. Cada fila (o factura) se inserta en su propio
+    savepoint; cada CHUNK_SIZE filas se confirma la transacción y se publica el avance.
+    """
+    status = get_import_status(import_id) or {"import_id": import_id, "target": target}
+    status.update({"status": "Running", "processed": 0, "imported": 0, "failed": 0})
+    set_import_status(import_id, status)
+    publish_progress(status, session_id)
+
+    importer = IMPORTERS[target]
+    file_doc = frappe.get_doc("File", file_name)
+    uncommitted = 0
+    # Filas importadas desde la última confirmación; se pierden si el job falla
+    pending_rows = []
+
+    # Las filas rechazadas se escriben a disco a medida que aparecen
+    with tempfile.TemporaryFile("w+", newline="", encoding="utf-8") as errors_file:
+        errors = csv.writer(errors_file)
+        errors.writerow(["fila", "error"])
+
+        try:
+            records = iter_records(file_doc, column_map)
+            for row_numbers, unit in iter_units(records, target):
+                frappe.db.savepoint("doppiobot_import")
+                try:
+                    importer(unit, company)
+                    status["imported"] += len(row_numbers)
+                    pending_rows.extend(row_numbers)
+                except Exception as e:
+                    frappe.db.rollback(save_point="doppiobot_import")
+                    frappe.clear_messages()
+                    status["failed"] += len(row_numbers)
+                    for row_number in row_numbers:
+                        errors.writerow([row_number, str(e)])
+
+                status["processed"] += len(row_numbers)
+                uncommitted += len(row_numbers)
+                if uncommitted >= CHUNK_SIZE:
+                    frappe.db.commit()
+                    uncommitted = 0
+                    pending_rows = []
+                    set_import_status(import_id, status)
+                    publish_progress(status, session_id)
+
+            frappe.db.commit()
+            status["status"] = "Completed"
+        except Exception as e:
+            frappe.db.rollback()
+            # El rollback descarta el bloque sin confirmar: esas filas no quedaron importadas
+            status["imported"] -= len(pending_rows)
+            status["failed"] += len(pending_rows)
+            for row_number in pending_rows:
+                errors.writerow([row_number, f"No se confirmó porque la importación falló: {e}"])
+            status.update({"status": "Failed", "error": str(e)})
+            frappe.log_error(title=f"Importación {import_id} falló")
+
+        if status["failed"]:
+            errors_file.seek(0)
+            status["error_report"] = save_error_report(import_id, file_doc, errors_file.read())
+            frappe.db.commit()
+
+    set_import_status(import_id, status)
+    publish_progress(status, session_id)
+    return status
+
+
+def save_error_report(import_id: str, file_doc, content: str) -> str:
+    base_name = os.path.splitext(file_doc.file_name or "import")[0]
+    report = frappe.get_doc({
+        "doctype": "File",
+        "file_name": f"{base_name}-errores-{import_id}.csv",
+        "is_private": 1,
+        "content": content,
+    })
+    report.insert(ignore_permissions=True)
+    return report.file_url
+
+
+def format_status(status: dict) -> str:
+    if not status:
+        return "No se encontró la importación."
+    text = (
+        f"Importación {status['import_id']} ({status['target']}): {status['status']}. "
+        f"Procesadas {status['processed']}, importadas {status['imported']}, con error {status['failed']}."
+    )
+    if status.get("error"):
+        text += f" Error: {status['error']}."
+    if status.get("error_report"):
+        text += f" Reporte de errores: {status['error_report']}"
+    return text
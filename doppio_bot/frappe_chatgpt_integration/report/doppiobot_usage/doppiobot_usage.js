@@ -0,0 +1,20 @@
+// Copyright (c) 2026, Hussain Nagaria and contributors
+// For license information, please see license.txt
+
+frappe.query_reports["DoppioBot Usage"] = {
+	filters: [
+		{
+			fieldname: "date",
+			label: __("Date"),
+			fieldtype: "Date",
+			default: frappe.datetime.get_today(),
+			reqd: 1,
+		},
+		{
+			fieldname: "scope",
+			label: __("Scope"),
+			fieldtype: "Select",
+			options: "\nUser\nCompany",
+		},
+	],
+};
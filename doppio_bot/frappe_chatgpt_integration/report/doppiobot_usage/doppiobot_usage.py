@@ -0,0 +1,48 @@
+# Copyright (c) 2026, Hussain Nagaria and contributors
+# For license information, please see license.txt
+
+from frappe import _
+
+from doppio_bot.rate_limit import get_limits, get_usage
+
+
+def execute(filters=None):
+	filters = filters or {}
+	return get_columns(), get_data(filters)
+
+
+def get_columns():
+	return [
+		{"fieldname": "scope", "label": _("Scope"), "fieldtype": "Data", "width": 100},
+		{"fieldname": "name", "label": _("Name"), "fieldtype": "Data", "width": 220},
+		{"fieldname": "requests", "label": _("Requests"), "fieldtype": "Int", "width": 110},
+		{"fieldname": "rejected", "label": _("Rejected"), "fieldtype": "Int", "width": 110},
+		{"fieldname": "tokens", "label": _("Tokens"), "fieldtype": "Int", "width": 120},
+		{"fieldname": "daily_token_budget", "label": _("Daily Token Budget"), "fieldtype": "Int", "width": 150},
+		{"fieldname": "budget_used", "label": _("Budget Used (%)"), "fieldtype": "Percent", "width": 130},
+	]
+
+
+def get_data(filters):
+	limits = get_limits()
+	data = []
+
+	for (scope, name), counters in get_usage(filters.get("date")).items():
+		if filters.get("scope") and filters.get("scope") != scope:
+			continue
+
+		budget = limits.get(scope, {}).get("daily_token_budget") or 0
+		tokens = counters.get("tokens", 0)
+		data.append(
+			{
+				"scope": scope,
+				"name": name,
+				"requests": counters.get("requests", 0),
+				"rejected": counters.get("rejected", 0),
+				"tokens": tokens,
+				"daily_token_budget": budget,
+				"budget_used": (tokens * 100.0 / budget) if budget else None,
+			}
+		)
+
+	return sorted(data, key=lambda row: (row["scope"], -row["tokens"]))
@@ -0,0 +1,382 @@
+"""
+Índice vectorial local de la documentación: Help Articles publicados (incluye
+los procedimientos internos de la empresa) y descripciones de DocTypes.
+
+Los vectores se guardan por sitio en private/doppiobot_help como un archivo
+float32 de solo anexar que se lee con np.memmap; la búsqueda es por fuerza
+bruta (producto punto con vectores normalizados). Los embeddings se calculan
+con el modelo local de `doppiobot_embedding_model` (transformers) o, si no hay
+ninguno, con hashing de palabras y bigramas, sin red en ambos casos.
+
+    bench --site <sitio> doppiobot-build-help-index [--rebuild]
+"""
+import fcntl
+import json
+import os
+import re
+import threading
+import unicodedata
+import zlib
+from contextlib import contextmanager
+
+import numpy as np
+
+import frappe
+from frappe.utils import strip_html_tags
+
+
+INDEX_FOLDER = "doppiobot_help"
+VECTORS_FILE = "vectors-{version}.f32"
+META_FILE = "meta.json"
+LOCK_FILE = "index.lock"
+
+HASH_DIMENSIONS = 1024
+CHUNK_CHARS = 800
+MAX_RESULTS = 3
+MIN_SCORE = 0.15
+# Se compacta el archivo cuando las filas descartadas superan esta fracción
+MAX_DEAD_RATIO = 0.25
+
+HELP_SOURCES = {
+    # doctype: (consulta de (name, modified), consulta de (name, título, contenido, ruta))
+    "Help Article": (
+        "SELECT name, modified FROM `tabHelp Article` WHERE published = 1",
+        """
+        SELECT article.name, article.title, article.content,
+            CONCAT('/', COALESCE(category.route, 'kb'), '/', article.route) AS route
+        FROM `tabHelp Article` article
+        LEFT JOIN `tabHelp Category` category ON category.name = article.category
+        WHERE article.name IN %(names)s
+        """,
+    ),
+    "DocType": (
+        "SELECT name, modified FROM `tabDocType` WHERE IFNULL(description, '') != '' AND istable = 0",
+        """
+        SELECT name, name AS title, CONCAT(module, '. ', description) AS content,
+            CONCAT('/app/', LOWER(REPLACE(name, ' ', '-'))) AS route
+        FROM `tabDocType`
+        WHERE name IN %(names)s
+        """,
+    ),
+}
+
+_lock = threading.Lock()
+# {sitio: {"version": mtime de meta.json, "meta": dict, "vectors": np.memmap, "active": np.ndarray}}
+_loaded = {}
+_embedders = {}
+
+
+def get_index_path(*parts):
+    return frappe.get_site_path("private", INDEX_FOLDER, *parts)
+
+
+def normalize_text(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text or "").encode("ascii", "ignore").decode()
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", text.lower()).split())
+
+
+class HashEmbedder:
+    """
+    Bolsa de palabras y bigramas con hashing a HASH_DIMENSIONS columnas.
+    """
+
+    name = f"hash-{HASH_DIMENSIONS}"
+    dimensions = HASH_DIMENSIONS
+
+    def embed(self, texts) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            tokens = normalize_text(text).split()
+            for term in tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]:
+                value = zlib.crc32(term.encode())
+                vectors[row, value % self.dimensions] += 1.0 if value & 0x80000000 else -1.0
+        # Frecuencia sublineal: un término repetido no domina el fragmento
+        return normalize_rows(np.sign(vectors) * np.log1p(np.abs(vectors)))
+
+
+class TransformerEmbedder:
+    """
+    Promedio de la última capa de un modelo de embeddings local.
+    """
+
+    def __init__(self, path: str):
+        from transformers import AutoModel, AutoTokenizer
+
+        self.name = f"model-{path}"
+        self.tokenizer = AutoTokenizer.from_pretrained(path)
+        self.model = AutoModel.from_pretrained(path)
+        self.model.eval()
+        self.dimensions = self.model.config.hidden_size
+
+    def embed(self, texts) -> np.ndarray:
+        import torch
+
+        vectors = []
+        with torch.no_grad():
+            for start in range(0, len(texts), 32):
+                batch = self.tokenizer(
+                    list(texts[start:start + 32]), padding=True, truncation=True, max_length=512, return_tensors="pt"
+                )
+                hidden = self.model(**batch).last_hidden_state
+                mask = batch["attention_mask"].unsqueeze(-1).float()
+                vectors.append(((hidden * mask).sum(1) / mask.sum(1).clamp(min=1)).numpy())
+        return normalize_rows(np.vstack(vectors).astype(np.float32) if vectors else np.zeros((0, self.dimensions), np.float32))
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def get_embedder():
+    path = frappe.conf.get("doppiobot_embedding_model")
+    if path not in _embedders:
+        with _lock:
+            if path not in _embedders:
+                _embedders[path] = TransformerEmbedder(path) if path else HashEmbedder()
+    return _embedders[path]
+
+
+def split_chunks(title: str, content: str) -> list:
+    """
+    Fragmentos de hasta CHUNK_CHARS caracteres por párrafos, cada uno con el título.
+    """
+    text = strip_html_tags(content or "")
+    paragraphs = [" ".join(p.split()) for p in re.split(r"\n\s*\n|\r\n\s*\r\n", text)]
+    chunks, current = [], ""
+    for paragraph in filter(None, paragraphs):
+        if current and len(current) + len(paragraph) > CHUNK_CHARS:
+            chunks.append(current)
+            current = ""
+        current = f"{current} {paragraph}".strip()
+        while len(current) > CHUNK_CHARS:
+            chunks.append(current[:CHUNK_CHARS])
+            current = current[CHUNK_CHARS:]
+    if current:
+        chunks.append(current)
+    return [f"{title}. {chunk}" for chunk in chunks] or [title]
+
+
+def new_vectors_file() -> str:
+    # Reconstruir o compactar escribe un archivo nuevo: truncar uno que otro
+    # proceso tiene mapeado en memoria lo haría fallar al leerlo
+    file_name = VECTORS_FILE.format(version=frappe.generate_hash(length=8))
+    open(get_index_path(file_name), "wb").close()
+    return file_name
+
+
+def empty_meta(embedder) -> dict:
+    # rows: una entrada por fila del archivo de vectores; None si se descartó
+    return {
+        "embedder": embedder.name,
+        "dimensions": embedder.dimensions,
+        "vectors_file": new_vectors_file(),
+        "documents": {},
+        "rows": [],
+    }
+
+
+def read_meta():
+    path = get_index_path(META_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_meta(meta: dict):
+    # Se escribe a un temporal y se renombra para que los lectores nunca vean un archivo a medias
+    path = get_index_path(META_FILE)
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(meta, f)
+    os.replace(f"{path}.tmp", path)
+
+
+@contextmanager
+def index_lock():
+    # Un solo proceso a la vez actualiza el índice del sitio
+    os.makedirs(get_index_path(), exist_ok=True)
+    with open(get_index_path(LOCK_FILE), "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def get_source_versions() -> dict:
+    """
+    {"doctype::name": modified} de todos los documentos que deben estar en el índice.
+    """
+    versions = {}
+    for doctype, (list_query, _content_query) in HELP_SOURCES.items():
+        if not frappe.db.table_exists(doctype):
+            continue
+        for name, modified in frappe.db.sql(list_query):
+            versions[f"{doctype}::{name}"] = str(modified)
+    return versions
+
+
+def fetch_documents(doctype: str, names: list):
+    _list_query, content_query = HELP_SOURCES[doctype]
+    for start in range(0, len(names), 500):
+        yield from frappe.db.sql(content_query, {"names": tuple(names[start:start + 500])}, as_dict=True)
+
+
+def sync_help_index(rebuild=False) -> dict:
+    """
+    Actualiza el índice con los documentos nuevos, modificados o eliminados desde
+    la última sincronización. Solo se calculan embeddings de lo que cambió.
+    """
+    embedder = get_embedder()
+    with index_lock():
+        meta = read_meta()
+        previous_file = meta and meta["vectors_file"]
+        if (
+            rebuild
+            or not meta
+            or meta["embedder"] != embedder.name
+            or not os.path.exists(get_index_path(meta["vectors_file"]))
+        ):
+            meta = empty_meta(embedder)
+
+        versions = get_source_versions()
+        changed = [key for key, modified in versions.items() if meta["documents"].get(key, {}).get("modified") != modified]
+        removed = [key for key in meta["documents"] if key not in versions]
+
+        # Las filas de documentos modificados o eliminados se descartan
+        for key in changed + removed:
+            for row in meta["documents"].pop(key, {}).get("rows", []):
+                meta["rows"][row] = None
+
+        by_doctype = {}
+        for key in changed:
+            doctype, name = key.split("::", 1)
+            by_doctype.setdefault(doctype, []).append(name)
+
+        with open(get_index_path(meta["vectors_file"]), "ab") as vectors_file:
+            # Descarta lo que haya dejado una sincronización interrumpida
+            vectors_file.truncate(len(meta["rows"]) * meta["dimensions"] * 4)
+            for doctype, names in by_doctype.items():
+                for document in fetch_documents(doctype, names):
+                    key = f"{doctype}::{document.name}"
+                    chunks = split_chunks(document.title, document.content)
+                    first_row = len(meta["rows"])
+                    vectors_file.write(embedder.embed(chunks).astype(np.float32).tobytes())
+                    meta["rows"] += [
+                        {"document": key, "title": document.title, "route": document.route, "text": chunk}
+                        for chunk in chunks
+                    ]
+                    meta["documents"][key] = {
+                        "modified": versions[key],
+                        "rows": list(range(first_row, len(meta["rows"]))),
+                    }
+
+        dead = sum(row is None for row in meta["rows"])
+        if meta["rows"] and dead / len(meta["rows"]) > MAX_DEAD_RATIO:
+            meta = compact(meta)
+        write_meta(meta)
+
+        # Los procesos que aún tienen mapeado el archivo anterior lo siguen leyendo hasta recargar
+        if previous_file and previous_file != meta["vectors_file"]:
+            remove_vectors_file(previous_file)
+
+    return {"documents": len(meta["documents"]), "rows": len(meta["rows"]), "changed": len(changed), "removed": len(removed)}
+
+
+def compact(meta: dict) -> dict:
+    """
+    Reescribe el archivo de vectores sin las filas descartadas.
+    """
+    vectors = open_vectors(meta["vectors_file"], meta["dimensions"], len(meta["rows"]))
+    keep = [row for row, entry in enumerate(meta["rows"]) if entry is not None]
+
+    file_name = new_vectors_file()
+    with open(get_index_path(file_name), "ab") as f:
+        for start in range(0, len(keep), 10000):
+            f.write(np.asarray(vectors[keep[start:start + 10000]], dtype=np.float32).tobytes())
+    del vectors
+
+    meta["vectors_file"] = file_name
+    new_rows = {old: new for new, old in enumerate(keep)}
+    meta["rows"] = [meta["rows"][old] for old in keep]
+    for document in meta["documents"].values():
+        document["rows"] = [new_rows[row] for row in document["rows"]]
+    return meta
+
+
+def open_vectors(file_name: str, dimensions: int, rows: int):
+    if not rows:
+        return np.zeros((0, dimensions), dtype=np.float32)
+    return np.memmap(get_index_path(file_name), dtype=np.float32, mode="r", shape=(rows, dimensions))
+
+
+def remove_vectors_file(file_name: str):
+    try:
+        os.remove(get_index_path(file_name))
+    except FileNotFoundError:
+        pass
+
+
+def load_index():
+    """
+    Índice del sitio mapeado en memoria; se vuelve a abrir solo si meta.json cambió.
+    """
+    path = get_index_path(META_FILE)
+    if not os.path.exists(path):
+        return None
+
+    version = os.stat(path).st_mtime_ns
+    loaded = _loaded.get(frappe.local.site)
+    if loaded and loaded["version"] == version:
+        return loaded
+
+    meta = read_meta()
+    loaded = {
+        "version": version,
+        "meta": meta,
+        "vectors": open_vectors(meta["vectors_file"], meta["dimensions"], len(meta["rows"])),
+        "active": np.array([entry is not None for entry in meta["rows"]], dtype=bool),
+    }
+    _loaded[frappe.local.site] = loaded
+    return loaded
+
+
+def search_help(query: str, limit=MAX_RESULTS) -> list:
+    """
+    Fragmentos más parecidos a la pregunta: [{"title", "route", "text", "score"}],
+    un fragmento por documento.
+    """
+    index = load_index()
+    if not index or not index["active"].any():
+        return []
+
+    embedder = get_embedder()
+    if embedder.name != index["meta"]["embedder"]:
+        frappe.throw("El índice de ayuda se construyó con otro modelo; ejecuta doppiobot-build-help-index --rebuild.")
+
+    scores = index["vectors"] @ embedder.embed([query])[0]
+    scores = np.where(index["active"], scores, -1)
+
+    candidates = min(len(scores), limit * 5)
+    top = np.argpartition(-scores, candidates - 1)[:candidates]
+
+    results, seen = [], set()
+    for row in top[np.argsort(-scores[top])]:
+        entry = index["meta"]["rows"][row]
+        if scores[row] < MIN_SCORE or entry["document"] in seen:
+            continue
+        seen.add(entry["document"])
+        results.append({
+            "title": entry["title"],
+            "route": entry["route"],
+            "text": entry["text"],
+            "score": round(float(scores[row]), 3),
+        })
+        if len(results) == limit:
+            break
+    return results
+
+
+def enqueue_sync(doc=None, method=None):
+    frappe.enqueue("doppio_bot.help_index.sync_help_index", queue="long", enqueue_after_commit=True)
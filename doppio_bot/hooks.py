@@ -102,34 +102,74 @@ app_include_js = "/assets/doppio_bot/js/app_customizations.js"
 # ---------------
 # Hook on document methods and events
 
-# doc_events = {
-# 	"*": {
-# 		"on_update": "method",
-# 		"on_cancel": "method",
-# 		"on_trash": "method"
-# 	}
-# }
+doc_events = {
+	"Sales Invoice": {
+		"on_submit": "doppio_bot.item_analytics.on_sales_invoice_change",
+		"on_cancel": "doppio_bot.item_analytics.on_sales_invoice_change",
+	},
+	"Item Price": {
+		"on_update": "doppio_bot.item_analytics.on_item_price_change",
+		"on_trash": "doppio_bot.item_analytics.on_item_price_change",
+	},
+	"User Permission": {
+		"on_update": "doppio_bot.data_access.on_user_permission_change",
+		"on_trash": "doppio_bot.data_access.on_user_permission_change",
+	},
+	"User": {
+		"on_update": "doppio_bot.data_access.on_user_change",
+	},
+	"Role": {
+		"on_update": "doppio_bot.data_access.on_role_permission_change",
+		"on_trash": "doppio_bot.data_access.on_role_permission_change",
+	},
+	"Custom DocPerm": {
+		"on_update": "doppio_bot.data_access.on_role_permission_change",
+		"on_trash": "doppio_bot.data_access.on_role_permission_change",
+	},
+	"Item": {
+		"on_update": "doppio_bot.entity_index.on_entity_update",
+		"on_trash": "doppio_bot.entity_index.on_entity_trash",
+		"after_rename": "doppio_bot.entity_index.on_entity_rename",
+	},
+	"Customer": {
+		"on_update": "doppio_bot.entity_index.on_entity_update",
+		"on_trash": "doppio_bot.entity_index.on_entity_trash",
+		"after_rename": "doppio_bot.entity_index.on_entity_rename",
+	},
+	"Sales Taxes and Charges Template": {
+		"on_update": "doppio_bot.companies.clear_taxes_template_cache",
+		"on_trash": "doppio_bot.companies.clear_taxes_template_cache",
+	},
+	"Purchase Taxes and Charges Template": {
+		"on_update": "doppio_bot.companies.clear_taxes_template_cache",
+		"on_trash": "doppio_bot.companies.clear_taxes_template_cache",
+	},
+	"Supplier": {
+		"on_update": "doppio_bot.entity_index.on_entity_update",
+		"on_trash": "doppio_bot.entity_index.on_entity_trash",
+		"after_rename": "doppio_bot.entity_index.on_entity_rename",
+	},
+	"Help Article": {
+		"on_update": "doppio_bot.help_index.enqueue_sync",
+		"on_trash": "doppio_bot.help_index.enqueue_sync",
+	},
+}
 
 # Scheduled Tasks
 # ---------------
 
-# scheduler_events = {
-# 	"all": [
-# 		"doppio_bot.tasks.all"
-# 	],
-# 	"daily": [
-# 		"doppio_bot.tasks.daily"
-# 	],
-# 	"hourly": [
-# 		"doppio_bot.tasks.hourly"
-# 	],
-# 	"weekly": [
-# 		"doppio_bot.tasks.weekly"
-# 	],
-# 	"monthly": [
-# 		"doppio_bot.tasks.monthly"
-# 	],
-# }
+scheduler_events = {
+	"all": [
+		"doppio_bot.fel_queue.process_fel_queue",
+	],
+	"hourly_long": [
+		"doppio_bot.chat_sessions.sweep_chat_sessions",
+	],
+	"daily_long": [
+		"doppio_bot.item_analytics.rebuild_item_analytics",
+		"doppio_bot.help_index.sync_help_index",
+	],
+}
 
 # Testing
 # -------
@@ -161,7 +201,7 @@ app_include_js = "/assets/doppio_bot/js/app_customizations.js"
 
 # Request Events
 # ----------------
-# before_request = ["doppio_bot.utils.before_request"]
+before_request = ["doppio_bot.warmup.warm_up_in_background"]
 # after_request = ["doppio_bot.utils.after_request"]
 
 # Job Events
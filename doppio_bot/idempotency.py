@@ -0,0 +1,84 @@
+import hashlib
+import json
+from contextlib import contextmanager
+
+import frappe
+
+from doppio_bot.chat_context import get_current_turn
+
+
+IDEMPOTENCY_KEY = "doppiobot:idempotency:{session_id}:{turn_id}:{doctype}:{digest}"
+PENDING = "__pending__"
+
+# Mientras se inserta el documento la llave queda reservada poco tiempo;
+# una vez creado se recuerda su nombre durante el TTL configurado.
+PENDING_TTL = 60 * 2
+DEFAULT_TTL = 60 * 60
+
+
+class CreationInProgressError(frappe.ValidationError):
+    pass
+
+
+class CreationClaim:
+    def __init__(self, key):
+        self.key = key
+        self.existing = None
+        self.name = None
+
+    def done(self, name):
+        self.name = name
+
+
+def canonical_payload(payload) -> str:
+    return json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str, ensure_ascii=False)
+
+
+def get_idempotency_key(doctype, payload):
+    turn = get_current_turn()
+    if not turn:
+        return None
+
+    digest = hashlib.sha256(canonical_payload(payload).encode()).hexdigest()
+    return frappe.cache().make_key(
+        IDEMPOTENCY_KEY.format(
+            session_id=turn["session_id"],
+            turn_id=turn["turn_id"],
+            doctype=frappe.scrub(doctype),
+            digest=digest,
+        )
+    )
+
+
+@contextmanager
+def claim_creation(doctype, payload):
+    """
+    Evita crear dos veces el mismo documento cuando el agente repite la misma
+    llamada dentro de un turno (p. ej. con handle_parsing_errors=True).
+
+    Si ya existe un documento para la misma sesión, turno y contenido,
+    `claim.existing` trae su nombre y no se debe insertar otro. Si no, la
+    herramienta debe llamar `claim.done(doc.name)` después de insertar; si sale
+    sin hacerlo, la reserva se libera para permitir un reintento.
+    """
+    claim = CreationClaim(get_idempotency_key(doctype, payload))
+    cache = frappe.cache()
+
+    if claim.key and not cache.set(claim.key, PENDING, nx=True, ex=PENDING_TTL):
+        existing = frappe.safe_decode(cache.get(claim.key) or "")
+        if existing == PENDING:
+            raise CreationInProgressError(f"Ya se está creando este {doctype}, espera a que termine.")
+        claim.existing = existing or None
+        if not claim.existing:
+            # La reserva expiró entre SET y GET; se continúa sin deduplicar
+            claim.key = None
+
+    try:
+        yield claim
+    finally:
+        if claim.key and not claim.existing:
+            if claim.name:
+                ttl = frappe.conf.get("doppiobot_idempotency_ttl") or DEFAULT_TTL
+                cache.set(claim.key, claim.name, ex=ttl)
+            else:
+                cache.delete(claim.key)
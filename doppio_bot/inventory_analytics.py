@@ -0,0 +1,185 @@
+import numpy as np
+
+import frappe
+from frappe.utils import (
+    date_diff,
+    get_first_day,
+    get_quarter_start,
+    get_year_start,
+    getdate,
+    nowdate,
+)
+
+
+CHUNK_SIZE = 5000
+CACHE_KEY = "doppiobot:inventory_rotation:{company}:{from_date}:{to_date}:{scope}"
+CACHE_TTL = 60 * 60
+
+PERIODS = {
+    "month": get_first_day,
+    "mes": get_first_day,
+    "quarter": get_quarter_start,
+    "trimestre": get_quarter_start,
+    "year": get_year_start,
+    "año": get_year_start,
+}
+
+# Límites acumulados del valor vendido para la clasificación ABC
+ABC_LIMITS = (0.8, 0.95)
+
+
+def get_period_dates(period=None, from_date=None, to_date=None):
+    to_date = getdate(to_date or nowdate())
+    if from_date:
+        return getdate(from_date), to_date
+
+    get_start = PERIODS.get((period or "quarter").strip().lower())
+    if not get_start:
+        frappe.throw(f"Periodo no válido: {period}. Usa mes, trimestre o año.")
+    return getdate(get_start(to_date)), to_date
+
+
+def fetch_in_chunks(query, params):
+    """
+    Lee una consulta agrupada por item_code en bloques de CHUNK_SIZE (paginación
+    por llave) y la devuelve como arreglos columnares (códigos, valores...).
+    """
+    codes, values = [], []
+    after = ""
+    while True:
+        rows = frappe.db.sql(query, {**params, "after": after, "chunk": CHUNK_SIZE}, as_list=True)
+        if not rows:
+            break
+        codes.append(np.array([row[0] for row in rows], dtype=str))
+        values.append(np.array([[value or 0 for value in row[1:]] for row in rows], dtype=float))
+        after = rows[-1][0]
+        if len(rows) < CHUNK_SIZE:
+            break
+
+    if not codes:
+        return np.array([], dtype=str), np.zeros((0, 0))
+    return np.concatenate(codes), np.concatenate(values)
+
+
+def fetch_sales(company, from_date, to_date, conditions=""):
+    return fetch_in_chunks(f"""
+        SELECT sii.item_code, SUM(sii.stock_qty), SUM(sii.base_net_amount)
+        FROM `tabSales Invoice Item` sii
+        JOIN `tabSales Invoice` si ON sii.parent = si.name
+        WHERE si.docstatus = 1
+            AND si.company = %(company)s
+            AND si.posting_date BETWEEN %(from_date)s AND %(to_date)s
+            AND sii.item_code > %(after)s
+            {conditions}
+        GROUP BY sii.item_code
+        ORDER BY sii.item_code
+        LIMIT %(chunk)s
+    """, {"company": company, "from_date": from_date, "to_date": to_date})
+
+
+def fetch_stock(company, conditions=""):
+    return fetch_in_chunks(f"""
+        SELECT bin.item_code, SUM(bin.actual_qty)
+        FROM `tabBin` bin
+        JOIN `tabWarehouse` wh ON bin.warehouse = wh.name
+        WHERE wh.company = %(company)s
+            AND bin.item_code > %(after)s
+            {conditions}
+        GROUP BY bin.item_code
+        ORDER BY bin.item_code
+        LIMIT %(chunk)s
+    """, {"company": company})
+
+
+def classify_abc(sales_value):
+    """
+    Clase A/B/C según la participación acumulada en el valor vendido.
+    """
+    classes = np.full(len(sales_value), "C", dtype="<U1")
+    total = sales_value.sum()
+    if not total:
+        return classes
+
+    order = np.argsort(-sales_value, kind="stable")
+    # Participación acumulada antes de cada producto: el que cruza el 80 % sigue siendo A
+    share_before = (np.cumsum(sales_value[order]) - sales_value[order]) / total
+    ranked = np.where(share_before < ABC_LIMITS[0], "A", np.where(share_before < ABC_LIMITS[1], "B", "C"))
+    classes[order] = np.where(sales_value[order] > 0, ranked, "C")
+    return classes
+
+
+def compute_inventory_rotation(company, from_date, to_date, scope=None):
+    """
+    Rotación, días de inventario y clase ABC de todo el catálogo de la empresa
+    en una sola pasada vectorizada. Con `scope` (PermissionScope) solo se cuentan
+    los territorios y almacenes que el usuario puede ver.
+    """
+    sale_codes, sales = fetch_sales(company, from_date, to_date, scope.sql(territory="si.territory") if scope else "")
+    stock_codes, stock = fetch_stock(company, scope.sql(warehouse="bin.warehouse") if scope else "")
+
+    codes = np.union1d(sale_codes, stock_codes)
+    sold_qty = np.zeros(len(codes))
+    sales_value = np.zeros(len(codes))
+    stock_qty = np.zeros(len(codes))
+
+    if len(sale_codes):
+        positions = np.searchsorted(codes, sale_codes)
+        sold_qty[positions] = sales[:, 0]
+        sales_value[positions] = sales[:, 1]
+    if len(stock_codes):
+        stock_qty[np.searchsorted(codes, stock_codes)] = stock[:, 0]
+
+    days = max(1, date_diff(to_date, from_date) + 1)
+    daily_rotation = sold_qty / days
+    with np.errstate(divide="ignore", invalid="ignore"):
+        days_of_inventory = np.where(daily_rotation > 0, stock_qty / daily_rotation, np.inf)
+    abc = classify_abc(sales_value)
+
+    return [
+        {
+            "item_code": str(codes[i]),
+            "sold_qty": float(sold_qty[i]),
+            "sales_value": float(sales_value[i]),
+            "stock_qty": float(stock_qty[i]),
+            "daily_rotation": round(float(daily_rotation[i]), 4),
+            "days_of_inventory": None if np.isinf(days_of_inventory[i]) else round(float(days_of_inventory[i]), 1),
+            "abc": str(abc[i]),
+        }
+        for i in range(len(codes))
+    ]
+
+
+def get_inventory_rotation(company, from_date, to_date, scope=None):
+    # Usuarios con las mismas restricciones comparten la caché
+    key = CACHE_KEY.format(company=company, from_date=from_date, to_date=to_date, scope=scope.key if scope else "all")
+    rows = frappe.cache().get_value(key)
+    if rows is None:
+        rows = compute_inventory_rotation(company, from_date, to_date, scope)
+        frappe.cache().set_value(key, rows, expires_in_sec=CACHE_TTL)
+    return rows
+
+
+def get_rotation_report(company, period=None, from_date=None, to_date=None, order="lowest", limit=10, abc=None, scope=None):
+    from_date, to_date = get_period_dates(period, from_date, to_date)
+    rows = get_inventory_rotation(company, from_date, to_date, scope)
+
+    summary = {"A": 0, "B": 0, "C": 0}
+    for row in rows:
+        summary[row["abc"]] += 1
+
+    if abc:
+        rows = [row for row in rows if row["abc"] == abc.upper()]
+    # Con rotación más baja van primero los que tienen más existencias sin vender
+    if order == "highest":
+        rows = sorted(rows, key=lambda row: (-row["daily_rotation"], -row["sold_qty"]))
+    else:
+        rows = sorted(rows, key=lambda row: (row["daily_rotation"], -row["stock_qty"]))
+
+    return {
+        "company": company,
+        "from_date": str(from_date),
+        "to_date": str(to_date),
+        "total_items": sum(summary.values()),
+        "abc_summary": summary,
+        "items": rows[:limit],
+    }
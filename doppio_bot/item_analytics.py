@@ -0,0 +1,215 @@
+import json
+
+import frappe
+from frappe.utils import cint, flt, now_datetime
+
+
+ANALYTICS_DOCTYPE = "DoppioBot Item Analytics"
+CHUNK_SIZE = 1000
+
+
+def get_sales_summary(company, item_codes=None, conditions=""):
+    """
+    Ventas confirmadas de la empresa agrupadas por producto. Sin `item_codes` recorre
+    todo el catálogo. `conditions` son los fragmentos de permisos sobre `si` (ver data_access).
+    """
+    condition = "AND sii.item_code IN %(item_codes)s" if item_codes else ""
+    return frappe.db.sql(f"""
+        SELECT
+            sii.item_code,
+            COUNT(sii.name) AS sales_count,
+            SUM(sii.qty) AS total_qty,
+            AVG(sii.qty) AS avg_qty,
+            MIN(si.posting_date) AS first_sale_date,
+            MAX(si.posting_date) AS last_sale_date,
+            (SUM(sii.qty) / NULLIF(DATEDIFF(MAX(si.posting_date), MIN(si.posting_date)), 0)) AS daily_rotation
+        FROM
+            `tabSales Invoice Item` sii
+        JOIN
+            `tabSales Invoice` si ON sii.parent = si.name
+        WHERE
+            si.docstatus = 1
+            AND si.company = %(company)s
+            {condition}{conditions}
+        GROUP BY
+            sii.item_code
+    """, {"company": company, "item_codes": tuple(item_codes or ())}, as_dict=True)
+
+
+def get_top_customers(company, item_codes=None, conditions=""):
+    """
+    Cliente que más unidades ha comprado de cada producto en la empresa.
+    """
+    condition = "AND sii.item_code IN %(item_codes)s" if item_codes else ""
+    return frappe.db.sql(f"""
+        SELECT item_code, customer, qty
+        FROM (
+            SELECT
+                sii.item_code,
+                si.customer,
+                SUM(sii.qty) AS qty,
+                ROW_NUMBER() OVER (PARTITION BY sii.item_code ORDER BY SUM(sii.qty) DESC) AS position
+            FROM
+                `tabSales Invoice Item` sii
+            JOIN
+                `tabSales Invoice` si ON sii.parent = si.name
+            WHERE
+                si.docstatus = 1
+                AND si.company = %(company)s
+                {condition}{conditions}
+            GROUP BY
+                sii.item_code, si.customer
+        ) ranked
+        WHERE position = 1
+    """, {"company": company, "item_codes": tuple(item_codes or ())}, as_dict=True)
+
+
+def get_price_list_rates(item_codes=None, conditions=""):
+    condition = "AND ip.item_code IN %(item_codes)s" if item_codes else ""
+    return frappe.db.sql(f"""
+        SELECT ip.item_code, ip.price_list, ip.price_list_rate, ip.currency
+        FROM `tabItem Price` ip
+        WHERE 1 = 1
+            {condition}{conditions}
+    """, {"item_codes": tuple(item_codes or ())}, as_dict=True)
+
+
+def get_analytics_name(company, item_code):
+    # Igual que el autoname del doctype: una fila por empresa y producto
+    return f"{company}::{item_code}"
+
+
+def compute_item_analytics(company, item_codes=None, scope=None):
+    """
+    Calcula las filas de DoppioBot Item Analytics de la empresa para los productos
+    indicados (o para todos), con tres consultas agrupadas en lugar de tres por producto.
+    Con `scope` (PermissionScope) solo se cuentan los datos que el usuario puede ver.
+    """
+    rows = {}
+    sales_conditions = scope.sql(company="si.company", territory="si.territory") if scope else ""
+    price_conditions = scope.customer_sql("ip.customer") if scope else ""
+
+    def get_row(item_code):
+        return rows.setdefault(item_code, {
+            "company": company,
+            "item_code": item_code,
+            "sales_count": 0,
+            "total_qty": 0,
+            "avg_qty": 0,
+            "first_sale_date": None,
+            "last_sale_date": None,
+            "daily_rotation": None,
+            "top_customer": None,
+            "top_customer_qty": 0,
+            "price_list_rates": [],
+        })
+
+    # Los productos pedidos explícitamente quedan aunque ya no tengan ventas (p. ej. tras cancelar)
+    for item_code in item_codes or ():
+        get_row(item_code)
+
+    for summary in get_sales_summary(company, item_codes, sales_conditions):
+        get_row(summary.item_code).update(summary)
+
+    for top in get_top_customers(company, item_codes, sales_conditions):
+        get_row(top.item_code).update({"top_customer": top.customer, "top_customer_qty": top.qty})
+
+    for price in get_price_list_rates(item_codes, price_conditions):
+        get_row(price.item_code)["price_list_rates"].append({
+            "price_list": price.price_list,
+            "price_list_rate": price.price_list_rate,
+            "currency": price.currency,
+        })
+
+    return list(rows.values())
+
+
+def save_item_analytics(rows, commit=True):
+    fields = [
+        "name", "creation", "modified", "owner", "modified_by", "docstatus", "idx",
+        "company", "item_code", "sales_count", "total_qty", "avg_qty", "first_sale_date", "last_sale_date",
+        "daily_rotation", "top_customer", "top_customer_qty", "price_list_rates", "last_refreshed",
+    ]
+    now = now_datetime()
+    user = frappe.session.user
+
+    for start in range(0, len(rows), CHUNK_SIZE):
+        chunk = rows[start:start + CHUNK_SIZE]
+        names = [get_analytics_name(row["company"], row["item_code"]) for row in chunk]
+        values = [
+            (
+                get_analytics_name(row["company"], row["item_code"]), now, now, user, user, 0, 0,
+                row["company"], row["item_code"], cint(row["sales_count"]), flt(row["total_qty"]), flt(row["avg_qty"]),
+                row["first_sale_date"], row["last_sale_date"], row["daily_rotation"],
+                row["top_customer"], flt(row["top_customer_qty"]),
+                json.dumps(row["price_list_rates"], default=str), now,
+            )
+            for row in chunk
+        ]
+
+        frappe.db.delete(ANALYTICS_DOCTYPE, {"name": ("in", names)})
+        frappe.db.bulk_insert(ANALYTICS_DOCTYPE, fields, values)
+        if commit:
+            frappe.db.commit()
+
+
+def get_companies(companies=None):
+    return list(companies or frappe.get_all("Company", pluck="name"))
+
+
+def rebuild_item_analytics():
+    """
+    Tarea nocturna: recalcula las analíticas de todo el catálogo, empresa por empresa.
+    """
+    for company in get_companies():
+        rows = compute_item_analytics(company)
+        save_item_analytics(rows)
+
+        # Quitar filas de productos que ya no tienen ventas ni precios en la empresa
+        current = {get_analytics_name(company, row["item_code"]) for row in rows}
+        stale = [
+            name
+            for name in frappe.get_all(ANALYTICS_DOCTYPE, filters={"company": company}, pluck="name")
+            if name not in current
+        ]
+        for start in range(0, len(stale), CHUNK_SIZE):
+            frappe.db.delete(ANALYTICS_DOCTYPE, {"name": ("in", stale[start:start + CHUNK_SIZE])})
+        frappe.db.commit()
+
+
+def refresh_item_analytics(item_codes, companies=None):
+    item_codes = sorted(set(filter(None, item_codes)))
+    if not item_codes:
+        return
+    for company in get_companies(companies):
+        save_item_analytics(compute_item_analytics(company, item_codes))
+
+
+def enqueue_refresh(item_codes, companies=None):
+    frappe.enqueue(
+        "doppio_bot.item_analytics.refresh_item_analytics",
+        item_codes=list(item_codes),
+        companies=list(companies) if companies else None,
+        queue="short",
+        enqueue_after_commit=True,
+    )
+
+
+def on_sales_invoice_change(doc, method=None):
+    enqueue_refresh({item.item_code for item in doc.items}, [doc.company])
+
+
+def on_item_price_change(doc, method=None):
+    # Los precios no dependen de la empresa: se actualizan las filas de todas
+    enqueue_refresh({doc.item_code})
+
+
+def get_item_analytics(company, item_code):
+    """
+    Lectura por llave primaria de las analíticas precalculadas, o None si el
+    producto todavía no ha sido procesado en la empresa.
+    """
+    row = frappe.db.get_value(ANALYTICS_DOCTYPE, get_analytics_name(company, item_code), "*", as_dict=True)
+    if row:
+        row.price_list_rates = frappe.parse_json(row.price_list_rates or "[]")
+    return row
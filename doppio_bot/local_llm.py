@@ -0,0 +1,40 @@
+"""
+LLM de langchain sobre el modelo local (`doppiobot_local_model`), con
+reutilización del prefijo ya evaluado del prompt entre pasos y turnos.
+"""
+from typing import Any, List, Optional
+
+from langchain.llms.base import LLM
+from langchain.llms.utils import enforce_stop_tokens
+
+from doppio_bot.local_model import generate_text
+from doppio_bot.turn_control import MIN_TOOL_TIMEOUT, get_remaining_time
+
+
+# Inicio del historial en el prompt del agente conversacional de langchain: lo
+# anterior (instrucciones, herramientas y formato) es igual para todas las sesiones
+HISTORY_MARKER = "Previous conversation history:"
+
+
+class LocalLLM(LLM):
+    session_id: Optional[str] = None
+    max_new_tokens: Optional[int] = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "doppiobot_local"
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> str:
+        position = prompt.find(HISTORY_MARKER)
+        remaining = get_remaining_time()
+
+        text = generate_text(
+            prompt,
+            stop=stop,
+            session_id=self.session_id,
+            static_prefix=prompt[:position] if position > 0 else None,
+            max_new_tokens=self.max_new_tokens,
+            # La generación no puede pasar del plazo del turno
+            max_time=None if remaining is None else max(remaining, MIN_TOOL_TIMEOUT),
+        )
+        return enforce_stop_tokens(text, stop) if stop else text
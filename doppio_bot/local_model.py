@@ -0,0 +1,231 @@
+import copy
+import hashlib
+import threading
+from collections import OrderedDict
+
+import frappe
+from frappe.utils import nowdate
+
+
+# Modelo local opcional (ruta o nombre de Hugging Face en `doppiobot_local_model`
+# del site_config). Se carga una vez por proceso.
+_models = {}
+_lock = threading.Lock()
+
+# Estado evaluado (KV cache) de los prefijos de prompt, por proceso, con un tope
+# de memoria en `doppiobot_prompt_cache_mb`
+DEFAULT_PROMPT_CACHE_MB = 1024
+DEFAULT_MAX_NEW_TOKENS = 256
+# Aciertos del caché por día, para el reporte
+PROMPT_CACHE_STATS_KEY = "doppiobot:prompt_cache:{day}"
+PROMPT_CACHE_STATS_TTL = 60 * 60 * 24 * 35
+_prompt_cache = None
+
+
+def get_local_model_path():
+    return frappe.conf.get("doppiobot_local_model")
+
+
+def get_local_model():
+    """
+    (tokenizer, model) del modelo local configurado, o None si no hay ninguno.
+    """
+    path = get_local_model_path()
+    if not path:
+        return None
+
+    if path not in _models:
+        with _lock:
+            if path not in _models:
+                from transformers import AutoModelForCausalLM, AutoTokenizer
+
+                tokenizer = AutoTokenizer.from_pretrained(path)
+                model = AutoModelForCausalLM.from_pretrained(path)
+                model.eval()
+                _models[path] = (tokenizer, model)
+    return _models[path]
+
+
+class PromptCache:
+    """
+    KV cache de prefijos de prompt ya evaluados, con desalojo LRU por memoria.
+
+    Hay dos tipos de entrada: ("static", hash) para las instrucciones y la
+    descripción de herramientas, que comparten todas las sesiones, y
+    ("session", session_id) con el último prompt completo de cada sesión. Al
+    desalojar salen primero las sesiones menos usadas.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        # llave: (token_ids, kv_cache, bytes)
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def lookup(self, keys: list, token_ids: list):
+        """
+        (llave, kv_cache, tokens en común) de la entrada que comparte el prefijo
+        más largo con `token_ids`, o (None, None, 0).
+        """
+        best = (None, None, 0)
+        with self.lock:
+            for key in keys:
+                entry = self.entries.get(key)
+                if entry is None:
+                    continue
+                self.entries.move_to_end(key)
+                matched = common_prefix_length(entry[0], token_ids)
+                if matched > best[2]:
+                    best = (key, entry[1], matched)
+        return best
+
+    def store(self, key, token_ids: list, kv_cache):
+        size = get_kv_cache_size(kv_cache)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous:
+                self.size -= previous[2]
+            self.entries[key] = (list(token_ids), kv_cache, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                evicted = next((k for k in self.entries if k[0] == "session"), None) or next(iter(self.entries))
+                self.size -= self.entries.pop(evicted)[2]
+
+
+def common_prefix_length(a: list, b: list) -> int:
+    length = min(len(a), len(b))
+    for i in range(length):
+        if a[i] != b[i]:
+            return i
+    return length
+
+
+def get_kv_cache_size(kv_cache) -> int:
+    # transformers recientes guardan las capas en `layers`; antes, en key_cache/value_cache
+    layers = getattr(kv_cache, "layers", None)
+    if layers is not None:
+        tensors = [t for layer in layers for t in (layer.keys, layer.values) if t is not None]
+    else:
+        tensors = list(kv_cache.key_cache) + list(kv_cache.value_cache)
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+def get_prompt_cache() -> PromptCache:
+    global _prompt_cache
+    if _prompt_cache is None:
+        megabytes = frappe.conf.get("doppiobot_prompt_cache_mb") or DEFAULT_PROMPT_CACHE_MB
+        _prompt_cache = PromptCache(megabytes * 1024 * 1024)
+    return _prompt_cache
+
+
+def evaluate_prefix(model, token_ids: list):
+    import torch
+    from transformers import DynamicCache
+
+    with torch.no_grad():
+        output = model(input_ids=torch.tensor([token_ids]), past_key_values=DynamicCache(), use_cache=True)
+    return output.past_key_values
+
+
+def generate_text(prompt: str, stop=None, session_id=None, static_prefix=None, max_new_tokens=None, max_time=None) -> str:
+    """
+    Completa `prompt` con el modelo local evaluando solo los tokens que no están
+    en el caché: el prefijo estático (`static_prefix`, común a todas las
+    sesiones) y el prompt anterior de la sesión se reutilizan.
+    """
+    import torch
+
+    tokenizer, model = get_local_model()
+    prompt_cache = get_prompt_cache()
+    token_ids = tokenizer(prompt).input_ids
+
+    keys = []
+    static_hit = None
+    if static_prefix:
+        static_key = ("static", hashlib.sha1(static_prefix.encode()).hexdigest())
+        static_hit = static_key in prompt_cache
+        if not static_hit:
+            static_ids = tokenizer(static_prefix).input_ids
+            prompt_cache.store(static_key, static_ids, evaluate_prefix(model, static_ids))
+        keys.append(static_key)
+    if session_id:
+        keys.append(("session", session_id))
+
+    key, kv_cache, reused = prompt_cache.lookup(keys, token_ids)
+    # Al menos el último token se evalúa para obtener la siguiente predicción
+    reused = min(reused, len(token_ids) - 1)
+    if reused > 0:
+        # El caché guardado no se modifica: generate agrega tokens al que recibe
+        kv_cache = copy.deepcopy(kv_cache)
+        kv_cache.crop(reused)
+    else:
+        kv_cache = None
+
+    with torch.no_grad():
+        output = model.generate(
+            input_ids=torch.tensor([token_ids]),
+            attention_mask=torch.ones(1, len(token_ids), dtype=torch.long),
+            past_key_values=kv_cache,
+            max_new_tokens=max_new_tokens or DEFAULT_MAX_NEW_TOKENS,
+            do_sample=False,
+            stop_strings=stop or None,
+            tokenizer=tokenizer,
+            max_time=max_time,
+            return_dict_in_generate=True,
+        )
+
+    sequence = output.sequences[0].tolist()
+    if session_id:
+        # El caché devuelto cubre la secuencia salvo el último token generado
+        evaluated = output.past_key_values.get_seq_length()
+        prompt_cache.store(("session", session_id), sequence[:evaluated], output.past_key_values)
+
+    record_prompt_cache_stats(
+        prompt_tokens=len(token_ids),
+        reused_tokens=reused,
+        static_hit=static_hit,
+        session_hit=bool(key and key[0] == "session" and reused),
+        has_session=bool(session_id),
+    )
+    return tokenizer.decode(sequence[len(token_ids):], skip_special_tokens=True)
+
+
+def record_prompt_cache_stats(prompt_tokens, reused_tokens, static_hit, session_hit, has_session):
+    counters = {"calls": 1, "prompt_tokens": prompt_tokens, "reused_tokens": reused_tokens}
+    if static_hit is not None:
+        counters["static_hits" if static_hit else "static_misses"] = 1
+    if has_session:
+        counters["session_hits" if session_hit else "session_misses"] = 1
+
+    cache = frappe.cache()
+    key = cache.make_key(PROMPT_CACHE_STATS_KEY.format(day=nowdate()))
+    pipe = cache.pipeline()
+    for field, value in counters.items():
+        pipe.hincrby(key, field, value)
+    pipe.expire(key, PROMPT_CACHE_STATS_TTL)
+    pipe.execute()
+
+
+def get_prompt_cache_stats(day=None) -> dict:
+    """
+    Contadores de un día con las tasas de acierto del prefijo estático, de la
+    sesión y de tokens reutilizados sobre el total del prompt.
+    """
+    cache = frappe.cache()
+    key = cache.make_key(PROMPT_CACHE_STATS_KEY.format(day=day or nowdate()))
+    # hscan_iter lee el hash sin pasar por el pickle de RedisWrapper.hgetall
+    stats = {frappe.safe_decode(field): int(value) for field, value in cache.hscan_iter(key)}
+
+    def rate(hits, total):
+        return round(hits / total, 3) if total else None
+
+    stats["static_hit_rate"] = rate(stats.get("static_hits", 0), stats.get("static_hits", 0) + stats.get("static_misses", 0))
+    stats["session_hit_rate"] = rate(stats.get("session_hits", 0), stats.get("session_hits", 0) + stats.get("session_misses", 0))
+    stats["token_reuse_rate"] = rate(stats.get("reused_tokens", 0), stats.get("prompt_tokens", 0))
+    return stats
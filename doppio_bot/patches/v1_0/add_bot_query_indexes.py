@@ -0,0 +1,5 @@
+from doppio_bot.query_advisor import ensure_indexes
+
+
+def execute():
+    ensure_indexes()
@@ -0,0 +1,7 @@
+import frappe
+
+
+def execute():
+    # Las filas anteriores se nombraban solo por producto y sumaban todas las empresas
+    frappe.db.delete("DoppioBot Item Analytics", {"company": ("is", "not set")})
+    frappe.enqueue("doppio_bot.item_analytics.rebuild_item_analytics", queue="long", enqueue_after_commit=True)
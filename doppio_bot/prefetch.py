@@ -0,0 +1,158 @@
+import re
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+import frappe
+
+from doppio_bot.chat_context import get_current_turn
+from doppio_bot.report_export import export_skipped, exports_disabled
+
+
+# Mientras el LLM genera su primer paso, las consultas de solo lectura que
+# probablemente pedirá se ejecutan en un hilo con su propia conexión. Las
+# herramientas revisan primero estos resultados (ver get_prefetched). Solo se
+# anticipan lecturas sin efectos secundarios: nada de servicios externos (SAT)
+# ni archivos exportados.
+
+DEFAULT_WORKERS = 4
+MAX_PREFETCH_PER_TURN = 4
+# Si la consulta anticipada sigue en curso, la herramienta la espera en lugar de repetirla
+WAIT_SECONDS = 10
+
+# Códigos de producto: palabras con letras y al menos un dígito, p. ej. ITEM-001 o SKU1234
+ITEM_CODE_PATTERN = re.compile(r"\b(?=[\w\-./]*\d)[A-Za-z0-9][\w\-./]{2,}\b")
+# NIT de 9 caracteres (el último puede ser K) o CUI de 13 dígitos
+TAX_ID_PATTERN = re.compile(r"\b(\d{8}[\dkK]|\d{13})\b")
+CUSTOMER_PATTERN = re.compile(r"\bcliente\s+([\wÁÉÍÓÚÑáéíóúñ&.\- ]{3,60}?)(?=[,;:?!]|\.\s|\.$|$)", re.IGNORECASE)
+SALES_KEYWORDS = ("venta", "ventas", "vendido", "factura atrasada", "facturas atrasadas")
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=frappe.conf.get("doppiobot_prefetch_workers") or DEFAULT_WORKERS,
+            thread_name_prefix="doppiobot-prefetch",
+        )
+    return _executor
+
+
+def normalize_input(tool_name: str, tool_input) -> str:
+    """
+    Llave del resultado: el agente suele añadir comillas o espacios alrededor del valor.
+    Para get_info_customer solo cuentan el nombre del cliente y el campo pedido.
+    """
+    if tool_name == "get_info_customer":
+        try:
+            data = frappe.parse_json(tool_input) or {}
+            tool_input = f"{data.get('customer_name') or ''}|{data.get('field') or ''}"
+        except (ValueError, AttributeError):
+            pass
+    if tool_name == "get_sales_stats":
+        # La herramienta no usa su argumento
+        return ""
+    return str(tool_input or "").strip().strip("'\"`").strip().lower()
+
+
+def extract_entities(prompt_message: str) -> dict:
+    tax_ids = TAX_ID_PATTERN.findall(prompt_message)
+    return {
+        "item_codes": [
+            code for code in dict.fromkeys(ITEM_CODE_PATTERN.findall(prompt_message))
+            if code not in tax_ids and not code.isdigit()
+        ],
+        "tax_ids": list(dict.fromkeys(tax_ids)),
+        "customers": [name.strip() for name in CUSTOMER_PATTERN.findall(prompt_message)],
+        "sales": any(keyword in prompt_message.lower() for keyword in SALES_KEYWORDS),
+    }
+
+
+def plan_prefetch(prompt_message: str) -> list:
+    """
+    [(herramienta, argumento)] de las consultas de solo lectura que el agente
+    probablemente hará para este mensaje.
+    """
+    entities = extract_entities(prompt_message)
+    # Los NIT/CUI solo sirven para no confundirlos con códigos de producto
+    plan = [("get_item_stats", code) for code in entities["item_codes"]]
+    plan += [("get_info_customer", frappe.as_json({"customer_name": name})) for name in entities["customers"]]
+    if entities["sales"]:
+        plan.append(("get_sales_stats", ""))
+    return plan[:MAX_PREFETCH_PER_TURN]
+
+
+def is_worth_running(tool_name: str, tool_input: str) -> bool:
+    # Un código que no existe como producto no se consulta: el agente no lo pedirá
+    if tool_name == "get_item_stats":
+        return bool(frappe.db.exists("Item", tool_input))
+    return True
+
+
+def run_prefetch(site, sites_path, user, turn, tool_name, func, tool_input):
+    frappe.init(site=site, sites_path=sites_path)
+    try:
+        frappe.connect()
+        frappe.set_user(user)
+        # Mismo turno y empresa que la petición; sin resultados anticipados propios
+        frappe.local.doppiobot_turn = turn
+        if not is_worth_running(tool_name, tool_input):
+            return None
+        with exports_disabled():
+            result = func(tool_input)
+        # Si el resultado necesitaba un archivo exportado, la herramienta lo genera cuando el agente la pida
+        return None if export_skipped() else result
+    finally:
+        frappe.destroy()
+
+
+def start_prefetch(prompt_message: str, tools: list):
+    """
+    Lanza en segundo plano las consultas previstas y deja sus futures en la caché
+    de la petición. Se llama después de start_turn, para heredar empresa y turno.
+    """
+    frappe.local.doppiobot_prefetch = {}
+    if frappe.conf.get("doppiobot_prefetch_workers") == 0:
+        return
+
+    tools_by_name = {tool.name: tool for tool in tools}
+    for tool_name, tool_input in plan_prefetch(prompt_message):
+        if tool_name not in tools_by_name:
+            continue
+        frappe.local.doppiobot_prefetch[(tool_name, normalize_input(tool_name, tool_input))] = get_executor().submit(
+            run_prefetch,
+            frappe.local.site,
+            frappe.local.sites_path,
+            frappe.session.user,
+            dict(get_current_turn() or {}),
+            tool_name,
+            tools_by_name[tool_name].func,
+            tool_input,
+        )
+
+
+def get_prefetched(tool_name: str, tool_input):
+    """
+    Resultado anticipado de la herramienta para este argumento, o None si no
+    se anticipó, falló o tardó demasiado (en ese caso la herramienta consulta normal).
+    """
+    futures = getattr(frappe.local, "doppiobot_prefetch", None)
+    future = futures and futures.get((tool_name, normalize_input(tool_name, tool_input)))
+    if not future:
+        return None
+    try:
+        return future.result(timeout=WAIT_SECONDS)
+    except TimeoutError:
+        return None
+    except Exception as e:
+        frappe.logger("doppio_bot").warning(f"Prefetch de {tool_name} falló: {e}")
+        return None
+
+
+def cancel_prefetch():
+    """
+    Descarta las consultas anticipadas del turno que todavía no empezaron.
+    """
+    for future in (getattr(frappe.local, "doppiobot_prefetch", None) or {}).values():
+        future.cancel()
+    frappe.local.doppiobot_prefetch = {}
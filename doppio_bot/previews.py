@@ -0,0 +1,28 @@
+import frappe
+
+
+PREVIEW_KEY = "doppiobot:preview:{user}:{token}"
+PREVIEW_TTL = 60 * 30
+
+
+def get_preview_key(token: str) -> str:
+    # La llave incluye al usuario para que nadie más pueda confirmar su vista previa
+    return PREVIEW_KEY.format(user=frappe.session.user, token=token)
+
+
+def cache_preview(doc) -> str:
+    """
+    Guarda un documento ya calculado (sin insertar) y devuelve el token para confirmarlo.
+    """
+    token = frappe.generate_hash(length=10)
+    frappe.cache().set_value(get_preview_key(token), {"doc": doc.as_dict()}, expires_in_sec=PREVIEW_TTL)
+    return token
+
+
+def get_preview(token: str):
+    return frappe.cache().get_value(get_preview_key(token))
+
+
+def mark_preview_confirmed(token: str, name: str):
+    # Se conserva el nombre creado para que una segunda confirmación no inserte otra vez
+    frappe.cache().set_value(get_preview_key(token), {"confirmed": name}, expires_in_sec=PREVIEW_TTL)
@@ -1,9 +1,33 @@
 import * as React from "react";
-import { nanoid } from 'nanoid'
+import { useState } from "react";
+import { nanoid } from "nanoid";
 
 import ChatView from "./ChatView";
 
+// La última conversación se retoma al recargar la página
+const SESSION_STORAGE_KEY = "doppiobot:session_id";
+
+const getInitialSessionID = () => {
+  const sessionID = localStorage.getItem(SESSION_STORAGE_KEY) || nanoid();
+  localStorage.setItem(SESSION_STORAGE_KEY, sessionID);
+  return sessionID;
+};
+
 export function App() {
-	// Unique sessionID for chat memory/history
-	return <ChatView sessionID={nanoid()} />;
+  // Unique sessionID for chat memory/history
+  const [sessionID, setSessionID] = useState(getInitialSessionID);
+
+  const selectSession = (newSessionID) => {
+    localStorage.setItem(SESSION_STORAGE_KEY, newSessionID);
+    setSessionID(newSessionID);
+  };
+
+  return (
+    <ChatView
+      key={sessionID}
+      sessionID={sessionID}
+      onSelectSession={selectSession}
+      onNewSession={() => selectSession(nanoid())}
+    />
+  );
 }
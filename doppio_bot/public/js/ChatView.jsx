@@ -1,7 +1,6 @@
 import {
   Flex,
   IconButton,
-  VStack,
   Box,
   Card,
   CardBody,
@@ -10,11 +9,38 @@ import {
   Textarea,
   Text,
 } from "@chakra-ui/react";
-import { SendIcon } from "lucide-react";
-import React, { useState } from "react";
-import Message from "./components/message/Message";
+import { PaperclipIcon, SendIcon, SquareIcon } from "lucide-react";
+import React, { useEffect, useLayoutEffect, useRef, useState } from "react";
+import { nanoid } from "nanoid";
+import MessageList from "./components/MessageList";
+import SessionPicker from "./components/SessionPicker";
 
-const ChatView = ({ sessionID }) => {
+const HISTORY_PAGE_SIZE = 20;
+// Eventos de frappe.publish_realtime de los procesos en segundo plano del bot:
+// un mensaje por proceso que se actualiza en su lugar
+const BACKGROUND_EVENTS = {
+  // Avance de las importaciones de archivos (file_import.py)
+  doppiobot_import_progress: {
+    getMessageID: (progress) => `import-${progress.import_id}`,
+    format: (progress) => formatImportProgress(progress),
+  },
+  // Certificación FEL de las facturas creadas por el bot (fel_queue.py)
+  doppiobot_fel_status: {
+    getMessageID: (status) => `fel-${status.sales_invoice}`,
+    format: (status) => formatFELStatus(status),
+  },
+};
+// Distancia al borde superior (px) a partir de la cual se carga la página anterior
+const LOAD_MORE_THRESHOLD = 80;
+
+const welcomeMessage = {
+  id: "welcome",
+  from: "ai",
+  isLoading: false,
+  content: "Hazme una pregunta",
+};
+
+const ChatView = ({ sessionID, onSelectSession, onNewSession }) => {
   // from Frappe!
   const userImageURL = frappe.user.image();
   const userFullname = frappe.user.full_name();
@@ -22,25 +48,130 @@ const ChatView = ({ sessionID }) => {
   const toast = useToast();
   const [promptMessage, setPromptMessage] = useState("");
 
-  const [messages, setMessages] = useState([
-    {
-      from: "ai",
-      isLoading: false,
-      content: "Hazme una pregunta",
-    },
-  ]);
+  const [messages, setMessages] = useState([welcomeMessage]);
+  // Respuesta en curso: mientras exista, el botón de enviar pasa a ser el de detener
+  const [pendingResponseID, setPendingResponseID] = useState(null);
+
+  // Paginación del historial guardado: cursor del mensaje más antiguo cargado
+  const [historyCursor, setHistoryCursor] = useState(null);
+  const [hasMoreHistory, setHasMoreHistory] = useState(false);
+  const [isLoadingHistory, setIsLoadingHistory] = useState(false);
+  const chatAreaRef = useRef(null);
+  // Altura antes de anteponer una página, para mantener la posición del scroll
+  const scrollHeightBeforePrepend = useRef(null);
+
+  const loadHistoryPage = (before) => {
+    setIsLoadingHistory(true);
+    return frappe
+      .call("doppio_bot.chat_history.get_messages", {
+        session_id: sessionID,
+        before: before,
+        limit: HISTORY_PAGE_SIZE,
+      })
+      .then(({ message: page }) => {
+        const olderMessages = page.messages.map((message) => ({
+          id: `db-${message.id}`,
+          from: message.role,
+          content: message.content,
+          isLoading: false,
+        }));
+
+        if (before && chatAreaRef.current) {
+          scrollHeightBeforePrepend.current = chatAreaRef.current.scrollHeight;
+        }
+        setMessages((old) => {
+          const current = old.filter((message) => message.id !== "welcome");
+          const merged = [...olderMessages, ...current];
+          return merged.length ? merged : [welcomeMessage];
+        });
+        setHistoryCursor(page.cursor);
+        setHasMoreHistory(page.has_more);
+      })
+      .finally(() => setIsLoadingHistory(false));
+  };
+
+  // Al abrir la conversación solo se cargan los mensajes más recientes
+  useEffect(() => {
+    loadHistoryPage(null).then(() => {
+      if (chatAreaRef.current) {
+        chatAreaRef.current.scrollTop = chatAreaRef.current.scrollHeight;
+      }
+    });
+  }, [sessionID]);
+
+  useLayoutEffect(() => {
+    const chatArea = chatAreaRef.current;
+    if (chatArea && scrollHeightBeforePrepend.current !== null) {
+      chatArea.scrollTop += chatArea.scrollHeight - scrollHeightBeforePrepend.current;
+      scrollHeightBeforePrepend.current = null;
+    }
+  }, [messages]);
+
+  useEffect(() => {
+    const handlers = Object.entries(BACKGROUND_EVENTS).map(
+      ([event, { getMessageID, format }]) => {
+        const handler = (payload) => {
+          if (payload.session_id && payload.session_id !== sessionID) {
+            return;
+          }
+          const updatedMessage = {
+            id: getMessageID(payload),
+            from: "ai",
+            content: format(payload),
+            isLoading: false,
+          };
+          setMessages((old) =>
+            old.some((message) => message.id === updatedMessage.id)
+              ? old.map((message) =>
+                  message.id === updatedMessage.id ? updatedMessage : message
+                )
+              : [...old, updatedMessage]
+          );
+        };
+        frappe.realtime.on(event, handler);
+        return [event, handler];
+      }
+    );
+    return () =>
+      handlers.forEach(([event, handler]) => frappe.realtime.off(event, handler));
+  }, [sessionID]);
+
+  const handleAttachFile = () => {
+    new frappe.ui.FileUploader({
+      allow_multiple: false,
+      make_attachments_public: false,
+      restrictions: { allowed_file_types: [".csv", ".xlsx"] },
+      on_success: (file) => {
+        setPromptMessage((old) =>
+          `${old}\nArchivo adjunto: ${file.file_url}`.trim()
+        );
+      },
+    });
+  };
+
+  const handleChatAreaScroll = (event) => {
+    if (
+      event.currentTarget.scrollTop < LOAD_MORE_THRESHOLD &&
+      hasMoreHistory &&
+      !isLoadingHistory
+    ) {
+      loadHistoryPage(historyCursor);
+    }
+  };
 
   const handleSendMessage = () => {
     if (!promptMessage.trim().length) {
       return;
     }
 
+    const responseID = nanoid();
     setMessages((old) => [
       ...old,
-      { from: "human", content: promptMessage, isLoading: false },
-      { from: "ai", content: "", isLoading: true },
+      { id: nanoid(), from: "human", content: promptMessage, isLoading: false },
+      { id: responseID, from: "ai", content: "", isLoading: true },
     ]);
     setPromptMessage("");
+    setPendingResponseID(responseID);
 
     frappe
       .call("doppio_bot.api.get_chatbot_response", {
@@ -48,17 +179,19 @@ const ChatView = ({ sessionID }) => {
         session_id: sessionID,
       })
       .then((response) => {
-        setMessages((old) => {
-          old.splice(old.length - 1, 1, {
-            from: "ai",
-            content: response.message,
-            isLoading: false,
-          });
-          return [...old];
-        });
+        // Solo se reemplaza la respuesta pendiente; los demás mensajes conservan su identidad
+        setMessages((old) =>
+          old.map((message) =>
+            message.id === responseID
+              ? { ...message, content: response.message, isLoading: false }
+              : message
+          )
+        );
+        setPendingResponseID(null);
       })
       .catch((e) => {
         console.error(e);
+        setPendingResponseID(null);
         toast({
           title: "Something went wrong, check console",
           status: "error",
@@ -67,6 +200,11 @@ const ChatView = ({ sessionID }) => {
       });
   };
 
+  const handleCancelResponse = () => {
+    // El servidor detiene el turno en el siguiente paso del agente y responde por la llamada pendiente
+    frappe.call("doppio_bot.api.cancel_chat_turn", { session_id: sessionID });
+  };
+
   return (
     <Flex
       direction={"column"}
@@ -75,9 +213,18 @@ const ChatView = ({ sessionID }) => {
       maxWidth={"4xl"}
       mx={"auto"}
     >
-      <Text fontSize="xl" fontWeight={"bold"} textColor={"gray.700"}>Pregúntale a Cube Bot</Text>
+      <Flex justify={"space-between"} alignItems={"center"} mb={"1.5"}>
+        <Text fontSize="xl" fontWeight={"bold"} textColor={"gray.700"}>Pregúntale a Cube Bot</Text>
+        <SessionPicker
+          sessionID={sessionID}
+          onSelectSession={onSelectSession}
+          onNewSession={onNewSession}
+        />
+      </Flex>
       {/* Chat Area */}
       <Box
+        ref={chatAreaRef}
+        onScroll={handleChatAreaScroll}
         width={"100%"}
         height={"100%"}
         overflowY="scroll"
@@ -85,11 +232,7 @@ const ChatView = ({ sessionID }) => {
         rounded={"md"}
         backgroundColor={"white"}
       >
-        <VStack spacing={2} align="stretch" p={"2"}>
-          {messages.map((message) => {
-            return <Message key={message.content} message={message} />;
-          })}
-        </VStack>
+        <MessageList messages={messages} scrollRef={chatAreaRef} />
       </Box>
 
       {/* Prompt Area */}
@@ -102,7 +245,7 @@ const ChatView = ({ sessionID }) => {
               value={promptMessage}
               onChange={(event) => setPromptMessage(event.target.value)}
               onKeyDown={(event) => {
-                if (event.code == "Enter" && event.metaKey && promptMessage) {
+                if (event.code == "Enter" && event.metaKey && promptMessage && !pendingResponseID) {
                   handleSendMessage();
                   setPromptMessage("");
                 }
@@ -110,12 +253,29 @@ const ChatView = ({ sessionID }) => {
               placeholder="Escribe tu pregunta acá..."
             />
 
-            {/* Send Button */}
+            {/* Attach Button */}
             <IconButton
-              aria-label="Send Prompt Message"
-              icon={<SendIcon height={16} />}
-              onClick={handleSendMessage}
+              aria-label="Attach File"
+              variant={"outline"}
+              icon={<PaperclipIcon height={16} />}
+              onClick={handleAttachFile}
             />
+
+            {/* Send / Stop Button */}
+            {pendingResponseID ? (
+              <IconButton
+                aria-label="Stop Response"
+                colorScheme={"red"}
+                icon={<SquareIcon height={16} />}
+                onClick={handleCancelResponse}
+              />
+            ) : (
+              <IconButton
+                aria-label="Send Prompt Message"
+                icon={<SendIcon height={16} />}
+                onClick={handleSendMessage}
+              />
+            )}
           </Flex>
         </CardBody>
       </Card>
@@ -123,4 +283,40 @@ const ChatView = ({ sessionID }) => {
   );
 };
 
+const formatImportProgress = (progress) => {
+  const lines = [
+    `**Importación ${progress.import_id}** (${progress.target}): ${progress.status}`,
+    `Procesadas ${progress.processed}, importadas ${progress.imported}, con error ${progress.failed}.`,
+  ];
+  if (progress.error) {
+    lines.push(`Error: ${progress.error}`);
+  }
+  if (progress.error_report) {
+    lines.push(`[Descargar reporte de errores](${progress.error_report})`);
+  }
+  return lines.join("\n\n");
+};
+
+const FEL_STATUS_LABELS = {
+  Queued: "en cola",
+  Processing: "en proceso",
+  Certified: "certificada",
+  Failed: "fallida",
+};
+
+const formatFELStatus = (status) => {
+  const lines = [
+    `**Factura ${status.sales_invoice}**: certificación FEL ${
+      FEL_STATUS_LABELS[status.status] || status.status
+    } (intento ${status.attempts}).`,
+  ];
+  if (status.status === "Queued" && status.next_attempt_at) {
+    lines.push(`Próximo reintento: ${status.next_attempt_at}`);
+  }
+  if (status.error && status.status !== "Certified") {
+    lines.push(`Error: ${status.error}`);
+  }
+  return lines.join("\n\n");
+};
+
 export default ChatView;
@@ -0,0 +1,154 @@
+import * as React from "react";
+import {
+  useCallback,
+  useEffect,
+  useLayoutEffect,
+  useMemo,
+  useRef,
+  useState,
+} from "react";
+
+import { Box, Flex } from "@chakra-ui/react";
+
+import Message from "./message/Message";
+
+// Altura (px) de un mensaje que todavía no se ha medido
+const ESTIMATED_ROW_HEIGHT = 96;
+// Alto (px) que se renderiza por encima y por debajo de la parte visible
+const OVERSCAN = 800;
+
+// Primer índice cuya fila termina después de `position`
+const findRowAt = (offsets, position) => {
+  let low = 0;
+  let high = offsets.length - 2;
+  while (low < high) {
+    const middle = (low + high) >> 1;
+    if (offsets[middle + 1] <= position) {
+      low = middle + 1;
+    } else {
+      high = middle;
+    }
+  }
+  return Math.max(low, 0);
+};
+
+const MeasuredRow = React.memo(({ message, onResize }) => {
+  const rowRef = useRef(null);
+
+  useLayoutEffect(() => {
+    const row = rowRef.current;
+    onResize(message.id, row.offsetHeight);
+    const observer = new ResizeObserver(() =>
+      onResize(message.id, row.offsetHeight)
+    );
+    observer.observe(row);
+    return () => observer.disconnect();
+  }, [message.id, onResize]);
+
+  return (
+    <Flex ref={rowRef} direction={"column"} pb={"2"}>
+      <Message message={message} />
+    </Flex>
+  );
+});
+
+/**
+ * Lista con ventana: solo se montan los mensajes cercanos a la parte visible
+ * de `scrollRef`; el resto se reemplaza por espacio con su altura medida (o
+ * estimada si nunca se mostró).
+ */
+const MessageList = ({ messages, scrollRef }) => {
+  // Alturas medidas por id de mensaje; sobreviven a que la fila se desmonte
+  const heights = useRef(new Map());
+  const [measureVersion, setMeasureVersion] = useState(0);
+  const [viewport, setViewport] = useState({ scrollTop: 0, height: 0 });
+  // Corrección de scroll pendiente por filas medidas arriba de la vista
+  const pendingScrollDelta = useRef(0);
+  const anchorIndex = useRef(0);
+  const indexById = useRef(new Map());
+
+  const offsets = useMemo(() => {
+    const result = [0];
+    indexById.current = new Map();
+    messages.forEach((message, index) => {
+      indexById.current.set(message.id, index);
+      const height = heights.current.get(message.id) ?? ESTIMATED_ROW_HEIGHT;
+      result.push(result[index] + height);
+    });
+    return result;
+  }, [messages, measureVersion]);
+
+  useEffect(() => {
+    const scrollArea = scrollRef.current;
+    if (!scrollArea) {
+      return;
+    }
+    const updateViewport = () =>
+      setViewport({
+        scrollTop: scrollArea.scrollTop,
+        height: scrollArea.clientHeight,
+      });
+    updateViewport();
+    scrollArea.addEventListener("scroll", updateViewport, { passive: true });
+    const observer = new ResizeObserver(updateViewport);
+    observer.observe(scrollArea);
+    return () => {
+      scrollArea.removeEventListener("scroll", updateViewport);
+      observer.disconnect();
+    };
+  }, [scrollRef]);
+
+  const handleRowResize = useCallback((id, height) => {
+    const previous = heights.current.get(id) ?? ESTIMATED_ROW_HEIGHT;
+    if (height === heights.current.get(id)) {
+      return;
+    }
+    heights.current.set(id, height);
+    // Una fila que cambia de alto arriba de la vista no debe mover lo que se está leyendo
+    if (indexById.current.get(id) < anchorIndex.current) {
+      pendingScrollDelta.current += height - previous;
+    }
+    setMeasureVersion((version) => version + 1);
+  }, []);
+
+  useLayoutEffect(() => {
+    if (pendingScrollDelta.current && scrollRef.current) {
+      scrollRef.current.scrollTop += pendingScrollDelta.current;
+    }
+    pendingScrollDelta.current = 0;
+  }, [offsets]);
+
+  // Los mensajes que ya no existen (otra conversación) no guardan su altura
+  useEffect(() => {
+    for (const id of heights.current.keys()) {
+      if (!indexById.current.has(id)) {
+        heights.current.delete(id);
+      }
+    }
+  }, [messages]);
+
+  anchorIndex.current = findRowAt(offsets, viewport.scrollTop);
+  const first = findRowAt(offsets, viewport.scrollTop - OVERSCAN);
+  const last = findRowAt(
+    offsets,
+    viewport.scrollTop + viewport.height + OVERSCAN
+  );
+  const end = Math.min(last + 1, messages.length);
+  const totalHeight = offsets[offsets.length - 1];
+
+  return (
+    <Box p={"2"}>
+      <Box height={`${offsets[first]}px`} />
+      {messages.slice(first, end).map((message) => (
+        <MeasuredRow
+          key={message.id}
+          message={message}
+          onResize={handleRowResize}
+        />
+      ))}
+      <Box height={`${totalHeight - offsets[end]}px`} />
+    </Box>
+  );
+};
+
+export default MessageList;
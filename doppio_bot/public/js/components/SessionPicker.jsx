@@ -0,0 +1,47 @@
+import * as React from "react";
+import { useEffect, useState } from "react";
+
+import { Button, Flex, Select } from "@chakra-ui/react";
+import { PlusIcon } from "lucide-react";
+
+const SessionPicker = ({ sessionID, onSelectSession, onNewSession }) => {
+  const [sessions, setSessions] = useState([]);
+
+  useEffect(() => {
+    frappe
+      .call("doppio_bot.chat_history.get_sessions")
+      .then((response) => setSessions(response.message || []));
+  }, [sessionID]);
+
+  const isSavedSession = sessions.some(
+    (session) => session.session_id === sessionID
+  );
+
+  return (
+    <Flex gap={"1.5"} alignItems={"center"}>
+      <Select
+        size={"sm"}
+        maxWidth={"xs"}
+        value={sessionID}
+        onChange={(event) => onSelectSession(event.target.value)}
+      >
+        {!isSavedSession && <option value={sessionID}>Nueva conversación</option>}
+        {sessions.map((session) => (
+          <option key={session.session_id} value={session.session_id}>
+            {session.title || session.session_id}
+          </option>
+        ))}
+      </Select>
+      <Button
+        size={"sm"}
+        variant={"outline"}
+        leftIcon={<PlusIcon size={"14"} />}
+        onClick={onNewSession}
+      >
+        Nueva
+      </Button>
+    </Flex>
+  );
+};
+
+export default SessionPicker;
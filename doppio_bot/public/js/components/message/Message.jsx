@@ -4,10 +4,11 @@ import MessageBubble from "./MessageBubble";
 import MessageRenderer from "./MessageRenderer";
 import MessageLoadingSkeletonText from "./MessageLoadingSkeletonText";
 
-const Message = ({ message }) => {
+// Solo se vuelve a renderizar cuando cambia el propio mensaje
+const Message = React.memo(({ message }) => {
   const fromAI = message.from === "ai";
   return (
-    <MessageBubble key={message.content} fromAI={fromAI}>
+    <MessageBubble fromAI={fromAI}>
       {!message.isLoading ? (
         <MessageRenderer content={message.content} />
       ) : (
@@ -15,6 +16,6 @@ const Message = ({ message }) => {
       )}
     </MessageBubble>
   );
-};
+});
 
 export default Message;
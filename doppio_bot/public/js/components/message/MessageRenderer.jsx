@@ -10,6 +10,7 @@ import {
   Td,
   Th,
   Image,
+  Link,
   Heading,
   ListItem,
   UnorderedList,
@@ -24,16 +25,35 @@ import { atomDark } from "react-syntax-highlighter/dist/esm/styles/prism";
 
 import CopyToClipboardButton from "./CopyToClipboardButton";
 
-const MessageRenderer = ({ content }) => {
+const remarkPlugins = [remarkGfm];
+const rehypePlugins = [rehypeRaw];
+
+// El markdown se interpreta una sola vez por contenido, no en cada render de la lista
+const MessageRenderer = React.memo(({ content }) => {
+  return React.useMemo(
+    () => (
+      <ReactMarkdown
+        children={content}
+        components={markdownRenderComponentOverrides}
+        remarkPlugins={remarkPlugins}
+        rehypePlugins={rehypePlugins}
+      />
+    ),
+    [content]
+  );
+});
+
+const CodeBlock = React.memo(({ language, codeString }) => {
   return (
-    <ReactMarkdown
-      children={content}
-      components={markdownRenderComponentOverrides}
-      remarkPlugins={[remarkGfm]}
-      rehypePlugins={[rehypeRaw]}
+    <SyntaxHighlighter
+      children={codeString}
+      codeString={codeString}
+      style={atomDark}
+      language={language}
+      PreTag={PreWithClickToCopyButton}
     />
   );
-};
+});
 
 const markdownRenderComponentOverrides = {
   p: ({ node, ...props }) => <Text color="white" mb="0" {...props} />,
@@ -49,6 +69,10 @@ const markdownRenderComponentOverrides = {
       <Table p={"1"} size={"sm"} variant={"simple"} {...props} />
     </TableContainer>
   ),
+  // Enlaces de descarga de los reportes exportados por las herramientas
+  a: ({ node, ...props }) => (
+    <Link color="blue.200" textDecoration="underline" isExternal {...props} />
+  ),
   img: ({ node, ...props }) => (
     <Image rounded={"sm"} boxSize={"32"} objectFit={"cover"} {...props} />
   ),
@@ -60,16 +84,9 @@ const markdownRenderComponentOverrides = {
   code({ node, inline, className, children, ...props }) {
     const match = /language-(\w+)/.exec(className || "");
     const codeString = String(children).replace(/\n$/, "");
+    // PreTag estable y bloque memoizado: el resaltado no se repite si el código no cambia
     return !inline && match ? (
-      <SyntaxHighlighter
-        {...props}
-        children={codeString}
-        style={atomDark}
-        language={match[1]}
-        PreTag={(props) => (
-          <PreWithClickToCopyButton codeString={codeString} {...props} />
-        )}
-      />
+      <CodeBlock language={match[1]} codeString={codeString} />
     ) : (
       <code {...props} className={className}>
         {children}
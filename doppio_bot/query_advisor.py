@@ -0,0 +1,152 @@
+"""
+Índices compuestos para las consultas del bot y diagnóstico con EXPLAIN.
+
+    bench --site <sitio> doppiobot-explain-queries --item <código> --customer <cliente>
+"""
+from collections import defaultdict
+from contextlib import contextmanager
+
+import frappe
+
+from doppio_bot import tools
+from doppio_bot.chat_context import start_turn
+from doppio_bot.companies import resolve_company
+from doppio_bot.inventory_analytics import compute_inventory_rotation, get_period_dates
+from doppio_bot.item_analytics import compute_item_analytics
+from doppio_bot.report_export import exports_disabled
+
+
+# (doctype, columnas, nombre del índice)
+BOT_INDEXES = (
+    # Ventas por producto: GROUP BY item_code con JOIN a la factura por parent
+    ("Sales Invoice Item", ["item_code", "parent"], "doppiobot_item_code_parent"),
+    # Estadísticas de ventas: empresa + docstatus, ordenado o acotado por fecha
+    ("Sales Invoice", ["company", "docstatus", "posting_date"], "doppiobot_company_docstatus_posting"),
+    # Series disponibles más antiguas de un producto
+    ("Serial No", ["item_code", "status", "creation"], "doppiobot_item_code_status_creation"),
+    ("Item Price", ["item_code", "price_list"], "doppiobot_item_code_price_list"),
+    ("Bin", ["item_code", "warehouse"], "doppiobot_item_code_warehouse"),
+)
+
+# Un EXPLAIN con estos tipos de acceso recorre toda la tabla o todo un índice
+FULL_SCAN_TYPES = ("ALL", "index")
+MIN_FLAGGED_ROWS = 1000
+
+
+def get_index_columns(doctype: str) -> dict:
+    """
+    {nombre del índice: [columnas en orden]} de la tabla del doctype.
+    """
+    indexes = defaultdict(list)
+    for row in frappe.db.sql(f"SHOW INDEX FROM `tab{doctype}`", as_dict=True):
+        indexes[row.Key_name].append((row.Seq_in_index, row.Column_name))
+    return {name: [column for _seq, column in sorted(columns)] for name, columns in indexes.items()}
+
+
+def is_covered(doctype: str, columns: list) -> bool:
+    # Un índice existente que empieza por las mismas columnas ya sirve (p. ej. el único de Bin)
+    return any(
+        existing[:len(columns)] == columns
+        for existing in get_index_columns(doctype).values()
+    )
+
+
+def ensure_indexes():
+    """
+    Crea los índices de BOT_INDEXES que falten. Devuelve los nombres creados.
+    """
+    created = []
+    for doctype, columns, index_name in BOT_INDEXES:
+        if not frappe.db.table_exists(doctype) or is_covered(doctype, columns):
+            continue
+        frappe.db.add_index(doctype, columns, index_name)
+        created.append(index_name)
+    return created
+
+
+@contextmanager
+def capture_queries():
+    """
+    Registra todas las consultas que pasan por frappe.db.sql, ya con sus valores.
+    """
+    queries = []
+    original_sql = frappe.db.sql
+
+    def sql(query, values=(), *args, **kwargs):
+        queries.append(frappe.db.mogrify(query, values) if values else query)
+        return original_sql(query, values, *args, **kwargs)
+
+    frappe.db.sql = sql
+    try:
+        yield queries
+    finally:
+        frappe.db.sql = original_sql
+
+
+def explain(query: str, min_rows=MIN_FLAGGED_ROWS) -> dict:
+    plan = frappe.db.sql(f"EXPLAIN {query}", as_dict=True)
+    full_scans = [
+        {"table": step.table, "type": step.type, "rows": step.rows, "possible_keys": step.possible_keys}
+        for step in plan
+        if step.type in FULL_SCAN_TYPES and (step.rows or 0) >= min_rows
+    ]
+    return {"query": " ".join(str(query).split()), "plan": plan, "full_scans": full_scans}
+
+
+def get_tool_exercises(company, item=None, customer=None):
+    """
+    Llamadas de solo lectura que cubren las consultas que emiten las herramientas del agente.
+    Las herramientas que crean documentos se cubren construyendo la factura en memoria,
+    con las mismas búsquedas, sin insertarla ni guardar la vista previa en Redis.
+    """
+    from_date, to_date = get_period_dates("quarter")
+    exercises = [
+        ("get_sales_stats", lambda: tools.get_sales_stats(customer or "")),
+        ("inventory_rotation", lambda: compute_inventory_rotation(company, from_date, to_date)),
+    ]
+    if item:
+        exercises += [
+            ("get_item_stats", lambda: tools.get_item_stats(item)),
+            ("item_analytics", lambda: compute_item_analytics(company, [item])),
+        ]
+    if customer:
+        exercises.append(("get_info_customer", lambda: tools.get_info_customer(frappe.as_json({"customer_name": customer}))))
+    if item and customer:
+        invoice = {"customer": customer, "items": [{"item_code": item, "qty": 1, "rate": 1}]}
+        exercises.append(("preview_sales_invoice", lambda: build_invoice_preview(frappe.as_json(invoice))))
+    return exercises
+
+
+def build_invoice_preview(invoice_data: str):
+    # Lo mismo que preview_sales_invoice, sin cache_preview
+    data, company_config = tools.parse_sales_invoice_data(invoice_data)
+    invoice = tools.build_sales_invoice(data, company_config)
+    invoice.set_missing_values()
+    invoice.calculate_taxes_and_totals()
+    return invoice
+
+
+def explain_tool_queries(company=None, item=None, customer=None, min_rows=MIN_FLAGGED_ROWS):
+    """
+    Ejecuta las herramientas con datos de ejemplo, captura sus SELECT y devuelve
+    el EXPLAIN de cada uno, marcando los que recorren tablas completas.
+    """
+    company = resolve_company(company)
+    start_turn("doppiobot-explain", company)
+
+    report = []
+    for label, exercise in get_tool_exercises(company, item, customer):
+        # Sin exportar archivos: un File insertado se confirmaría y rollback no lo desharía
+        with capture_queries() as queries, exports_disabled():
+            try:
+                exercise()
+            finally:
+                frappe.db.rollback()
+
+        seen = set()
+        for query in queries:
+            if not str(query).lstrip().upper().startswith("SELECT") or query in seen:
+                continue
+            seen.add(query)
+            report.append({"tool": label, **explain(query, min_rows)})
+    return report
@@ -0,0 +1,204 @@
+import time
+from contextlib import contextmanager
+
+import frappe
+from frappe.utils import nowdate
+
+
+# Cuota diaria: se guarda por día en un hash de Redis y se conserva para el reporte
+USAGE_KEY = "doppiobot:usage:{day}"
+USAGE_TTL = 60 * 60 * 24 * 35
+
+# Contador de turnos en curso; expira por si un worker muere sin liberar el turno
+INFLIGHT_KEY = "doppiobot:inflight:{scope}:{name}"
+INFLIGHT_TTL = 60 * 10
+
+BUCKET_KEY = "doppiobot:bucket:{scope}:{name}"
+
+# Token bucket atómico para varias llaves: solo consume si todas tienen saldo,
+# así un rechazo por empresa no gasta la cuota del usuario (ni al revés).
+TOKEN_BUCKET_SCRIPT = """
+local now = tonumber(ARGV[1])
+local allowed = 1
+local states = {}
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[i * 2])
+    local refill = tonumber(ARGV[i * 2 + 1])
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or capacity
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) * refill)
+    if tokens < 1 then
+        allowed = 0
+    end
+    states[i] = tokens
+end
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[i * 2])
+    local refill = tonumber(ARGV[i * 2 + 1])
+    local tokens = states[i]
+    if allowed == 1 then
+        tokens = tokens - 1
+    end
+    redis.call('HSET', key, 'tokens', tostring(tokens), 'ts', tostring(now))
+    redis.call('EXPIRE', key, math.ceil(capacity / refill) + 1)
+end
+return allowed
+"""
+
+
+class ChatQuotaExceeded(frappe.TooManyRequestsError):
+    pass
+
+
+def get_limits():
+    """
+    Límites configurados en DoppioBot Settings, agrupados por ámbito.
+    Un valor de 0 significa sin límite.
+    """
+    settings = frappe.get_cached_doc("DoppioBot Settings")
+    return {
+        "User": {
+            "requests_per_minute": settings.user_requests_per_minute or 0,
+            "max_concurrent_turns": settings.user_max_concurrent_turns or 0,
+            "daily_token_budget": settings.user_daily_token_budget or 0,
+        },
+        "Company": {
+            "requests_per_minute": settings.company_requests_per_minute or 0,
+            "max_concurrent_turns": settings.company_max_concurrent_turns or 0,
+            "daily_token_budget": settings.company_daily_token_budget or 0,
+        },
+    }
+
+
+def get_scopes(user=None, company=None):
+    user = user or frappe.session.user
+    company = company or frappe.defaults.get_user_default("Company")
+    scopes = [("User", user)]
+    if company:
+        scopes.append(("Company", company))
+    return scopes
+
+
+@contextmanager
+def chat_turn_quota(user=None, company=None):
+    """
+    Controla un turno del chat: token bucket por minuto, turnos concurrentes y
+    presupuesto diario de tokens, por usuario y por empresa.
+
+    Lanza ChatQuotaExceeded si algún límite se supera. El valor producido es
+    una función para registrar los tokens consumidos por el turno.
+    """
+    limits = get_limits()
+    scopes = get_scopes(user, company)
+
+    try:
+        check_daily_budget(scopes, limits)
+        consume_request_tokens(scopes, limits)
+    except ChatQuotaExceeded:
+        record_usage(scopes, rejected=1)
+        raise
+
+    acquired = []
+    try:
+        for scope, name in scopes:
+            if acquire_turn(scope, name, limits[scope]["max_concurrent_turns"]):
+                acquired.append((scope, name))
+    except ChatQuotaExceeded:
+        release_turns(acquired)
+        record_usage(scopes, rejected=1)
+        raise
+
+    record_usage(scopes, requests=1)
+    try:
+        yield lambda tokens: record_usage(scopes, tokens=tokens)
+    finally:
+        release_turns(acquired)
+
+
+def consume_request_tokens(scopes, limits):
+    keys, args = [], [time.time()]
+    for scope, name in scopes:
+        per_minute = limits[scope]["requests_per_minute"]
+        if not per_minute:
+            continue
+        keys.append(frappe.cache().make_key(BUCKET_KEY.format(scope=scope, name=name)))
+        args.extend([per_minute, per_minute / 60.0])
+
+    if not keys:
+        return
+
+    allowed = frappe.cache().eval(TOKEN_BUCKET_SCRIPT, len(keys), *keys, *args)
+    if not int(allowed):
+        frappe.throw(
+            "Has enviado demasiadas preguntas en poco tiempo. Espera un momento e inténtalo de nuevo.",
+            ChatQuotaExceeded,
+        )
+
+
+def acquire_turn(scope, name, max_turns):
+    if not max_turns:
+        return False
+
+    cache = frappe.cache()
+    key = cache.make_key(INFLIGHT_KEY.format(scope=scope, name=name))
+    pipe = cache.pipeline()
+    pipe.incr(key)
+    pipe.expire(key, INFLIGHT_TTL)
+    in_flight = pipe.execute()[0]
+
+    if in_flight > max_turns:
+        cache.decr(key)
+        frappe.throw(
+            "Ya hay demasiadas preguntas en proceso. Espera a que terminen antes de enviar otra.",
+            ChatQuotaExceeded,
+        )
+    return True
+
+
+def release_turns(acquired):
+    cache = frappe.cache()
+    for scope, name in acquired:
+        cache.decr(cache.make_key(INFLIGHT_KEY.format(scope=scope, name=name)))
+
+
+def check_daily_budget(scopes, limits):
+    cache = frappe.cache()
+    key = cache.make_key(USAGE_KEY.format(day=nowdate()))
+    used = cache.hmget(key, [f"{scope}|{name}|tokens" for scope, name in scopes])
+
+    for (scope, name), tokens in zip(scopes, used):
+        budget = limits[scope]["daily_token_budget"]
+        if budget and int(tokens or 0) >= budget:
+            frappe.throw(
+                "Se alcanzó el límite diario de uso del asistente. Inténtalo de nuevo mañana.",
+                ChatQuotaExceeded,
+            )
+
+
+def record_usage(scopes, requests=0, tokens=0, rejected=0):
+    cache = frappe.cache()
+    key = cache.make_key(USAGE_KEY.format(day=nowdate()))
+    pipe = cache.pipeline()
+    for scope, name in scopes:
+        for metric, value in (("requests", requests), ("tokens", tokens), ("rejected", rejected)):
+            if value:
+                pipe.hincrby(key, f"{scope}|{name}|{metric}", int(value))
+    pipe.expire(key, USAGE_TTL)
+    pipe.execute()
+
+
+def get_usage(day=None):
+    """
+    Contadores de un día: {(scope, name): {"requests": n, "tokens": n, "rejected": n}}
+    """
+    cache = frappe.cache()
+    key = cache.make_key(USAGE_KEY.format(day=day or nowdate()))
+
+    usage = {}
+    # hscan_iter lee el hash sin pasar por el pickle de RedisWrapper.hgetall
+    for field, value in cache.hscan_iter(key):
+        scope, name_metric = frappe.safe_decode(field).split("|", 1)
+        name, metric = name_metric.rsplit("|", 1)
+        usage.setdefault((scope, name), {})[metric] = int(value)
+    return usage
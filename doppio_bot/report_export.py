@@ -0,0 +1,159 @@
+"""
+Exporta resultados grandes de las herramientas a un archivo privado (CSV o
+XLSX) para que al agente solo le llegue un resumen y el enlace de descarga.
+
+Las filas se leen con un cursor sin búfer del servidor y se escriben por
+bloques directamente en private/files, así que la memoria no crece con la
+cantidad de filas.
+"""
+import csv
+import os
+from contextlib import contextmanager
+
+import frappe
+from frappe.utils import now_datetime
+
+from doppio_bot.db_routing import primary_connection
+
+
+EXPORT_KEY = "doppiobot:export:{user}:{report}:{params}"
+# Una misma consulta repetida en la conversación reutiliza el archivo
+EXPORT_TTL = 60 * 10
+# Filas que se escriben por bloque
+WRITE_CHUNK = 1000
+# Filas que una herramienta devuelve al agente antes de exportar el resto
+INLINE_ROWS = 10
+FORMATS = ("csv", "xlsx")
+
+
+def stream_rows(query: str, values: dict):
+    """
+    Filas (tuplas) de la consulta sin cargar el resultado completo en memoria.
+    Mientras se recorren no se puede usar frappe.db para otra consulta.
+    """
+    with frappe.db.unbuffered_cursor():
+        yield from frappe.db.sql(query, values, as_iterator=True)
+
+
+def chunked(rows, size=WRITE_CHUNK):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def write_csv(path: str, headers: list, rows) -> int:
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.writer(f)
+        writer.writerow(headers)
+        for chunk in chunked(rows):
+            writer.writerows(chunk)
+            count += len(chunk)
+    return count
+
+
+def write_xlsx(path: str, headers: list, rows) -> int:
+    # write_only: openpyxl escribe cada fila al disco en lugar de guardar la hoja en memoria
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(headers)
+    count = 0
+    for row in rows:
+        sheet.append(list(row))
+        count += 1
+    workbook.save(path)
+    return count
+
+
+def export_query(report: str, headers: list, query: str, values: dict, file_format="csv") -> dict:
+    """
+    Escribe el resultado de `query` en un archivo privado del usuario y devuelve
+    {"file_url", "file_name", "rows"}.
+    """
+    file_format = file_format if file_format in FORMATS else "csv"
+    file_name = f"{report}-{now_datetime().strftime('%Y%m%d-%H%M%S')}-{frappe.generate_hash(length=6)}.{file_format}"
+    path = frappe.get_site_path("private", "files", file_name)
+
+    writer = write_xlsx if file_format == "xlsx" else write_csv
+    try:
+        rows = writer(path, headers, stream_rows(query, values))
+    except Exception:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+
+    # Las filas pueden venir de la réplica; el registro del archivo va siempre a la principal
+    with primary_connection():
+        file_doc = frappe.get_doc({
+            "doctype": "File",
+            "file_name": file_name,
+            "file_url": f"/private/files/{file_name}",
+            "is_private": 1,
+            "file_size": os.path.getsize(path),
+        })
+        file_doc.insert(ignore_permissions=True)
+        # El archivo ya está en disco; se confirma aunque el turno falle después
+        frappe.db.commit()
+    return {"file_url": file_doc.file_url, "file_name": file_name, "rows": rows}
+
+
+def get_export_format() -> str:
+    return frappe.conf.get("doppiobot_export_format") or "csv"
+
+
+@contextmanager
+def exports_disabled():
+    """
+    Dentro del bloque get_or_export no escribe archivos (devuelve None), para
+    ejecutar herramientas sin efectos secundarios: diagnósticos y prefetch.
+    """
+    previous = getattr(frappe.local, "doppiobot_exports_disabled", False)
+    frappe.local.doppiobot_exports_disabled = True
+    frappe.local.doppiobot_export_skipped = False
+    try:
+        yield
+    finally:
+        frappe.local.doppiobot_exports_disabled = previous
+
+
+def export_skipped() -> bool:
+    """
+    Si alguna llamada dentro de exports_disabled necesitaba exportar.
+    """
+    return getattr(frappe.local, "doppiobot_export_skipped", False)
+
+
+def get_or_export(report: str, params: str, headers: list, query: str, values: dict, file_format=None):
+    """
+    export_query con caché por usuario, reporte y parámetros (incluye empresa y permisos).
+    El formato es `doppiobot_export_format` del site_config si no se indica.
+    Devuelve None dentro de exports_disabled.
+    """
+    if getattr(frappe.local, "doppiobot_exports_disabled", False):
+        frappe.local.doppiobot_export_skipped = True
+        return None
+
+    file_format = file_format or get_export_format()
+    key = EXPORT_KEY.format(user=frappe.session.user, report=report, params=f"{params}:{file_format}")
+    export = frappe.cache().get_value(key)
+    if not export:
+        export = export_query(report, headers, query, values, file_format)
+        frappe.cache().set_value(key, export, expires_in_sec=EXPORT_TTL)
+    return export
+
+
+def summarize_export(export: dict, total: int, inline_rows: int) -> dict:
+    return {
+        "total": total,
+        "shown": inline_rows,
+        "file_url": export["file_url"],
+        "download": f"[Descargar {export['file_name']}]({export['file_url']})",
+        "note": f"Se muestran {inline_rows} de {total}. Comparte el enlace de descarga para la lista completa.",
+    }
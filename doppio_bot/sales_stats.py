@@ -0,0 +1,115 @@
+import frappe
+from frappe.utils import add_years, nowdate
+
+
+# Consultas de las estadísticas de ventas de una sola empresa, con los
+# fragmentos de permisos del usuario (ver data_access). Reemplazan a las vistas
+# last_sale, highest_sale, overdue_invoices y top_products, que no admiten esas
+# condiciones; sus columnas son las de estas consultas, no las de las vistas.
+
+
+def get_sales_conditions(scope) -> str:
+    # La empresa ya se filtra explícitamente y resolve_company valida que esté permitida
+    return scope.sql(territory="si.territory")
+
+
+def get_last_sale(company, scope):
+    return frappe.db.sql(f"""
+        SELECT si.name, si.customer, si.company, si.posting_date, si.grand_total, si.currency
+        FROM `tabSales Invoice` si
+        WHERE si.docstatus = 1
+            AND si.company = %(company)s
+            {get_sales_conditions(scope)}
+        ORDER BY si.posting_date DESC, si.creation DESC
+        LIMIT 1
+    """, {"company": company}, as_dict=True)
+
+
+def get_highest_sale(company, scope):
+    return frappe.db.sql(f"""
+        SELECT si.name, si.customer, si.company, si.posting_date, si.grand_total, si.currency
+        FROM `tabSales Invoice` si
+        WHERE si.docstatus = 1
+            AND si.company = %(company)s
+            AND si.posting_date >= %(from_date)s
+            {get_sales_conditions(scope)}
+        ORDER BY si.base_grand_total DESC
+        LIMIT 1
+    """, {"company": company, "from_date": add_years(nowdate(), -1)}, as_dict=True)
+
+
+OVERDUE_INVOICE_HEADERS = ["Factura", "Cliente", "Empresa", "Vencimiento", "Saldo", "Moneda"]
+
+
+def get_overdue_invoices_query(company, scope):
+    return f"""
+        SELECT si.name, si.customer, si.company, si.due_date, si.outstanding_amount, si.currency
+        FROM `tabSales Invoice` si
+        WHERE si.docstatus = 1
+            AND si.company = %(company)s
+            AND si.outstanding_amount > 0
+            AND si.due_date < %(today)s
+            AND si.posting_date >= %(from_date)s
+            {get_sales_conditions(scope)}
+        ORDER BY si.due_date
+    """, {"company": company, "today": nowdate(), "from_date": add_years(nowdate(), -1)}
+
+
+def get_overdue_invoices(company, scope, limit=5):
+    query, values = get_overdue_invoices_query(company, scope)
+    return frappe.db.sql(f"{query} LIMIT %(limit)s", {**values, "limit": limit}, as_dict=True)
+
+
+def get_overdue_summary(company, scope):
+    query, values = get_overdue_invoices_query(company, scope)
+    return frappe.db.sql(f"""
+        SELECT COUNT(*) AS total, COALESCE(SUM(overdue.outstanding_amount), 0) AS outstanding_amount
+        FROM ({query}) overdue
+    """, values, as_dict=True)[0]
+
+
+def get_top_products(company, scope, limit=3):
+    return frappe.db.sql(f"""
+        SELECT sii.item_code, sii.item_name, SUM(sii.stock_qty) AS total_qty, SUM(sii.base_net_amount) AS total_amount
+        FROM `tabSales Invoice Item` sii
+        JOIN `tabSales Invoice` si ON sii.parent = si.name
+        WHERE si.docstatus = 1
+            AND si.company = %(company)s
+            AND si.posting_date >= %(from_date)s
+            {get_sales_conditions(scope)}
+        GROUP BY sii.item_code, sii.item_name
+        ORDER BY total_qty DESC
+        LIMIT %(limit)s
+    """, {"company": company, "from_date": add_years(nowdate(), -1), "limit": limit}, as_dict=True)
+
+
+ITEM_STOCK_HEADERS = ["Almacén", "Cantidad actual", "Cantidad reservada", "Cantidad pedida", "Cantidad proyectada"]
+
+
+def get_item_stock_query(item_code, company, scope):
+    return f"""
+        SELECT
+            bin.warehouse AS almacen,
+            bin.actual_qty AS cantidad_actual,
+            bin.reserved_qty AS cantidad_reservada,
+            bin.ordered_qty AS cantidad_pedida,
+            bin.projected_qty AS cantidad_proyectada
+        FROM `tabBin` bin
+        JOIN `tabWarehouse` wh ON bin.warehouse = wh.name
+        WHERE bin.item_code = %(item_code)s
+            AND wh.company = %(company)s
+            {scope.sql(warehouse="bin.warehouse")}
+        ORDER BY bin.actual_qty DESC
+    """, {"item_code": item_code, "company": company}
+
+
+def get_item_stock(item_code, company, scope, limit=None):
+    query, values = get_item_stock_query(item_code, company, scope)
+    if limit:
+        query, values = f"{query} LIMIT %(limit)s", {**values, "limit": limit}
+    return frappe.db.sql(query, values, as_dict=True)
+
+
+def count_item_stock(item_code, company, scope):
+    query, values = get_item_stock_query(item_code, company, scope)
+    return frappe.db.sql(f"SELECT COUNT(*) FROM ({query}) stock", values)[0][0]
@@ -0,0 +1,129 @@
+"""
+Validación de existencias antes de construir facturas y órdenes de venta,
+según `validate_item_stock` y `default_warehouse` de Company Configuration.
+Todas las líneas se revisan con una sola consulta a tabBin, en la unidad de
+inventario de cada producto, y se reportan todos los faltantes juntos.
+"""
+from collections import defaultdict
+
+import frappe
+from frappe.utils import flt
+
+
+def get_stock_warehouse(company_config):
+    return company_config.default_warehouse or frappe.db.get_single_value("Stock Settings", "default_warehouse")
+
+
+def get_bin_quantities(item_codes, warehouses, uoms=()) -> dict:
+    """
+    {item_code: {"is_stock_item", "stock_uom", "sales_uom", "factors": {uom: factor},
+    "bins": {almacén: (actual_qty, reserved_qty)}}} de los productos y almacenes
+    indicados, en una consulta. `factors` trae la unidad de venta del producto y
+    las de `uoms`.
+    """
+    rows = frappe.db.sql("""
+        SELECT item.name AS item_code, item.is_stock_item, item.stock_uom, item.sales_uom,
+            bin.warehouse, bin.actual_qty, bin.reserved_qty,
+            conversion.uom, conversion.conversion_factor
+        FROM `tabItem` item
+        LEFT JOIN `tabBin` bin
+            ON bin.item_code = item.name AND bin.warehouse IN %(warehouses)s
+        LEFT JOIN `tabUOM Conversion Detail` conversion
+            ON conversion.parent = item.name AND conversion.parenttype = 'Item'
+            AND (conversion.uom = item.sales_uom OR conversion.uom IN %(uoms)s)
+        WHERE item.name IN %(item_codes)s
+    """, {
+        "item_codes": tuple(item_codes),
+        "warehouses": tuple(warehouses),
+        # IN () no es SQL válido
+        "uoms": tuple(uoms) or ("",),
+    }, as_dict=True)
+
+    quantities = {}
+    for row in rows:
+        entry = quantities.setdefault(row.item_code, {
+            "is_stock_item": row.is_stock_item,
+            "stock_uom": row.stock_uom,
+            "sales_uom": row.sales_uom,
+            "factors": {},
+            "bins": {},
+        })
+        if row.warehouse:
+            entry["bins"][row.warehouse] = (flt(row.actual_qty), flt(row.reserved_qty))
+        if row.uom:
+            entry["factors"][row.uom] = flt(row.conversion_factor)
+    return quantities
+
+
+def get_conversion_factor(item: dict, entry: dict) -> float:
+    """
+    Unidades de inventario por unidad de la línea: el conversion_factor de la
+    línea, o el de su uom (la unidad de venta del producto si no trae una).
+    """
+    if flt(item.get("conversion_factor")):
+        return flt(item["conversion_factor"])
+    uom = item.get("uom") or entry["sales_uom"] or entry["stock_uom"]
+    if uom == entry["stock_uom"]:
+        return 1
+    return entry["factors"].get(uom) or 1
+
+
+def get_stock_shortfalls(items: list, warehouse: str, include_reserved=False) -> list:
+    """
+    Faltantes de las líneas `items` (item_code, qty y opcionalmente warehouse,
+    uom y conversion_factor), comparados en la unidad de inventario. Las líneas
+    repetidas de un mismo producto y almacén se suman. Con `include_reserved` se
+    descuenta lo ya reservado por otras órdenes.
+    """
+    quantities = get_bin_quantities(
+        {item["item_code"] for item in items},
+        {item.get("warehouse") or warehouse for item in items},
+        {item["uom"] for item in items if item.get("uom")},
+    )
+
+    requested = defaultdict(float)
+    for item in items:
+        entry = quantities.get(item["item_code"])
+        # Los productos que no existen los reporta ground_references; los servicios no llevan existencias
+        if not entry or not entry["is_stock_item"]:
+            continue
+        stock_qty = flt(item.get("qty")) * get_conversion_factor(item, entry)
+        requested[(item["item_code"], item.get("warehouse") or warehouse)] += stock_qty
+
+    shortfalls = []
+    for (item_code, line_warehouse), qty in requested.items():
+        entry = quantities[item_code]
+        actual_qty, reserved_qty = entry["bins"].get(line_warehouse, (0, 0))
+        available = actual_qty - reserved_qty if include_reserved else actual_qty
+        if qty > available:
+            shortfalls.append({
+                "item_code": item_code,
+                "warehouse": line_warehouse,
+                "stock_uom": entry["stock_uom"],
+                "requested": qty,
+                "available": max(available, 0),
+            })
+    return shortfalls
+
+
+def check_stock_availability(items: list, company_config, include_reserved=False) -> list:
+    """
+    Si la empresa valida existencias, asigna el almacén configurado a las líneas
+    que no traen uno y devuelve los mensajes de faltantes (lista vacía si alcanza).
+    """
+    if not company_config.validate_item_stock:
+        return []
+    if frappe.db.get_single_value("Stock Settings", "allow_negative_stock"):
+        return []
+
+    warehouse = get_stock_warehouse(company_config)
+    if not warehouse:
+        return []
+    for item in items:
+        item.setdefault("warehouse", warehouse)
+
+    return [
+        f"Existencias insuficientes de {shortfall['item_code']} en {shortfall['warehouse']}: "
+        f"se piden {shortfall['requested']:g} {shortfall['stock_uom']}, hay {shortfall['available']:g}."
+        for shortfall in get_stock_shortfalls(items, warehouse, include_reserved)
+    ]
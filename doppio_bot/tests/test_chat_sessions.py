@@ -0,0 +1,19 @@
+# Copyright (c) 2025, Hussain Nagaria and Contributors
+# See license.txt
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from doppio_bot.chat_sessions import HISTORY_PREFIX, get_history_key, get_history_key_prefix
+
+
+class TestChatSessions(FrappeTestCase):
+	def test_history_key(self):
+		prefix = get_history_key_prefix()
+		key = get_history_key("session-1")
+
+		self.assertIsInstance(prefix, str)
+		self.assertEqual(key, prefix + "session-1")
+		# Lleva el prefijo del sitio, igual que las demás llaves de frappe.cache()
+		self.assertEqual(prefix, frappe.safe_decode(frappe.cache().make_key(HISTORY_PREFIX)))
+		self.assertNotEqual(prefix, HISTORY_PREFIX)
@@ -0,0 +1,1392 @@
+"""
+Herramientas del agente. Son funciones simples registradas en TOOLS; agent.py
+las envuelve como herramientas de langchain en el primer turno del chat, así
+que importar este módulo no carga langchain.
+"""
+import calendar
+import json
+import logging
+from datetime import date
+from typing import Dict, Optional
+
+import frappe
+from frappe.utils import date_diff
+
+from doppio_bot.chat_context import get_current_turn
+from doppio_bot.companies import (
+    get_company_config,
+    get_current_company,
+    get_default_taxes_template,
+    resolve_company,
+)
+from doppio_bot.data_access import get_permission_scope
+from doppio_bot.db_routing import primary_connection
+from doppio_bot.draft_cart import (
+    DraftError,
+    add_line,
+    format_draft,
+    get_document_data,
+    get_draft,
+    mark_draft_committed,
+    remove_line,
+    set_customer,
+)
+from doppio_bot.entity_index import ground_references
+from doppio_bot.fel_queue import get_fel_status, queue_fel_certification, retry_failed
+from doppio_bot.file_import import format_status, get_import_status, preview_file, start_import
+from doppio_bot.idempotency import claim_creation
+from doppio_bot.item_analytics import compute_item_analytics, get_item_analytics
+from doppio_bot.prefetch import get_prefetched
+from doppio_bot.previews import cache_preview, get_preview, mark_preview_confirmed
+from doppio_bot.report_export import INLINE_ROWS, get_or_export, summarize_export
+from doppio_bot.sales_stats import (
+    ITEM_STOCK_HEADERS,
+    OVERDUE_INVOICE_HEADERS,
+    count_item_stock,
+    get_highest_sale,
+    get_item_stock,
+    get_item_stock_query,
+    get_last_sale,
+    get_overdue_invoices,
+    get_overdue_invoices_query,
+    get_overdue_summary,
+    get_top_products,
+)
+from doppio_bot.stock_availability import check_stock_availability
+from doppio_bot.turn_control import call_remote
+
+
+# Herramientas en el orden en que se registran
+TOOLS = []
+
+
+def register_tool(func):
+    TOOLS.append(func)
+    return func
+
+
+@register_tool
+def consultar_identificacion_sat(identificacion: str) -> str:
+    """
+    Consulta el nombre de un cliente en el SAT de Guatemala utilizando su NIT o CUI.
+
+    Args:
+        identificacion (str): NIT o CUI del cliente a consultar.
+
+    Returns:
+        str: Nombre del cliente si se encuentra, o un mensaje de error.
+    """
+    prefetched = get_prefetched("consultar_identificacion_sat", identificacion)
+    if prefetched is not None:
+        return prefetched
+
+    try:
+        # Determinar automáticamente si es NIT o CUI basado en la longitud
+        # El servicio del SAT no recibe timeout: la espera se limita desde afuera
+        if len(identificacion) == 9:
+            # Si es NIT, llamar a la función consultar_sat_nit
+            nombre_cliente = call_remote("fel.certificacion.consultar_sat_nit", identificacion)
+        elif len(identificacion) == 13:
+            # Si es CUI, llamar a la función llamar_servicio_web
+            nombre_cliente = call_remote("fel.certificacion.llamar_servicio_web", identificacion)
+        else:
+            return "failed: La identificación proporcionada no es válida. Debe ser un NIT (9 dígitos) o un CUI (13 dígitos)."
+
+        return nombre_cliente
+    except Exception as e:
+        return f"Error al consultar la identificación en el SAT: {str(e)}"
+
+@register_tool
+def create_sales_order(order_data: str) -> str:
+    """
+    Create a new Sales Order in Frappe ERPNext.
+
+    Expected input: JSON string with the following fields:
+    - `customer`: The name of the customer (mandatory).
+    - `items`: A list of items, each with:
+        - `item_code`: The item code (mandatory).
+        - `qty`: Quantity (mandatory).
+        - `rate`: Price per unit (mandatory).
+    - `delivery_date`: (optional) Delivery date in "YYYY-MM-DD" format.
+    - `taxes`: (optional) A list of taxes to apply.
+    - `additional_notes`: (optional) Additional text that may contain "EXENTO" or "EXENTA".
+
+    Returns "done: <document name>" if successful, otherwise "failed".
+    Repeating the same call in the same turn returns the already created document.
+    If the order is being built over several messages, use the draft tools and `commit_draft` instead.
+    """
+    try:
+        data = frappe.parse_json(order_data)
+
+        # Validar campos obligatorios
+        if not data.get("customer"):
+            return "failed: Missing required field 'customer'."
+        if not data.get("items"):
+            return "failed: Missing required field 'items'."
+        # Validar items antes de resolverlos y revisar existencias
+        for item in data["items"]:
+            if not item.get("item_code") or not item.get("qty") or not item.get("rate"):
+                return "failed: Missing required fields in 'items' (item_code, qty, or rate)."
+
+        # Resolver cliente y productos a sus nombres reales antes de insertar
+        errors = ground_references(data, "Customer", "customer")
+        if errors:
+            return f"failed: {' '.join(errors)}"
+
+        company = get_current_company()
+        data["company"] = company
+
+        # Rechazar antes de construir la orden si no hay existencias para todas las líneas
+        errors = check_stock_availability(data["items"], get_company_config(company), include_reserved=True)
+        if errors:
+            return f"failed: {' '.join(errors)}"
+
+        with claim_creation("Sales Order", data) as claim:
+            if claim.existing:
+                return f"done: {claim.existing}"
+
+            # Obtener la fecha actual
+            fecha_actual = date.today()
+
+            # Calcular el último día del mes actual
+            ultimo_dia_del_mes = calendar.monthrange(fecha_actual.year, fecha_actual.month)[1]
+            fecha_ultimo_dia = date(fecha_actual.year, fecha_actual.month, ultimo_dia_del_mes)
+
+            # Verificar si la factura es EXENTA
+            additional_notes = data.get("additional_notes", "").strip().upper()
+            is_exento = "EXENTO" in additional_notes or "EXENTA" in additional_notes
+
+            # Obtener la plantilla de impuestos predeterminada solo si no es EXENTO/EXENTA
+            plantilla = ""
+            if not is_exento:
+                plantilla = get_default_taxes_template("Sales Taxes and Charges Template", company)
+            print(f"Plantilla de impuestos: {plantilla}")
+
+            # Establecer valores predeterminados
+            data.setdefault("posting_date", fecha_actual)
+            data.setdefault("delivery_date", fecha_ultimo_dia)
+            data.setdefault("taxes_and_charges", plantilla) 
+
+            items = [
+                {
+                    "item_code": item["item_code"],
+                    "qty": item["qty"],
+                    "rate": item["rate"],
+                    "warehouse": item.get("warehouse"),
+                }
+                for item in data["items"]
+            ]
+
+            # Validar impuestos (si se proporcionan y no es EXENTO/EXENTA)
+            taxes = []
+            if data.get("taxes") and not is_exento:
+                for tax in data["taxes"]:
+                    if not tax.get("account_head") or not tax.get("rate"):
+                        return "failed: Missing required fields in 'taxes' (account_head or rate)."
+                    taxes.append({
+                        "charge_type": "On Net Total",
+                        "account_head": tax["account_head"],
+                        "rate": tax["rate"]
+                    })
+            elif data.get("taxes_and_charges") and not is_exento:
+                # Si no se proporcionan impuestos directamente y no es exento, usar la plantilla
+                taxes = frappe.get_doc("Sales Taxes and Charges Template", data["taxes_and_charges"]).taxes
+
+            # Crear documento de factura
+            order = frappe.get_doc({
+                "doctype": "Sales Order",
+                "company": company,
+                "customer": data["customer"],
+                "items": items,
+                "cost_center": data.get("cost_center") or data.get("center_cost"),
+                "delivery_date": data.get("delivery_date"),
+                "taxes_and_charges": data.get("taxes_and_charges"),
+                "taxes": taxes,
+            })
+
+            order.insert()
+            frappe.db.commit()
+            claim.done(order.name)
+            return f"done: {order.name}"
+
+    except Exception as e:
+        frappe.log_error(f"Error creating Sales Order: {str(e)}")
+        return f"failed: {str(e)}"  # Devolver el mensaje de error
+
+class InvoiceDataError(frappe.ValidationError):
+    pass
+
+
+def parse_sales_invoice_data(invoice_data: str) -> tuple:
+    """
+    Parsea y valida el JSON de una factura de venta.
+    Devuelve (data, company_config) o lanza InvoiceDataError.
+    """
+    # Verificar si el input es un JSON válido
+    if not invoice_data or not invoice_data.strip():
+        raise InvoiceDataError("Empty or invalid JSON input.")
+
+    # Depuración: Imprimir el input recibido
+    print(f"Input received: {invoice_data}")
+
+    # Parsear el JSON
+    try:
+        data = json.loads(invoice_data.strip())  # Usar strip() para eliminar espacios innecesarios
+    except json.JSONDecodeError as e:
+        raise InvoiceDataError(f"Invalid JSON format. Error: {str(e)}")
+
+    # Depuración: Imprimir el JSON parseado
+    print(f"Parsed data: {data}")
+
+    # Validar campos obligatorios
+    if not data.get("customer"):
+        raise InvoiceDataError("Missing required field 'customer'.")
+    if not data.get("items"):
+        raise InvoiceDataError("Missing required field 'items'.")
+
+    # Validar items
+    for item in data["items"]:
+        if not item.get("item_code") or not item.get("qty") or not item.get("rate"):
+            raise InvoiceDataError("Missing required fields in 'items' (item_code, qty, or rate).")
+
+    # Resolver cliente y productos a sus nombres reales antes de insertar
+    errors = ground_references(data, "Customer", "customer")
+    if errors:
+        raise InvoiceDataError(" ".join(errors))
+
+    # Validar campos adicionales si la empresa requiere FEL
+    if data.get("id_identificacion") and data["id_identificacion"].upper() not in ["NIT", "CUI"]:
+        raise InvoiceDataError("'id_identificacion' must be 'NIT' or 'CUI'.")
+    if data.get("id_receptor_") and not str(data["id_receptor_"]).isdigit():
+        raise InvoiceDataError("'id_receptor_' must be a numeric value.")
+
+    # Obtener la configuración de la empresa del turno
+    company_config = get_company_config()
+    data["company"] = company_config.company
+
+    # Validar campos adicionales si la empresa requiere FEL
+    if company_config.default_fel_configuration:
+        if not data.get("id_identificacion"):
+            raise InvoiceDataError("Missing required field 'id_identificacion'.")
+        if not data.get("id_receptor_"):
+            raise InvoiceDataError("Missing required field 'id_receptor_'.")
+
+    # Con update_stock la factura descarga existencias: validarlas antes de construirla
+    if data.get("update_stock", 1):
+        errors = check_stock_availability(data["items"], company_config)
+        if errors:
+            raise InvoiceDataError(" ".join(errors))
+
+    return data, company_config
+
+
+def build_sales_invoice(data: dict, company_config):
+    """
+    Construye en memoria (sin insertar) la factura de venta: plantilla de
+    impuestos, campos FEL y series de los productos que las requieren.
+    """
+    # Obtener la fecha actual
+    fecha_actual = date.today()
+
+    # Calcular el último día del mes actual
+    ultimo_dia_del_mes = calendar.monthrange(fecha_actual.year, fecha_actual.month)[1]
+    fecha_ultimo_dia = date(fecha_actual.year, fecha_actual.month, ultimo_dia_del_mes)
+
+    # Verificar si la factura es EXENTA
+    additional_notes = data.get("additional_notes", "").strip().upper()
+    is_exento = "EXENTO" in additional_notes or "EXENTA" in additional_notes
+
+    # Obtener la plantilla de impuestos predeterminada solo si no es EXENTO/EXENTA
+    plantilla = ""
+    if not is_exento:
+        plantilla = get_default_taxes_template("Sales Taxes and Charges Template", company_config.company)
+    print(f"Plantilla de impuestos: {plantilla}")
+
+    # Establecer valores predeterminados
+    data.setdefault("posting_date", fecha_actual)
+    data.setdefault("due_date", fecha_ultimo_dia)
+    data.setdefault("taxes_and_charges", plantilla)
+    data.setdefault("update_stock", 1)
+
+    # Determinar el valor de custom_fel según el texto ingresado
+    fel_status = data.get("fel_status", "").strip().upper()
+    custom_fel = 0  # Valor predeterminado (0 para "SIN FEL")
+    if fel_status == "CON FEL":
+        custom_fel = 1  # 1 para "CON FEL"
+
+    # Crear documento de factura
+    invoice_data = {
+        "doctype": "Sales Invoice",
+        "company": company_config.company,
+        "customer": data["customer"],
+        "cost_center": data.get("center_cost", ""),  # Corregido: usar get para evitar KeyError
+        "items": [],
+        "due_date": data.get("due_date"),
+        "taxes_and_charges": data.get("taxes_and_charges"),
+        "custom_fel": custom_fel  # Asignar el valor calculado
+    }
+
+    # Agregar campos adicionales si la empresa requiere FEL
+    if company_config.default_fel_configuration:
+        invoice_data.update({
+            "vendedor": data.get("vendedor", frappe.session.user),  # Usuario conectado
+            "id_identificacion": data.get("id_identificacion"),
+            "id_receptor_": data.get("id_receptor_")
+        })
+
+    # Procesar cada item
+    for item in data["items"]:
+        item_code = item["item_code"]
+        qty = item["qty"]
+        rate = item["rate"]
+
+        # Verificar si el producto requiere serie
+        item_doc = frappe.get_doc("Item", item_code)
+        if item_doc.has_serial_no:
+            # Buscar la serie más antigua disponible
+            serial_nos = frappe.get_all("Serial No", filters={
+                "item_code": item_code,
+                "status": "Active"
+            }, fields=["name", "creation"], order_by="creation", limit=qty)
+
+            if len(serial_nos) < qty:
+                raise InvoiceDataError(f"Not enough serial numbers available for item {item_code}.")
+
+            # Asignar las series más antiguas
+            item["serial_no"] = "\n".join([sno["name"] for sno in serial_nos])
+        else:
+            item["serial_no"] = ""
+
+        invoice_data["items"].append(item)
+
+    # Crear la factura
+    invoice = frappe.get_doc(invoice_data)
+
+    # Verificar y asignar términos de pago si es necesario
+    if not invoice.get("payment_terms"):
+        invoice.set("payment_terms", [])
+
+    return invoice
+
+
+@register_tool
+def create_sales_invoice(invoice_data: str) -> str:
+    """
+    Create a new Sales Invoice in Frappe ERPNext.
+
+    Expected input: JSON string with the following fields:
+    - `customer`: The name of the customer (mandatory).
+    - `center_cost`: The name of the cost center.
+    - `items`: A list of items, each with:
+        - `item_code`: The item code (mandatory).
+        - `qty`: Quantity (mandatory).
+        - `rate`: Price per unit (mandatory).
+    - `due_date`: (optional) Invoice due date in "YYYY-MM-DD" format.
+    - `taxes`: (optional) A list of taxes to apply.
+    - `fel_status`: (optional) Text indicating if the invoice is "CON FEL" or "SIN FEL".
+    - `additional_notes`: (optional) Additional text that may contain "EXENTO" or "EXENTA".
+    - `id_identificacion`: (optional) Identification type, must be "NIT" or "CUI".
+    - `id_receptor_`: (optional) Receiver identification number, must be numeric.
+
+    Returns "done: <document name>" if successful, otherwise "failed".
+    Repeating the same call in the same turn returns the already created document.
+    If the user first wants to see the totals, use `preview_sales_invoice` instead.
+    If the invoice is being built over several messages, use the draft tools and `commit_draft` instead.
+    """
+    try:
+        data, company_config = parse_sales_invoice_data(invoice_data)
+
+        with claim_creation("Sales Invoice", data) as claim:
+            if claim.existing:
+                return f"done: {claim.existing}"
+
+            invoice = build_sales_invoice(data, company_config)
+            invoice.insert()
+            # La certificación FEL no retrasa la respuesta: se hace en segundo plano
+            queued = queue_fel_certification(invoice, (get_current_turn() or {}).get("session_id"))
+            frappe.db.commit()
+            claim.done(invoice.name)
+            return format_created_invoice(invoice, queued)
+
+    except InvoiceDataError as e:
+        return f"failed: {str(e)}"
+    except Exception as e:
+        frappe.log_error(f"Error creating Sales Invoice: {str(e)}")
+        return f"failed: {str(e)}"
+
+@register_tool
+def preview_sales_invoice(invoice_data: str) -> str:
+    """
+    Preview a Sales Invoice without saving it, so the user can check the totals first.
+
+    Takes the same JSON input as `create_sales_invoice`. Returns the net total, taxes,
+    grand total and a `preview_token`. Pass that token to `confirm_sales_invoice` once
+    the user agrees, instead of calling `create_sales_invoice` again.
+    Returns "failed: <reason>" if the invoice cannot be built.
+    """
+    try:
+        data, company_config = parse_sales_invoice_data(invoice_data)
+
+        # Calcular totales en memoria con la misma lógica que usará insert()
+        invoice = build_sales_invoice(data, company_config)
+        invoice.set_missing_values()
+        invoice.calculate_taxes_and_totals()
+
+        token = cache_preview(invoice)
+        return format_invoice_preview(invoice, token)
+
+    except InvoiceDataError as e:
+        return f"failed: {str(e)}"
+    except Exception as e:
+        frappe.log_error(f"Error previewing Sales Invoice: {str(e)}")
+        return f"failed: {str(e)}"
+
+@register_tool
+def confirm_sales_invoice(preview_token: str) -> str:
+    """
+    Save the Sales Invoice previously built by `preview_sales_invoice`.
+
+    Input: the `preview_token` returned by the preview (plain text).
+    Returns "done: <document name>" if successful, otherwise "failed: <reason>".
+    Confirming the same token twice returns the invoice created the first time.
+    """
+    try:
+        preview_token = preview_token.strip().strip('"')
+        preview = get_preview(preview_token)
+        if not preview:
+            return "failed: The preview expired or does not exist, call preview_sales_invoice again."
+        if preview.get("confirmed"):
+            return f"done: {preview['confirmed']}"
+
+        with claim_creation("Sales Invoice", {"preview_token": preview_token}) as claim:
+            if claim.existing:
+                return f"done: {claim.existing}"
+
+            # Insertar el documento ya calculado, sin reconstruirlo
+            invoice = frappe.get_doc(preview["doc"])
+            invoice.insert()
+            queued = queue_fel_certification(invoice, (get_current_turn() or {}).get("session_id"))
+            frappe.db.commit()
+            claim.done(invoice.name)
+            mark_preview_confirmed(preview_token, invoice.name)
+            return format_created_invoice(invoice, queued)
+
+    except Exception as e:
+        frappe.log_error(f"Error confirming Sales Invoice: {str(e)}")
+        return f"failed: {str(e)}"
+
+def format_created_invoice(invoice, fel_queued=False) -> str:
+    if fel_queued:
+        return f"done: {invoice.name} (borrador guardado; la certificación FEL está en cola y se avisará en el chat)"
+    if invoice.get("custom_fel"):
+        return f"done: {invoice.name} (borrador guardado; valídalo en ERPNext para certificarlo en FEL)"
+    return f"done: {invoice.name}"
+
+
+def format_invoice_preview(invoice, token: str) -> str:
+    lines = [
+        f"Vista previa de factura para {invoice.customer} ({invoice.currency}):",
+    ]
+    for item in invoice.items:
+        lines.append(f" - {item.item_code}: {item.qty} x {item.rate} = {item.amount}")
+    lines.extend([
+        f"Total neto: {invoice.net_total}",
+        f"Impuestos: {invoice.total_taxes_and_charges}",
+        f"Total: {invoice.grand_total}",
+        f"preview_token: {token}",
+    ])
+    return "\n".join(lines)
+
+@register_tool
+def create_customer(cliente: str) -> str:
+    """
+    Crea un nuevo Cliente en Frappe.
+    Debe recibir un JSON con al menos la clave `customer_name`.
+    Si no se proporciona `customer_group` o `territory`, se asignan valores por defecto.
+    También se crea una dirección asociada al cliente.
+    """
+    try:
+        data = frappe.parse_json(cliente)
+
+        # Establecer valores por defecto si no se proporcionan
+        data.setdefault("customer_group", "Individual")  
+        data.setdefault("territory", "Todos los Territorios")
+        data.setdefault("default_currency", "GTQ")  
+
+        # Crear el cliente
+        new_customer = frappe.get_doc({"doctype": "Customer", **data})
+        new_customer.insert()
+
+        # Crear la dirección asociada al cliente
+        address_data = {
+            "doctype": "Address",
+            "address_line1": data.get("address_line1", "Ciudad"),
+            "city": data.get("city", "Ciudad de Guatemala"),
+            "phone": data.get("phone"),
+            "links": [
+                {
+                    "link_doctype": "Customer",
+                    "link_name": new_customer.name
+                }
+            ]
+        }
+
+        new_address = frappe.get_doc(address_data)
+        new_address.insert()
+
+        return "done"
+    
+    except frappe.ValidationError as e:
+        frappe.log_error(f"Validation Error: {str(e)}", "create_customer")
+        return "failed"
+    except Exception as e:
+        frappe.log_error(f"Unexpected Error: {str(e)}", "create_customer")
+        return "failed"
+
+@register_tool
+def update_customers(cliente: str) -> str:
+    """
+    Actualiza un Cliente en Frappe.
+    Debe recibir un JSON con al menos la clave `customer_name`.
+    Si el cliente no existe, devuelve un mensaje de error.
+    Si hay múltiples coincidencias, devuelve una lista de clientes que coinciden.
+    """
+    try:
+        data = frappe.parse_json(cliente)
+
+        # Verificar si se proporciona 'customer_name'
+        customer_name = data.get("customer_name")
+        if not customer_name:
+            return "Error: Se requiere 'customer_name' para obtener la información del cliente."
+
+        # Buscar clientes que coincidan parcialmente con el nombre
+        clientes = frappe.get_all("Customer", 
+                                 filters={"customer_name": ["like", f"%{customer_name}%"]}, 
+                                 fields=["name", "customer_name"])
+
+        if not clientes:
+            return f"Error: No se encontraron clientes que coincidan con '{customer_name}'."
+
+        # Si hay más de un cliente que coincide, devolver la lista de nombres
+        if len(clientes) > 1:
+            nombres_clientes = [cliente["customer_name"] for cliente in clientes]
+            return f"Se encontraron múltiples clientes: {', '.join(nombres_clientes)}"
+
+        # Si solo hay un cliente, proceder a obtener la información
+        existe_cliente = clientes[0]["name"]
+
+        # Obtener el documento del cliente y actualizar los datos
+        customer_doc = frappe.get_doc("Customer", existe_cliente)
+
+        # Actualizar valores solo si se proporcionan
+        if data.get("new_name"):
+            customer_doc.customer_name = data["new_name"]
+        
+        if data.get("territory"):
+            customer_doc.territory = data["territory"]
+        
+        if data.get("customer_group"):
+            customer_doc.customer_group = data["customer_group"]
+
+        # Guardar los cambios
+        customer_doc.save()
+
+        # Construir la respuesta en formato de texto
+        response = (
+            f"Cliente '{customer_doc.customer_name}' actualizado correctamente.\n"
+            f"Nuevos valores:\n"
+            f" - Nombre: {customer_doc.customer_name}\n"
+            f" - Territorio: {customer_doc.territory}\n"
+            f" - Grupo de Clientes: {customer_doc.customer_group}\n"
+        )
+
+        return response
+
+    except frappe.DoesNotExistError:
+        return "Error: Cliente no encontrado."
+    except frappe.ValidationError as e:
+        frappe.log_error(f"Validation Error: {str(e)}", "update_customers")
+        return "Error de validación."
+    except Exception as e:
+        frappe.log_error(f"Unexpected Error: {str(e)}", "update_customers")
+        return f"Error inesperado: {str(e)}"
+
+@register_tool
+def delete_customers(cliente: str) -> str:
+    """
+    Actualiza un Cliente en Frappe.
+    Debe recibir un JSON con al menos la clave `customer_name`.
+    Si el cliente no existe, devuelve un mensaje de error.
+    """
+    try:
+        data = frappe.parse_json(cliente)
+
+        # Verificar si el cliente existe
+        customer_name = data.get("customer_name")
+        if not customer_name:
+            return "Error: Se requiere 'customer_name' para actualizar el cliente."
+
+        existe_cliente = frappe.get_value("Customer", {"customer_name": customer_name}, "name")
+
+        if not existe_cliente:
+            return "Error: Cliente no existe."
+
+        # Obtener el documento del cliente y actualizar los datos
+        customer_doc = frappe.get_doc("Customer", existe_cliente)
+        customer_doc.delete()
+        
+        return "done"
+
+    except frappe.DoesNotExistError:
+        return "Error: Cliente no encontrado."
+    except frappe.ValidationError as e:
+        frappe.log_error(f"Validation Error: {str(e)}", "update_customers")
+        return "Error de validación."
+    except Exception as e:
+        frappe.log_error(f"Unexpected Error: {str(e)}", "update_customers")
+        return f"Error inesperado: {str(e)}"
+
+@register_tool
+def get_info_customer(cliente: str) -> str:
+    """
+    Obtiene información de un Cliente en Frappe.
+    Recibe un JSON con 'customer_name' y opcionalmente 'field' para obtener un campo específico.
+    Si el cliente no existe, devuelve un mensaje de error.
+    Si hay múltiples coincidencias, devuelve una lista de clientes que coinciden.
+    """
+    prefetched = get_prefetched("get_info_customer", cliente)
+    if prefetched is not None:
+        return prefetched
+
+    try:
+        data = frappe.parse_json(cliente)
+
+        # Verificar si se proporciona 'customer_name'
+        customer_name = data.get("customer_name")
+        if not customer_name:
+            return "Error: Se requiere 'customer_name' para obtener la información del cliente."
+
+        # Buscar clientes que coincidan parcialmente con el nombre
+        clientes = frappe.get_all("Customer", 
+                                 filters={"customer_name": ["like", f"%{customer_name}%"]}, 
+                                 fields=["name", "customer_name"])
+
+        if not clientes:
+            return f"Error: No se encontraron clientes que coincidan con '{customer_name}'."
+
+        # Si hay más de un cliente que coincide, devolver la lista de nombres
+        if len(clientes) > 1:
+            nombres_clientes = [cliente["customer_name"] for cliente in clientes]
+            return f"Se encontraron múltiples clientes: {', '.join(nombres_clientes)}"
+
+        # Si solo hay un cliente, proceder a obtener la información
+        existe_cliente = clientes[0]["name"]
+
+        # Obtener el documento del cliente
+        customer_doc = frappe.get_doc("Customer", existe_cliente)
+
+        # Verificar si se solicitó un campo específico
+        field = data.get("field")
+        if field:
+            if hasattr(customer_doc, field):
+                return f"{field.capitalize()}: {getattr(customer_doc, field)}"
+            else:
+                return f"Error: El campo '{field}' no existe en el cliente."
+
+        # Construir la respuesta en formato de texto
+        response = (
+            f"El cliente {customer_doc.customer_name} pertenece al grupo '{customer_doc.customer_group}'.\n"
+            f"Territorio asignado: {customer_doc.territory}.\n"
+            f"Fecha de creación: {customer_doc.creation}.\n"
+        )
+
+        return response
+
+    except frappe.DoesNotExistError:
+        return "Error: Cliente no encontrado."
+    except frappe.ValidationError as e:
+        # La herramienta corre en la réplica; el Error Log se guarda en la principal
+        with primary_connection():
+            frappe.log_error(f"Validation Error: {str(e)}", "get_info_customer")
+        return "Error de validación."
+    except Exception as e:
+        with primary_connection():
+            frappe.log_error(f"Unexpected Error: {str(e)}", "get_info_customer")
+        return f"Error inesperado: {str(e)}"
+
+
+
+@register_tool
+def get_sales_stats(customer: str) -> str:
+    """
+    Get sales statistics from Frappe ERPNext for the last year.
+
+    Returns a dictionary with the following keys:
+    - last_sale: Details of the last sale.
+    - highest_sale: Details of the highest sale.
+    - overdue_invoices: Summary of overdue invoices.
+    - overdue_invoices_report: (only when there are more overdue invoices than listed) total count,
+      outstanding amount and a `download` link to the full list. Show the link to the user
+      instead of listing every invoice.
+    - top_products: List of top-selling products.
+    """
+    prefetched = get_prefetched("get_sales_stats", customer)
+    if prefetched is not None:
+        return prefetched
+
+    try:
+        stats = {}
+
+        # Empresa del turno y permisos del usuario compilados una vez por sesión
+        company = get_current_company()
+        scope = get_permission_scope()
+        scope.check("Sales Invoice", company=company)
+
+        # 1. Última venta
+        ultima_venta = get_last_sale(company, scope)
+
+        stats["last_sale"] = ultima_venta[0] if ultima_venta else {"error": "No se encontraron ventas"}
+
+        # 2. Factura más alta (solo 1 registro)
+        venta_alta = get_highest_sale(company, scope)
+
+        stats["highest_sale"] = venta_alta[0] if venta_alta else {"error": "No se encontraron ventas en el último año"}
+
+        # 3. Facturas atrasadas (limitar a 5 registros)
+        facturas_atrasadas = get_overdue_invoices(company, scope)
+
+        stats["overdue_invoices"] = facturas_atrasadas if facturas_atrasadas else {"error": "No se encontraron facturas atrasadas en el último año"}
+
+        # La lista completa no va en la respuesta: si hay más atrasadas, se exporta a un archivo
+        resumen_atrasadas = get_overdue_summary(company, scope)
+        if resumen_atrasadas.total > len(facturas_atrasadas):
+            query, values = get_overdue_invoices_query(company, scope)
+            export = get_or_export("facturas-atrasadas", f"{company}:{scope.key}", OVERDUE_INVOICE_HEADERS, query, values)
+            if export:
+                stats["overdue_invoices_report"] = {
+                    **summarize_export(export, resumen_atrasadas.total, len(facturas_atrasadas)),
+                    "outstanding_amount": resumen_atrasadas.outstanding_amount,
+                }
+
+        # 4. Top productos más vendidos (limitar a 3 registros)
+        top_products = get_top_products(company, scope)
+
+        stats["top_products"] = top_products if top_products else {"error": "No se encontraron productos más vendidos en el último año"}
+
+        # Convertir el diccionario a un texto formateado
+
+
+        return stats
+
+    except Exception as e:
+        logging.error(f"Error en get_sales_stats: {str(e)}")
+        return f"Error: {str(e)}"
+
+@register_tool
+def create_item(params: dict) -> str:
+    """
+    Crea un nuevo ítem en Frappe.
+    
+    Parámetros:
+    - `params`: Un diccionario que contiene:
+        - `item`: Puede ser un JSON con al menos la clave `description`. Opcionalmente puede incluir `date` en formato "YYYY-MM-DD".
+                  También puede ser un texto plano que describa el ítem.
+        - `name`: Nombre del producto (opcional). Si no se proporciona, se usará la descripción como nombre.
+    
+    Devuelve "done" si se crea correctamente o "failed" en caso de error.
+    """
+    try:
+        # Extraer valores del diccionario `params`
+        item = params.get("item")
+        name = params.get("name")
+
+        # Intentar parsear el ítem como JSON
+        try:
+            data = frappe.parse_json(item)
+        except:
+            # Si no es un JSON válido, tratar como texto plano y crear un diccionario con la descripción
+            data = {"description": item}
+        
+        # Establecer valores por defecto si no se proporcionan
+        data.setdefault("stock_uom", "Unidad(es)")  
+        data.setdefault("item_group", "Productos")  
+        
+        # Asignar el nombre del ítem
+        if name:
+            data["item_name"] = name  # Usar el nombre proporcionado
+        elif "item_name" not in data:
+            # Si no se proporciona un nombre, usar la descripción como nombre
+            data["item_name"] = data.get("description", "Nuevo Ítem")
+        
+        # Crear el nuevo ítem
+        nuevo_producto = frappe.get_doc({"doctype": "Item", **data})
+        nuevo_producto.insert()
+
+        return "done"
+    except frappe.ValidationError as e:
+        frappe.log_error(f"Validation Error: {str(e)}", "create_item")
+        return "failed"
+    except Exception as e:
+        frappe.log_error(f"Unexpected Error: {str(e)}", "create_item")
+        return "failed"
+
+
+@register_tool
+def create_purchase_invoice(purchase_data: str) -> str:
+    """
+    Create a new Sales Invoice in Frappe ERPNext.
+
+    Expected input: JSON string with the following fields:
+    - `supplier`: The name of the supplier (mandatory).
+    - `items`: A list of items, each with:
+        - `item_code`: The item code (mandatory).
+        - `qty`: Quantity (mandatory).
+        - `rate`: Price per unit (mandatory).
+    - `due_date`: (optional) Invoice due date in "YYYY-MM-DD" format.
+    - `taxes`: (optional) A list of taxes to apply.
+    - `fel_status`: (optional) Text indicating if the invoice is "CON FEL" or "SIN FEL".
+    - `additional_notes`: (optional) Additional text that may contain "EXENTO" or "EXENTA".
+
+    Returns "done: <document name>" if successful, otherwise "failed".
+    Repeating the same call in the same turn returns the already created document.
+    """
+    try:
+        data = frappe.parse_json(purchase_data)
+
+        # Validar campos obligatorios
+        if not data.get("supplier"):
+            return "failed: Missing required field 'supplier'."
+        if not data.get("items"):
+            return "failed: Missing required field 'items'."
+
+        # Resolver proveedor y productos a sus nombres reales antes de insertar
+        errors = ground_references(data, "Supplier", "supplier")
+        if errors:
+            return f"failed: {' '.join(errors)}"
+
+        company = get_current_company()
+        data["company"] = company
+
+        with claim_creation("Purchase Invoice", data) as claim:
+            if claim.existing:
+                return f"done: {claim.existing}"
+
+            # Obtener la fecha actual
+            fecha_actual = date.today()
+
+            # Calcular el último día del mes actual
+            ultimo_dia_del_mes = calendar.monthrange(fecha_actual.year, fecha_actual.month)[1]
+            fecha_ultimo_dia = date(fecha_actual.year, fecha_actual.month, ultimo_dia_del_mes)
+
+            # Verificar si la factura es EXENTA
+            additional_notes = data.get("additional_notes", "").strip().upper()
+            is_exento = "EXENTO" in additional_notes or "EXENTA" in additional_notes
+
+            # Obtener la plantilla de impuestos predeterminada solo si no es EXENTO/EXENTA
+            plantilla = ""
+            if not is_exento:
+                plantilla = get_default_taxes_template("Purchase Taxes and Charges Template", company)
+            print(f"Plantilla de impuestos: {plantilla}")
+
+            # Establecer valores predeterminados
+            data.setdefault("posting_date", fecha_actual)
+            data.setdefault("due_date", fecha_ultimo_dia)
+            data.setdefault("taxes_and_charges", plantilla)
+            data.setdefault("update_stock", 1)
+
+            # Determinar el valor de custom_fel según el texto ingresado
+
+            items = []
+            for item in data["items"]:
+                if not item.get("item_code") or not item.get("qty") or not item.get("rate"):
+                    return "failed: Missing required fields in 'items' (item_code, qty, or rate)."
+                items.append({
+                    "item_code": item["item_code"],
+                    "qty": item["qty"],
+                    "rate": item["rate"]
+                })
+
+            # Validar impuestos (si se proporcionan y no es EXENTO/EXENTA)
+            taxes = []
+            if data.get("taxes") and not is_exento:
+                for tax in data["taxes"]:
+                    if not tax.get("account_head") or not tax.get("rate"):
+                        return "failed: Missing required fields in 'taxes' (account_head or rate)."
+                    taxes.append({
+                        "charge_type": "On Net Total",
+                        "account_head": tax["account_head"],
+                        "rate": tax["rate"]
+                    })
+            elif data.get("taxes_and_charges") and not is_exento:
+                # Si no se proporcionan impuestos directamente y no es exento, usar la plantilla
+                taxes = frappe.get_doc("Purchase Taxes and Charges Template", data["taxes_and_charges"]).taxes
+
+            # Crear documento de factura
+            invoice = frappe.get_doc({
+                "doctype": "Purchase Invoice",
+                "company": company,
+                "supplier": data["supplier"],
+                "items": items,
+                "due_date": data.get("due_date"),
+                "taxes_and_charges": data.get("taxes_and_charges"),
+                "taxes": taxes
+            })
+
+            invoice.insert()
+            frappe.db.commit()
+            claim.done(invoice.name)
+            return f"done: {invoice.name}"
+
+    except Exception as e:
+        frappe.log_error(f"Error creating Purchase Invoice: {str(e)}")
+        return f"failed: {str(e)}"
+
+
+@register_tool
+def create_suppliers(proveedor: str) -> str:
+    """
+    Crea un nuevo Proveedor en Frappe.
+
+    Si no se proporciona `supplier_group`, `supplier_type`, `default_currency` o `country`, 
+    se asignan valores por defecto.
+    También se crea una dirección asociada al Proveedor.
+
+    :param proveedor: JSON string con los datos del proveedor.
+    :return: Mensaje de éxito o error detallado.
+    """
+    try:
+        # Verifica si el proveedor es un JSON válido
+        if not proveedor:
+            raise ValueError("El parámetro 'proveedor' no puede estar vacío.")
+        
+        data = frappe.parse_json(proveedor)
+
+        # Validar que el campo 'supplier_name' esté presente
+        if "supplier_name" not in data:
+            raise ValueError("El campo 'supplier_name' es requerido para crear el proveedor.")
+
+        # Establecer valores por defecto si no se proporcionan
+        defaults = {
+            "supplier_group": "Distribuidor",
+            "supplier_type": "Company",
+            "default_currency": "GTQ",
+            "country": "Guatemala",
+            "address_line1": "Dirección no especificada",
+            "city": "Ciudad de Guatemala",
+            "phone": "00000000"
+        }
+        for key, value in defaults.items():
+            data.setdefault(key, value)
+
+        # Crear el proveedor
+        new_supplier = frappe.get_doc({"doctype": "Supplier", **data})
+        new_supplier.insert()
+
+        # Crear la dirección asociada al proveedor
+        address_data = {
+            "doctype": "Address",
+            "address_line1": data["address_line1"],
+            "city": data["city"],
+            "phone": data["phone"],
+            "links": [
+                {
+                    "link_doctype": "Supplier",
+                    "link_name": new_supplier.name
+                }
+            ]
+        }
+
+        new_address = frappe.get_doc(address_data)
+        new_address.insert()
+
+        return f"Proveedor '{data['supplier_name']}' creado exitosamente."
+    
+    except frappe.DuplicateEntryError as e:
+        frappe.log_error(f"Duplicate Entry Error: {str(e)}", "create_supplier")
+        return f"Error: El proveedor '{data.get('supplier_name', '')}' ya existe."
+    except frappe.ValidationError as e:
+        frappe.log_error(f"Validation Error: {str(e)}", "create_supplier")
+        return f"Error de validación: {str(e)}"
+    except ValueError as e:
+        frappe.log_error(f"Value Error: {str(e)}", "create_supplier")
+        return f"Error de valor: {str(e)}"
+    except Exception as e:
+        frappe.log_error(f"Unexpected Error: {str(e)}", "create_supplier")
+        return f"Error inesperado: {str(e)}"
+
+@register_tool
+def get_item_stats(item: Optional[str] = None) -> Dict:
+    """
+    Obtiene estadísticas de un producto específico.
+
+    Args:
+        item (str): Código del producto.
+
+    Returns:
+        dict: Un diccionario con las siguientes claves:
+            - last_purchase: Última compra registrada.
+            - item_price: Precio del producto.
+            - rotation: Rotación del producto.
+            - customer_purchases: Cliente que más ha comprado el producto.
+            - stock: Existencias en los almacenes con más cantidad.
+            - stock_report: (solo si hay más almacenes) total y enlace `download` al
+              archivo con todos; compártelo en lugar de enumerar cada almacén.
+    """
+    if not item:
+        return {"error": "El código del producto no puede ser None"}
+
+    prefetched = get_prefetched("get_item_stats", item)
+    if prefetched is not None:
+        return prefetched
+
+    try:
+        stats = {}
+
+        company = get_current_company()
+        scope = get_permission_scope()
+        scope.check("Sales Invoice", company=company)
+
+        # 1. Última compra
+        ultima_compra = get_last_sale(company, scope)
+        logging.debug(f"Última compra registrada: {ultima_compra}")
+        stats["last_purchase"] = ultima_compra if ultima_compra else {"error": "No se encontraron compras"}
+
+        # 2-4. Precio, rotación y mejor cliente: una sola lectura de las analíticas
+        # precalculadas; si el producto aún no se ha procesado, o el usuario tiene
+        # restricciones de empresa o territorio, se calculan al vuelo con sus permisos
+        analytics = None if scope.restricted else get_item_analytics(company, item)
+        analytics = analytics or compute_item_analytics(company, [item], scope)[0]
+
+        costo_producto = [
+            {
+                "Código del Producto": item,
+                "Lista de Precios": price["price_list"],
+                "Precio": price["price_list_rate"],
+                "Moneda": price["currency"],
+            }
+            for price in analytics["price_list_rates"]
+        ]
+        logging.debug(f"Precio del producto: {costo_producto}")
+        stats["item_price"] = costo_producto if costo_producto else {"error": "No se encontraron precios del producto"}
+
+        rotacion_producto = []
+        if analytics["sales_count"]:
+            rotacion_producto = [{
+                "Código del Producto": item,
+                "Cantidad de Ventas": analytics["sales_count"],
+                "Total Vendido": analytics["total_qty"],
+                "Promedio por Venta": analytics["avg_qty"],
+                "Primera Venta": analytics["first_sale_date"],
+                "Última Venta": analytics["last_sale_date"],
+                "Días en Rango": date_diff(analytics["last_sale_date"], analytics["first_sale_date"]),
+                "Rotación Diaria": analytics["daily_rotation"],
+            }]
+        logging.debug(f"Rotación del producto: {rotacion_producto}")
+        stats["rotation"] = rotacion_producto if rotacion_producto else {"error": "No se encontraron transacciones del producto"}
+
+        cliente = []
+        if analytics["top_customer"]:
+            cliente = [{
+                "Código del Producto": item,
+                "Cliente": analytics["top_customer"],
+                "Total Comprado": analytics["top_customer_qty"],
+            }]
+        logging.debug(f"Cliente que más ha comprado el producto: {cliente}")
+        stats["customer_purchases"] = cliente if cliente else {"error": "No se encontraron productos más vendidos"}
+
+        scope.check("Bin")
+        stock = get_item_stock(item, company, scope, limit=INLINE_ROWS)
+        logging.debug(f"Stock del producto: {stock}")
+        stats["stock"] = stock if stock else {"error": "No se encontraron datos relacionados al producto"}
+
+        # Con muchos almacenes solo van los de mayor existencia; el resto, en un archivo
+        if len(stock) == INLINE_ROWS:
+            total_almacenes = count_item_stock(item, company, scope)
+            if total_almacenes > len(stock):
+                query, values = get_item_stock_query(item, company, scope)
+                export = get_or_export(f"existencias-{frappe.scrub(item)}", f"{company}:{item}:{scope.key}", ITEM_STOCK_HEADERS, query, values)
+                if export:
+                    stats["stock_report"] = summarize_export(export, total_almacenes, len(stock))
+
+        return stats
+
+    except Exception as e:
+        logging.error(f"Error en get_item_stats: {str(e)}")
+        return {"error": str(e)}
+@register_tool
+def get_inventory_rotation_report(params: str) -> Dict:
+    """
+    Reporte de rotación de inventario de todo el catálogo de la empresa en un periodo.
+    Úsalo para preguntas sobre varios productos a la vez, por ejemplo
+    "¿qué productos tienen la rotación más baja este trimestre?".
+    No llames get_item_stats producto por producto para esto.
+
+    Recibe un JSON (todas las claves son opcionales):
+        - period: "mes", "trimestre" (predeterminado) o "año", contados hasta hoy.
+        - from_date / to_date: rango explícito en formato "YYYY-MM-DD".
+        - order: "lowest" (predeterminado, rotación más baja primero) o "highest".
+        - limit: cantidad de productos a devolver (predeterminado 10, máximo 100).
+        - abc: "A", "B" o "C" para filtrar por clasificación ABC.
+
+    Devuelve un diccionario con el resumen ABC y, por producto: cantidad vendida,
+    valor vendido, existencias, rotación diaria, días de inventario y clase ABC.
+    """
+    try:
+        # El agente a veces manda solo el periodo en texto plano
+        try:
+            data = frappe.parse_json(params or "{}")
+        except ValueError:
+            data = {"period": params.strip()}
+        if not isinstance(data, dict):
+            data = {"period": str(data)}
+
+        # Otra empresa solo si el usuario la pide explícitamente y tiene permiso
+        company = resolve_company(data["company"]) if data.get("company") else get_current_company()
+
+        scope = get_permission_scope()
+        scope.check("Sales Invoice", company=company)
+        scope.check("Bin")
+
+        # NumPy solo se carga cuando se pide el reporte
+        from doppio_bot.inventory_analytics import get_rotation_report
+
+        return get_rotation_report(
+            company,
+            period=data.get("period"),
+            from_date=data.get("from_date"),
+            to_date=data.get("to_date"),
+            order=data.get("order", "lowest"),
+            limit=min(int(data.get("limit") or 10), 100),
+            abc=data.get("abc"),
+            scope=scope,
+        )
+
+    except Exception as e:
+        logging.error(f"Error en get_inventory_rotation_report: {str(e)}")
+        return {"error": str(e)}
+
+
+@register_tool
+def preview_import_file(file_url: str) -> Dict:
+    """
+    Primer paso para importar un archivo CSV o Excel adjunto en el chat
+    (el mensaje trae "Archivo adjunto: /private/files/...").
+
+    Recibe la URL del archivo y devuelve sus encabezados, algunas filas de ejemplo
+    y los campos que acepta cada tipo de importación ("Item Price" para listas de
+    precios, "Item" para productos, "Purchase Invoice" para facturas de compra).
+    Con esto decide el mapeo de columnas y llama import_file una sola vez.
+    Nunca crees los registros del archivo uno por uno con otras herramientas.
+    """
+    try:
+        return preview_file(file_url)
+    except Exception as e:
+        logging.error(f"Error en preview_import_file: {str(e)}")
+        return {"error": str(e)}
+
+
+@register_tool
+def import_file(params: str) -> str:
+    """
+    Importa en segundo plano todas las filas de un archivo adjunto.
+
+    Recibe un JSON con:
+        - file_url: URL del archivo (la misma de preview_import_file).
+        - target: "Item Price", "Item" o "Purchase Invoice".
+        - column_map: {campo: encabezado del archivo}, p. ej.
+          {"item_code": "Código", "price_list_rate": "Precio"}.
+
+    Devuelve el id de la importación. El avance se muestra en el chat y al final
+    se adjunta un CSV con las filas que no se pudieron importar.
+    Si te dan solo un id de importación, devuelve su estado actual.
+    """
+    try:
+        try:
+            data = frappe.parse_json(params)
+        except ValueError:
+            data = str(params)
+        if isinstance(data, str) or not data.get("file_url"):
+            # Consulta del estado de una importación ya iniciada
+            import_id = data if isinstance(data, str) else data.get("import_id")
+            return format_status(get_import_status(str(import_id or "").strip()))
+
+        company = get_current_company()
+        turn = get_current_turn() or {}
+        import_id = start_import(
+            data["file_url"],
+            data.get("target"),
+            data.get("column_map") or {},
+            company,
+            session_id=turn.get("session_id"),
+        )
+        return f"Importación {import_id} en curso. El avance se mostrará en el chat."
+    except Exception as e:
+        logging.error(f"Error en import_file: {str(e)}")
+        return f"failed: {str(e)}"
+
+
+@register_tool
+def search_help_articles(question: str) -> Dict:
+    """
+    Busca en la documentación del sistema (artículos de ayuda, procedimientos de
+    la empresa y descripciones de los documentos de ERPNext).
+    Úsala para preguntas de "ayuda", "cómo hago..." o "qué es..." sobre el sistema,
+    antes de responder de memoria.
+
+    Recibe la pregunta en texto plano. Devuelve los fragmentos más relevantes con
+    su título y enlace; responde en pocas líneas a partir de ellos y cita el enlace.
+    Si no hay resultados, dilo en lugar de inventar pasos.
+    """
+    try:
+        # NumPy solo se carga cuando se consulta la ayuda
+        from doppio_bot.help_index import search_help
+
+        results = search_help(question.strip().strip("'\"`"))
+        return {"results": results} if results else {"error": "No se encontró documentación sobre esto."}
+    except Exception as e:
+        logging.error(f"Error en search_help_articles: {str(e)}")
+        return {"error": str(e)}
+
+
+@register_tool
+def get_fel_certification_status(sales_invoice: str) -> Dict:
+    """
+    Estado de la certificación FEL en segundo plano de una factura creada por el bot.
+
+    Recibe el nombre de la factura (p. ej. "ACC-SINV-2026-00012"). Devuelve el estado
+    (Queued, Processing, Certified o Failed), los intentos, el próximo reintento y el
+    último error. Si el usuario pide reintentar una certificación fallida, envía
+    {"sales_invoice": "<factura>", "retry": true}.
+    """
+    try:
+        try:
+            data = frappe.parse_json(sales_invoice)
+        except ValueError:
+            data = sales_invoice
+        if not isinstance(data, dict):
+            data = {"sales_invoice": str(data)}
+        invoice_name = str(data.get("sales_invoice") or "").strip().strip("'\"`")
+
+        frappe.has_permission("Sales Invoice", "read", invoice_name, throw=True)
+        if data.get("retry") and retry_failed(invoice_name):
+            frappe.db.commit()
+        status = get_fel_status(invoice_name)
+        return status or {"error": f"La factura {invoice_name} no está en la cola de certificación FEL."}
+    except Exception as e:
+        logging.error(f"Error en get_fel_certification_status: {str(e)}")
+        return {"error": str(e)}
+
+
+@register_tool
+def draft_set_customer(customer: str) -> str:
+    """
+    Fija el cliente del borrador de pedido de esta conversación.
+
+    Úsala junto con draft_add_line, draft_remove_line y commit_draft cuando el
+    usuario arma una orden o factura en varios mensajes: cada cambio envía solo
+    la parte que cambia, nunca el pedido completo.
+
+    Recibe el nombre del cliente en texto plano, o un JSON con `customer` y
+    opcionalmente delivery_date, due_date, center_cost, fel_status,
+    additional_notes, id_identificacion, id_receptor_.
+    Devuelve el borrador actualizado.
+    """
+    try:
+        try:
+            data = frappe.parse_json(customer)
+        except ValueError:
+            data = customer
+        if not isinstance(data, dict):
+            data = {"customer": str(data).strip().strip("'\"`")}
+        return format_draft(set_customer(data.get("customer") or "", data))
+    except DraftError as e:
+        return f"failed: {str(e)}"
+    except Exception as e:
+        logging.error(f"Error en draft_set_customer: {str(e)}")
+        return f"failed: {str(e)}"
+
+
+@register_tool
+def draft_add_line(line: str) -> str:
+    """
+    Agrega un producto al borrador de pedido, o suma la cantidad si ya está
+    ("agrega 5 más de X" es una línea con qty 5).
+
+    Recibe "<item_code> <qty>" en texto plano (p. ej. "ITEM-001 5"), o un JSON con
+    item_code, qty y opcionalmente rate. Sin rate se usa el precio de lista del cliente.
+    Devuelve el borrador actualizado.
+    """
+    try:
+        try:
+            data = frappe.parse_json(line)
+        except ValueError:
+            data = line
+        if not isinstance(data, dict):
+            item_code, _, qty = str(data).strip().strip("'\"`").rpartition(" ")
+            data = {"item_code": item_code, "qty": qty}
+        if not data.get("item_code") or not data.get("qty"):
+            return "failed: Se requiere item_code y qty."
+        return format_draft(add_line(data["item_code"], data["qty"], data.get("rate")))
+    except DraftError as e:
+        return f"failed: {str(e)}"
+    except Exception as e:
+        logging.error(f"Error en draft_add_line: {str(e)}")
+        return f"failed: {str(e)}"
+
+
+@register_tool
+def draft_remove_line(line: str) -> str:
+    """
+    Quita una línea del borrador de pedido.
+
+    Recibe el número de línea (p. ej. "2") o el código del producto; "all" vacía el
+    borrador. Para quitar solo algunas unidades, envía {"line": "2", "qty": 3}.
+    Devuelve el borrador actualizado.
+    """
+    try:
+        try:
+            data = frappe.parse_json(line)
+        except ValueError:
+            data = line
+        if not isinstance(data, dict):
+            data = {"line": data}
+        return format_draft(remove_line(str(data.get("line") or "").strip().strip("'\"`"), data.get("qty")))
+    except DraftError as e:
+        return f"failed: {str(e)}"
+    except Exception as e:
+        logging.error(f"Error en draft_remove_line: {str(e)}")
+        return f"failed: {str(e)}"
+
+
+@register_tool
+def commit_draft(document: str) -> str:
+    """
+    Crea el documento a partir del borrador de pedido de esta conversación y lo vacía.
+
+    Recibe "order" para una orden de venta o "invoice" para una factura de venta.
+    Devuelve lo mismo que create_sales_order / create_sales_invoice.
+    Confirmar dos veces el mismo borrador devuelve el documento creado la primera vez.
+    """
+    try:
+        document = document.strip().strip("'\"`").lower()
+        if document not in ("order", "invoice"):
+            return "failed: Indica \"order\" o \"invoice\"."
+
+        draft = get_draft()
+        if draft.get("committed"):
+            return draft["committed"]
+
+        data = get_document_data(draft)
+        if document == "order":
+            result = create_sales_order(frappe.as_json(data))
+        else:
+            result = create_sales_invoice(frappe.as_json(data))
+
+        if result.startswith("done"):
+            mark_draft_committed(result)
+        return result
+    except DraftError as e:
+        return f"failed: {str(e)}"
+    except Exception as e:
+        logging.error(f"Error en commit_draft: {str(e)}")
+        return f"failed: {str(e)}"
@@ -0,0 +1,214 @@
+"""
+Presupuesto de tiempo y cancelación de los turnos del chat.
+
+Cada turno tiene un plazo total (`doppiobot_turn_timeout`) y las herramientas
+de consulta uno propio (TOOL_TIMEOUTS o `doppiobot_tool_timeouts`), que se
+aplica a sus consultas SQL como límite de ejecución de la sesión. Las que
+crean o modifican documentos no se limitan, para no cortar una escritura. El usuario puede cancelar
+el turno desde ChatView: la señal queda en Redis y el agente se detiene antes
+o después de la siguiente herramienta. Después de una herramienta de
+WRITE_TOOLS no se revisa: el documento ya quedó guardado y el agente debe
+informar el resultado.
+"""
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from contextlib import contextmanager
+
+import frappe
+
+from doppio_bot.chat_context import get_current_turn
+
+
+CANCEL_KEY = "doppiobot:cancel:{user}:{session_id}"
+CANCEL_TTL = 60 * 10
+
+DEFAULT_TURN_TIMEOUT = 120
+# Segundos por consulta SQL de las herramientas de solo lectura
+TOOL_TIMEOUTS = {
+    "get_info_customer": 15,
+    "get_item_stats": 30,
+    "get_sales_stats": 45,
+    "get_inventory_rotation_report": 60,
+    "preview_sales_invoice": 30,
+}
+# Herramientas que guardan antes de devolver su resultado
+WRITE_TOOLS = {
+    "create_sales_order",
+    "create_sales_invoice",
+    "confirm_sales_invoice",
+    "create_customer",
+    "update_customers",
+    "delete_customers",
+    "create_item",
+    "create_purchase_invoice",
+    "create_suppliers",
+    "import_file",
+    "draft_set_customer",
+    "draft_add_line",
+    "draft_remove_line",
+    "commit_draft",
+}
+# Llamadas a servicios externos (SAT)
+REMOTE_TIMEOUT = 10
+REMOTE_WORKERS = 4
+# Margen mínimo que se le da a una herramienta aunque quede poco del turno
+MIN_TOOL_TIMEOUT = 1
+
+# {sitio: (variable, unidades por segundo)}
+_timeout_variables = {}
+_remote_executor = None
+
+
+class TurnInterrupted(frappe.ValidationError):
+    pass
+
+
+class TurnCancelled(TurnInterrupted):
+    pass
+
+
+class TurnTimedOut(TurnInterrupted):
+    pass
+
+
+def get_turn_timeout() -> int:
+    return frappe.conf.get("doppiobot_turn_timeout") or DEFAULT_TURN_TIMEOUT
+
+
+def get_tool_timeout(tool_name: str):
+    return (frappe.conf.get("doppiobot_tool_timeouts") or {}).get(tool_name) or TOOL_TIMEOUTS.get(tool_name)
+
+
+def get_cancel_key(session_id: str) -> str:
+    return frappe.cache().make_key(CANCEL_KEY.format(user=frappe.session.user, session_id=session_id))
+
+
+def start_turn_budget(turn: dict) -> dict:
+    """
+    Fija el plazo del turno (hora absoluta, para que los hilos de prefetch
+    lo compartan) y descarta una cancelación anterior de la sesión.
+    """
+    turn["deadline"] = time.time() + get_turn_timeout()
+    frappe.cache().delete(get_cancel_key(turn["session_id"]))
+    return turn
+
+
+def request_cancel(session_id: str):
+    frappe.cache().set(get_cancel_key(session_id), 1, ex=CANCEL_TTL)
+
+
+def get_remaining_time():
+    """
+    Segundos que le quedan al turno en curso, o None fuera de un turno.
+    """
+    deadline = (get_current_turn() or {}).get("deadline")
+    return None if deadline is None else deadline - time.time()
+
+
+def check_turn():
+    """
+    Lanza TurnCancelled o TurnTimedOut si el turno en curso ya no debe continuar.
+    """
+    turn = get_current_turn()
+    if not turn or "deadline" not in turn:
+        return
+    if frappe.cache().get(get_cancel_key(turn["session_id"])):
+        raise TurnCancelled("Se canceló la consulta a pedido del usuario.")
+    if time.time() > turn["deadline"]:
+        raise TurnTimedOut("La consulta tardó demasiado y se detuvo. Intenta con una pregunta más acotada.")
+
+
+def get_timeout_variable():
+    """
+    (variable de sesión, unidades por segundo) del límite de ejecución del servidor.
+    """
+    site = frappe.local.site
+    if site not in _timeout_variables:
+        if frappe.db.db_type == "postgres":
+            _timeout_variables[site] = ("statement_timeout", 1000)
+        elif "mariadb" in frappe.db.sql("SELECT VERSION()")[0][0].lower():
+            _timeout_variables[site] = ("max_statement_time", 1)
+        else:
+            _timeout_variables[site] = ("max_execution_time", 1000)
+    return _timeout_variables[site]
+
+
+@contextmanager
+def statement_timeout(seconds: float):
+    """
+    Límite de ejecución de cada consulta SQL dentro del bloque: max_statement_time
+    en MariaDB, max_execution_time (solo SELECT) en MySQL, statement_timeout en Postgres.
+    """
+    variable, unit = get_timeout_variable()
+    value = int(seconds * unit) if unit > 1 else round(seconds, 3)
+
+    previous = frappe.db.sql(f"SHOW {variable}" if frappe.db.db_type == "postgres" else f"SELECT @@SESSION.{variable}")[0][0]
+    frappe.db.sql(f"SET SESSION {variable} = %s", (value,))
+    try:
+        yield
+    finally:
+        frappe.db.sql(f"SET SESSION {variable} = %s", (previous,))
+
+
+def get_remote_executor():
+    global _remote_executor
+    if _remote_executor is None:
+        _remote_executor = ThreadPoolExecutor(max_workers=REMOTE_WORKERS, thread_name_prefix="doppiobot-remote")
+    return _remote_executor
+
+
+def run_remote(site, sites_path, user, method, args):
+    frappe.init(site=site, sites_path=sites_path)
+    try:
+        frappe.connect()
+        frappe.set_user(user)
+        return frappe.get_attr(method)(*args)
+    finally:
+        frappe.destroy()
+
+
+def call_remote(method: str, *args, seconds=REMOTE_TIMEOUT):
+    """
+    Llama a `method` (ruta de un servicio externo que no recibe timeout propio)
+    en un hilo con su propia conexión y espera como máximo `seconds`, sin pasar
+    del plazo del turno. Si no responde a tiempo lanza TurnTimedOut; la llamada
+    sigue en su hilo hasta terminar, pero el turno ya no la espera.
+    """
+    remaining = get_remaining_time()
+    if remaining is not None:
+        seconds = max(min(seconds, remaining), MIN_TOOL_TIMEOUT)
+
+    future = get_remote_executor().submit(
+        run_remote, frappe.local.site, frappe.local.sites_path, frappe.session.user, method, args
+    )
+    try:
+        return future.result(timeout=seconds)
+    except TimeoutError:
+        raise TurnTimedOut(f"El servicio externo no respondió en {seconds:g} segundos.")
+
+
+def guard_tool(func):
+    """
+    Envuelve una herramienta del agente: revisa cancelación y plazo antes y
+    (salvo las de WRITE_TOOLS) después de ejecutarla y, si tiene presupuesto,
+    limita sus consultas SQL.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        check_turn()
+        budget = get_tool_timeout(func.__name__)
+        if not budget:
+            result = func(*args, **kwargs)
+        else:
+            remaining = get_remaining_time()
+            if remaining is not None:
+                budget = max(min(budget, remaining), MIN_TOOL_TIMEOUT)
+            with statement_timeout(budget):
+                result = func(*args, **kwargs)
+        # Interrumpir aquí diría "cancelado" cuando el documento ya existe
+        if func.__name__ not in WRITE_TOOLS:
+            check_turn()
+        return result
+
+    return wrapper
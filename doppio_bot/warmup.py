@@ -0,0 +1,148 @@
+"""
+Precarga lo que el primer turno del chat pagaría en cada worker: imports de
+langchain, perfiles de langdetect, cliente del LLM, herramientas del agente,
+configuración e impuestos de cada empresa, índice de entidades e índice de ayuda.
+
+Se lanza en un hilo con la primera petición de cada proceso web y sitio
+(before_request), y a mano con:
+
+    bench --site <sitio> doppiobot-warm-up [--local-model]
+"""
+import importlib
+import threading
+import time
+
+import frappe
+
+
+# No se engancha a before_job: RQ hace fork de un proceso por job, así que cada
+# job empezaría un precalentamiento que muere con él.
+_lock = threading.Lock()
+# Sitios ya precalentados en este proceso
+_warmed_sites = set()
+
+
+def warm_imports():
+    importlib.import_module("doppio_bot.agent")
+
+
+def warm_langdetect():
+    # La primera detección carga los perfiles de todos los idiomas
+    from langdetect import detect
+
+    detect("hola, ¿cuál es la rotación de este producto?")
+
+
+def warm_llm_client():
+    from langchain.llms import OpenAI
+
+    from doppio_bot.api import get_model_from_settings
+
+    api_key = frappe.conf.get("openai_api_key")
+    if api_key:
+        OpenAI(model_name=get_model_from_settings(), temperature=0, openai_api_key=api_key)
+
+
+def warm_agent_tools():
+    from doppio_bot.agent import get_agent_tools
+
+    get_agent_tools()
+
+
+def warm_company_caches():
+    from doppio_bot.companies import CONFIG_DOCTYPE, get_company_config, get_default_taxes_template
+
+    for company in frappe.get_all(CONFIG_DOCTYPE, pluck="name"):
+        get_company_config(company)
+        get_default_taxes_template("Sales Taxes and Charges Template", company)
+        get_default_taxes_template("Purchase Taxes and Charges Template", company)
+
+
+def warm_entity_index():
+    from doppio_bot.entity_index import build_entity_indexes
+
+    build_entity_indexes()
+
+
+def warm_help_index():
+    from doppio_bot.help_index import get_embedder, load_index
+
+    get_embedder()
+    load_index()
+
+
+def warm_local_model():
+    from doppio_bot.local_model import get_local_model
+
+    get_local_model()
+
+
+def get_steps(local_model=False):
+    steps = [
+        ("imports", warm_imports),
+        ("langdetect", warm_langdetect),
+        ("llm_client", warm_llm_client),
+        ("agent_tools", warm_agent_tools),
+        ("company_caches", warm_company_caches),
+        ("entity_index", warm_entity_index),
+        ("help_index", warm_help_index),
+    ]
+    if local_model:
+        steps.append(("local_model", warm_local_model))
+    return steps
+
+
+def warm_up(local_model=False) -> dict:
+    """
+    Ejecuta cada paso y devuelve su duración en milisegundos. Un paso que falla
+    se registra y no detiene a los demás.
+    """
+    started = time.perf_counter()
+    report = {"site": frappe.local.site, "steps": {}, "errors": {}}
+
+    for name, step in get_steps(local_model):
+        step_started = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            report["errors"][name] = str(e)
+        report["steps"][name] = round((time.perf_counter() - step_started) * 1000, 1)
+
+    report["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    frappe.logger("doppio_bot").info(f"Warm-up: {report}")
+    return report
+
+
+def run_warm_up(site, sites_path, local_model):
+    frappe.init(site=site, sites_path=sites_path)
+    try:
+        frappe.connect()
+        warm_up(local_model)
+    finally:
+        frappe.destroy()
+
+
+def warm_up_in_background(*args, **kwargs):
+    """
+    before_request: la primera vez por proceso y sitio lanza el
+    precalentamiento en un hilo, sin retrasar la petición que lo dispara.
+    `doppiobot_warm_up: 0` en site_config lo desactiva.
+    """
+    site = getattr(frappe.local, "site", None)
+    if not site or site in _warmed_sites:
+        return
+
+    with _lock:
+        if site in _warmed_sites:
+            return
+        _warmed_sites.add(site)
+
+    if frappe.conf.get("doppiobot_warm_up", 1) in (0, "0", False):
+        return
+
+    threading.Thread(
+        target=run_warm_up,
+        args=(site, frappe.local.sites_path, bool(frappe.conf.get("doppiobot_warm_up_local_model"))),
+        name="doppiobot-warm-up",
+        daemon=True,
+    ).start()